@@ -54,7 +54,7 @@ starttime = time.time()
 
 from . import rpcserver
 from lib.cmd import process
-from lib import util, cache
+from lib import util, cache, remote_info
 
 stopped = threading.Event()
 
@@ -71,6 +71,8 @@ def start():
 		print >>sys.stderr, "Running without tasks"
 	cache.init()# this does not depend on anything (except the scheduler variable being initialized), and nothing depends on this. No need to hurry this.
 	dump.init()
+	remote_info.subscribe_changes(settings.Config.TOMATO_MODULE_BACKEND_CORE)
+	remote_info.subscribe_changes(settings.Config.TOMATO_MODULE_BACKEND_USERS)
 
 def reload_(*args):
 	print >>sys.stderr, "Reloading..."
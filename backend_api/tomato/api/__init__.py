@@ -25,7 +25,7 @@ from capabilities import capabilities, capabilities_connection, capabilities_ele
 from connections import connection_create, connection_info, connection_modify, connection_remove,\
 	connection_action, connection_usage
 
-from debug import debug_stats, debug_services_reachable, debug_run_internal_api_call, debug_run_host_api_call,\
+from debug import debug_stats, debug_scheduler_stats, debug_services_reachable, debug_run_internal_api_call, debug_run_host_api_call,\
 	debug_execute_task, debug_debug_internal_api_call, ping, debug_throw_error
 
 from dumpmanager import errordump_info, errordump_list, errordumps_force_refresh, errorgroup_favorite,\
@@ -1,5 +1,6 @@
 from ..lib.error import UserError
 from .. import scheduler
+from ..lib import cache
 import traceback, sys
 from api_helpers import getCurrentUserInfo
 from ..lib.debug import run
@@ -17,12 +18,21 @@ def debug_stats(tomato_module=Config.TOMATO_MODULE_BACKEND_API):
 	if is_self(tomato_module):
 		return {
 			"scheduler": scheduler.info(),
+			"caches": cache.info(),
 			"threads": map(traceback.extract_stack, sys._current_frames().values())
 		}
 	else:
 		api = get_tomato_inner_proxy(tomato_module)
 		return api.debug_stats()
 
+def debug_scheduler_stats(tomato_module=Config.TOMATO_MODULE_BACKEND_API):
+	getCurrentUserInfo().check_may_view_debugging_info()
+	if is_self(tomato_module):
+		return scheduler.stats()
+	else:
+		api = get_tomato_inner_proxy(tomato_module)
+		return api.debug_scheduler_stats()
+
 def debug_services_overview():
 	res = {}
 	for module in Config.TOMATO_BACKEND_MODULES:
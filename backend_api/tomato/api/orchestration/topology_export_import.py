@@ -2,6 +2,7 @@ from ..topology import topology_create, topology_modify, topology_remove, topolo
 from ..elements import element_create, element_modify
 from ..connections import connection_create, connection_modify
 from ...lib.error import UserError
+from ...lib.remote_info import get_element_info_list, get_connection_info_list
 
 def topology_import(data):
 	# this function may change the values of data.
@@ -88,11 +89,17 @@ def _topology_import_v4(top):
 			for el in elements:
 				errors.append(("element", el['id'], 'parent', el['parent'], "parent cannot be created."))
 
+		# step 3: create connections, the permission checks need the info of both elements
+		get_element_info_list(elementIds.values())
 		for con in top["connections"]:
 			el1 = elementIds.get(con["elements"][0])
 			el2 = elementIds.get(con["elements"][1])
-			conId = connection_create(el1, el2)['id']
-			connectionIds[con['id']] = conId
+			connectionIds[con['id']] = connection_create(el1, el2)['id']
+
+		# step 4: apply connection attributes
+		get_connection_info_list(connectionIds.values())
+		for con in top["connections"]:
+			conId = connectionIds[con['id']]
 			attributes = {key: value for key, value in con.iteritems() if key != "elements" and key != "id" and key != "type"}
 			try:
 				connection_modify(conId, attributes)
@@ -0,0 +1 @@
+../../../shared/lib/changes.py
\ No newline at end of file
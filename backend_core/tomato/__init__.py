@@ -47,7 +47,7 @@ starttime = time.time()
 
 from . import db, host, rpcserver #@UnresolvedImport
 from lib.cmd import process #@UnresolvedImport
-from lib import util, cache, exceptionhandling #@UnresolvedImport
+from lib import util, cache, changes, remote_info, exceptionhandling #@UnresolvedImport
 from lib.error import Error, InternalError
 
 def handleError():
@@ -68,6 +68,9 @@ def start():
 		db.migrate()
 	else:
 		print >>sys.stderr, "Skipping migrations"
+	changes_settings = settings.settings.get_change_events_settings()
+	if changes_settings[settings.Config.CHANGE_EVENTS_ENABLED]:
+		changes.init(changes_settings[settings.Config.CHANGE_EVENTS_BUFFER_SIZE])
 	global starttime
 	template_dir = settings.settings.get_template_dir()
 	if not os.path.exists(template_dir):
@@ -79,6 +82,7 @@ def start():
 	else:
 		print >>sys.stderr, "Running without tasks"
 	dump.init()
+	remote_info.subscribe_changes(settings.Config.TOMATO_MODULE_BACKEND_USERS)
 	cache.init()# this does not depend on anything (except the scheduler variable being initialized), and nothing depends on this. No need to hurry this.
 	
 def reload_(*args):
@@ -1,4 +1,5 @@
-from .. import scheduler
+from .. import scheduler, host, topology
+from ..lib import cache
 from ..lib.debug import run
 from ..lib.error import InternalError
 from ..lib.exceptionhandling import wrap_and_handle_current_exception
@@ -12,12 +13,23 @@ def debug_stats():
 	stats = {
 		"db": database_obj.command("dbstats"),
 		"scheduler": scheduler.info(),
+		"caches": cache.info(),
+		"host_sync": dict(host.syncPool.info(), skipped=host.skippedSyncs, limit=host.maintenanceLimit.info()),
+		"host_placement": host.placementIndex.info(),
+		"topology_actions": topology.actionPool.info(),
 		"threads": map(traceback.extract_stack, sys._current_frames().values())
 	}
 	stats["db"]["collections"] = {name: database_obj.command("collstats", name) for name in
 	                              database_obj.collection_names()}
 	return stats
 
+def debug_scheduler_stats():
+	"""
+	statistics of the task scheduler: per task function histograms of start lateness, duration and CPU time,
+	and worker saturation per minute.
+	"""
+	return scheduler.stats()
+
 def debug_debug_internal_api_call(_command, args=None, kwargs=None, profile=True):
 	from .. import api
 	func = getattr(api, _command)
@@ -18,7 +18,8 @@ from ..lib.constants import StateName
 from ..lib import get_public_ip_address
 from ..lib.cache import cached
 from ..lib.service import get_backend_users_proxy
-from ..lib.settings import settings
+from ..lib.settings import settings, Config
+from ..lib import changes
 from ..lib.userflags import Flags
 
 def link_statistics(siteA, siteB):
@@ -43,6 +44,14 @@ def notifyAdmins(subject, text, global_contact, issue, user_orga, user_name):
 	api.broadcast_message(subject, text, fromUser=user_name,
 											  organization_filter=target_organization, flag_filter=target_flag)
 
+def change_events(since=0, epoch=None, timeout=0):
+	"""
+	get the changes of objects of this service, see lib/changes.py.
+	Waits up to timeout seconds if there are no changes after since.
+	"""
+	timeout = min(timeout, settings.get_change_events_settings()[Config.CHANGE_EVENTS_POLL_TIMEOUT])
+	return changes.poll(since, epoch, timeout)
+
 @cached(timeout=3600)
 def statistics():
 	stats = {}
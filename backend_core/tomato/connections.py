@@ -76,6 +76,7 @@ class Connection(LockedStatefulEntity, BaseDocument):
 	connectionElementTo = ReferenceField(HostElement, db_field='connection_element_to', reverse_delete_rule=NULLIFY)
 	clientData = DictField(db_field='client_data')
 	directData = DictField(db_field='direct_data')
+	CHANGE_TYPE = "connection"
 	meta = {
 		'allow_inheritance': True,
 		'indexes': [
@@ -391,7 +392,7 @@ class Connection(LockedStatefulEntity, BaseDocument):
 				stopping_list.remove(self)
 
 	@classmethod
-	@cached(timeout=3600, maxSize=None)
+	@cached(timeout=3600, maxSize=None, maxBytes=16*1024*1024)
 	def getCapabilities(cls, type_, host_):
 		caps = cls.capabilities()
 		if not host_ and (cls.DIRECT_ACTIONS or cls.DIRECT_ATTRS):
@@ -49,6 +49,7 @@ class Element(LockedStatefulEntity, BaseDocument):
 	clientData = DictField(db_field='client_data')
 	directData = DictField(db_field='direct_data')
 	
+	CHANGE_TYPE = "element"
 	meta = {
 		'allow_inheritance': True,
 		'indexes': [
@@ -300,7 +301,7 @@ class Element(LockedStatefulEntity, BaseDocument):
 		return host_
 
 	@classmethod
-	@cached(timeout=3600, maxSize=None)
+	@cached(timeout=3600, maxSize=None, maxBytes=16*1024*1024)
 	def getCapabilities(cls, host_):
 		caps = cls.capabilities()
 		host_ = cls.selectCapabilitiesHost(host_)
@@ -19,6 +19,7 @@ from ..db import *
 from ..generic import *
 from ..elements import Element
 from ..host.element import HostElement
+from ..host import placement
 from ..host.site import Site
 from ..resources.profile import Profile
 from ..resources.template import Template
@@ -167,9 +168,17 @@ class VMElement(Element):
 	def action_change_template(self, template):
 		self.modify_template(template)
 
+	def getPlacementSiteId(self, topologySiteId):
+		"""
+		:return: id of the site that the host of this element must be in, without loading the site
+		"""
+		return self.getFieldId("site") or topologySiteId
+
 	def action_prepare(self):
-		hPref, sPref = self.getLocationPrefs()
-		_host = host.select(site=self.site if self.site else self.topology.site, elementTypes=[self.TYPE]+self.CAP_CHILDREN.keys(), hostPrefs=hPref, sitePrefs=sPref, template=self.template)
+		_host = placement.takePlan(self.id)
+		if not _host:
+			hPref, sPref = self.getLocationPrefs()
+			_host = host.select(site=self.site if self.site else self.topology.site, elementTypes=[self.TYPE]+self.CAP_CHILDREN.keys(), hostPrefs=hPref, sitePrefs=sPref, template=self.template)
 		UserError.check(_host, code=UserError.NO_RESOURCES, message="No matching host found for element",
 			data={"type": self.TYPE})
 		attrs = self._remoteAttrs
@@ -17,6 +17,7 @@
 
 from ..generic import *
 from .. import elements, host
+from ..host import placement
 from .generic import ST_CREATED, ST_PREPARED, VMElement, VMInterface
 from ..lib.error import UserError
 from ..lib.constants import TypeName, ActionName
@@ -30,9 +31,14 @@ class Repy(VMElement):
 	PROFILE_ATTRS = ["ram", "cpus", "bandwidth"]
 	DIRECT_ACTIONS_EXCLUDE = ["prepare", "destroy"]
 
+	def getPlacementSiteId(self, topologySiteId):
+		return self.getFieldId("site")
+
 	def action_prepare(self):
-		hPref, sPref = self.getLocationPrefs()
-		_host = host.select(site=self.site, elementTypes=[self.TYPE]+self.CAP_CHILDREN.keys(), hostPrefs=hPref, sitePrefs=sPref, template=self.template)
+		_host = placement.takePlan(self.id)
+		if not _host:
+			hPref, sPref = self.getLocationPrefs()
+			_host = host.select(site=self.site, elementTypes=[self.TYPE]+self.CAP_CHILDREN.keys(), hostPrefs=hPref, sitePrefs=sPref, template=self.template)
 		UserError.check(_host, code=UserError.NO_RESOURCES, message="No matching host found for element", data={"type": self.TYPE})
 		attrs = self._remoteAttrs
 		attrs.update({
@@ -22,12 +22,15 @@ from .. import starttime, scheduler
 from ..db import *
 from ..generic import *
 from ..lib import rpc, util, logging, error
+from ..lib.tasks import ConcurrencyLimit, ThreadPool
 from ..lib.cache import cached
 from ..lib.error import TransportError, InternalError, UserError, Error
 from ..lib.exceptionhandling import wrap_and_handle_current_exception
 from ..lib.service import get_backend_users_proxy, get_backend_accounting_proxy
 from ..lib.settings import settings, Config
 from ..lib.userflags import Flags
+from .placement import placementIndex
+from . import usage
 
 
 element_caps = {}
@@ -78,6 +81,26 @@ class RemoteWrapper:
 
 _caching = True
 _proxies = {}
+_connectionPool = rpc.ConnectionPool(
+	maxConnections=settings.get_host_connections_settings()[Config.HOST_MAX_CONNECTIONS],
+	idleTimeout=settings.get_host_connections_settings()[Config.HOST_CONNECTION_IDLE_TIMEOUT])
+
+# shared by all maintenance that talks to hosts, so that hosts are not flooded e.g. after a restart
+maintenanceLimit = ConcurrencyLimit(
+	maxConcurrent=settings.get_host_connections_settings()[Config.HOST_SYNC_CONCURRENCY],
+	maxPerGroup=settings.get_host_connections_settings()[Config.HOST_SYNC_CONCURRENCY_PER_HOST])
+
+# host synchronizations run in their own threads, so that slow hosts do not block the workers of the scheduler
+syncPool = ThreadPool(
+	threads=settings.get_host_connections_settings()[Config.HOST_SYNC_THREADS],
+	deadline=settings.get_host_connections_settings()[Config.HOST_SYNC_DEADLINE])
+
+# {(rpcurl, call): hostmanager version} of calls that hosts do not support, see Host.supportsCall
+_unsupportedCalls = {}
+
+# converted capabilities by their hash, shared by all hosts with the same capabilities
+_capabilities = {} #{hash: capabilities}
+_hostCapabilities = {} #{host name: hash}
 
 
 def stopCaching():
@@ -100,6 +123,7 @@ class Host(Entity, BaseDocument):
 	hostInfo = DictField(db_field='host_info')
 	hostInfoTimestamp = FloatField(db_field='host_info_timestamp', required=True)
 	accountingTimestamp = FloatField(db_field='accounting_timestamp', required=True)
+	accountingCursor = StringField(db_field='accounting_cursor') # of accounting_export on the host
 	lastResourcesSync = FloatField(db_field='last_resource_sync', required=True)
 	enabled = BooleanField(default=True)
 	componentErrors = IntField(default=0, db_field='component_errors')
@@ -108,6 +132,10 @@ class Host(Entity, BaseDocument):
 	availability = FloatField(default=1.0)
 	description = StringField()
 	hostNetworks = ListField(db_field='host_networks')
+	resourceState = DictField(db_field='resource_state') #{resource key: fingerprint of the attributes the host has}
+	resourceFingerprint = StringField(db_field='resource_fingerprint') # of the resources on the host, see resource_sync
+	CHANGE_TYPE = "host"
+	CHANGE_ID = "name"
 	meta = {
 		'ordering': ['site', 'name'],
 		'indexes': [
@@ -170,6 +198,16 @@ class Host(Entity, BaseDocument):
 		self.update()
 		self.synchronizeResources()
 
+	def save(self, *args, **kwargs):
+		res = Entity.save(self, *args, **kwargs)
+		placementIndex.update(self)
+		return res
+
+	def delete(self, *args, **kwargs):
+		res = Entity.delete(self, *args, **kwargs)
+		placementIndex.remove(self.name)
+		return res
+
 	def save_if_exists(self):
 		try:
 			Host.objects.get(id=self.id)
@@ -177,15 +215,21 @@ class Host(Entity, BaseDocument):
 			return
 		self.save()
 
-	def getProxy(self, always_try=False):
+	def getProxy(self, always_try=False, timeout=None):
+		"""
+		:param timeout: timeout of the calls, defaults to the rpc timeout. Use a short one for calls that must not hang, e.g. during synchronization.
+		"""
 		if not self.is_reachable() and not always_try:
 			raise TransportError(code=TransportError.CONNECT, message="host is unreachable", module="backend", data={"host": self.name}, todump=False)
+		if timeout is None:
+			timeout = settings.get_rpc_timeout()
 		if not _caching:
-			return RemoteWrapper(self.rpcurl, self.name, sslcert=settings.get_ssl_cert_filename(), sslkey=settings.get_ssl_key_filename(), sslca=settings.get_ssl_ca_filename(), timeout=settings.get_rpc_timeout())
+			return RemoteWrapper(self.rpcurl, self.name, sslcert=settings.get_ssl_cert_filename(), sslkey=settings.get_ssl_key_filename(), sslca=settings.get_ssl_ca_filename(), timeout=timeout, pool=_connectionPool)
 		# locking doesn't matter here, since in case of a race condition, there would only be a second proxy for a small amount of time.
-		if not self.rpcurl in _proxies:
-			_proxies[self.rpcurl] = RemoteWrapper(self.rpcurl, self.name, sslcert=settings.get_ssl_cert_filename(), sslkey=settings.get_ssl_key_filename(), sslca=settings.get_ssl_ca_filename(), timeout=settings.get_rpc_timeout())
-		return _proxies[self.rpcurl]
+		key = (self.rpcurl, timeout)
+		if not key in _proxies:
+			_proxies[key] = RemoteWrapper(self.rpcurl, self.name, sslcert=settings.get_ssl_cert_filename(), sslkey=settings.get_ssl_key_filename(), sslca=settings.get_ssl_ca_filename(), timeout=timeout, pool=_connectionPool)
+		return _proxies[key]
 
 	def incrementErrors(self):
 		# count all component errors {element|connection}_{create|action|modify}
@@ -200,38 +244,64 @@ class Host(Entity, BaseDocument):
 		if not self.enabled:
 			return
 		before = time.time()
-		self.hostInfo = self.getProxy(True).host_info()
+		bundle = self.fetchSyncBundle()
 		after = time.time()
+		self.hostInfo = bundle["info"]
 		self.hostInfoTimestamp = (before + after) / 2.0
 		self.hostInfo["query_time"] = after - before
 		self.hostInfo["time_diff"] = self.hostInfo["time"] - self.hostInfoTimestamp
-		try:
-			self.hostNetworks = self.getProxy().host_networks()
-		except:
-			self.hostNetworks = []
-		caps = self._convertCapabilities(self.getProxy().host_capabilities())
+		self.hostNetworks = bundle["networks"]
+		capsHash = bundle["capabilities_hash"]
+		caps = _capabilities.get(capsHash)
+		if caps is None:
+			# capabilities have not been seen before, e.g. after a hostmanager update
+			caps = self._convertCapabilities(bundle["capabilities"])
+			_mergeCapabilities(caps)
+			_capabilities[capsHash] = caps
+			logging.logMessage("capabilities", category="host", name=self.name, capabilities=caps)
+		_hostCapabilities[self.name] = capsHash
 		self.elementTypes = caps["elements"].keys()
-		global element_caps
-		for k, v in caps["elements"].iteritems():
-			if not k in element_caps:
-				element_caps[k] = v
-			else:
-				if len(repr(element_caps[k])) < len(repr(v)):
-					element_caps[k] = v
 		self.connectionTypes = caps["connections"].keys()
-		global connection_caps
-		for k, v in caps["connections"].iteritems():
-			if not k in connection_caps:
-				connection_caps[k] = v
-			else:
-				if len(repr(connection_caps[k])) < len(repr(v)):
-					connection_caps[k] = v
 		self.componentErrors = max(0, self.componentErrors / 2)
 		if not self.problems():
 			self.availability += 1.0 - settings.get_host_connections_settings()[Config.HOST_AVAILABILITY_FACTOR]
 		self.save_if_exists()
+		placementIndex.refresh(self)
 		logging.logMessage("info", category="host", name=self.name, info=self.hostInfo)
-		logging.logMessage("capabilities", category="host", name=self.name, capabilities=caps)
+
+	def supportsCall(self, name):
+		"""
+		whether the hostmanager is expected to support a call that older hostmanagers lack
+		"""
+		version = (self.hostInfo or {}).get("hostmanager", {}).get("version")
+		return _unsupportedCalls.get((self.rpcurl, name), "") != version
+
+	def setCallUnsupported(self, name):
+		# the call is tried again when the hostmanager has been updated
+		_unsupportedCalls[(self.rpcurl, name)] = (self.hostInfo or {}).get("hostmanager", {}).get("version")
+
+	def fetchSyncBundle(self):
+		"""
+		fetches host info, networks and capabilities from the host, with a single call if the hostmanager supports it.
+		Capabilities are only transferred if their hash differs from the one of the last call.
+		The calls are aborted after the sync deadline.
+		:return: dict with info, networks, capabilities_hash and capabilities (None if unchanged)
+		"""
+		proxy = self.getProxy(True, timeout=settings.get_host_connections_settings()[Config.HOST_SYNC_DEADLINE])
+		if self.supportsCall("host_sync_bundle"):
+			try:
+				return proxy.host_sync_bundle(_hostCapabilities.get(self.name))
+			except Error as err:
+				if not rpc.isUnknownMethodError(err):
+					raise
+				self.setCallUnsupported("host_sync_bundle")
+		info = proxy.host_info()
+		try:
+			networks = proxy.host_networks()
+		except:
+			networks = []
+		caps = proxy.host_capabilities()
+		return {"info": info, "networks": networks, "capabilities_hash": util.fingerprint(caps), "capabilities": caps}
 
 	def _convertCapabilities(self, caps):
 		def convertActions(actions, next_state):
@@ -312,6 +382,7 @@ class Host(Entity, BaseDocument):
 		hel = HostElement(type=el["type"], state=el["state"], host=self, num=el["id"], topologyElement=ownerElement, topologyConnection=ownerConnection)
 		hel.objectInfo = el
 		hel.save()
+		placementIndex.count(self.name, elements=1)
 		if ownerElement:
 			ownerElement.hostElements.append(hel)
 			ownerElement.save()
@@ -349,6 +420,7 @@ class Host(Entity, BaseDocument):
 							  elementFrom=hel1, elementTo=hel2)
 		hcon.objectInfo = con
 		hcon.save()
+		placementIndex.count(self.name, connections=1)
 		hel1.connection = hcon
 		hel1.save()
 		hel2.connection = hcon
@@ -383,76 +455,214 @@ class Host(Entity, BaseDocument):
 		# TODO: implement for other resources
 		from ..resources import template
 
-		hostNets = {}
-		for net in self.getProxy().resource_list("network"):
-			hostNets[net["attrs"]["bridge"]] = net
+		templates = list(template.Template.objects())
+		resources = {}
 		for net in self.networks.all():
-			key = net.bridge
 			attrs = {"bridge": net.bridge, "kind": net.getKind(), "preference": net.network.preference}
-			if not key in hostNets:
-				# create resource
-				self.getProxy().resource_create("network", attrs)
-				logging.logMessage("network create", category="host", name=self.name, network=attrs)
-			else:
-				hNet = hostNets[key]
-				if hNet["attrs"] != attrs:
-					# update resource
-					self.getProxy().resource_modify(hNet["id"], attrs)
-					logging.logMessage("network update", category="host", name=self.name, network=attrs)
-		tpls = {}
-		for tpl in self.getProxy().resource_list("template"):
-			tpls[(tpl["attrs"]["tech"], tpl["attrs"]["name"])] = tpl
-		avail = []
-		for tpl in template.Template.objects():
-			attrs = tpl.info_for_hosts()
-			if not (attrs["tech"], attrs["name"]) in tpls:
-				# create resource
-				self.getProxy().resource_create("template", attrs)
-				logging.logMessage("template create", category="host", name=self.name, template=attrs)
-			else:
-				hTpl = tpls[(attrs["tech"], attrs["name"])]
-				if hTpl["attrs"].get("checksum") != tpl.checksum:
-					self.getProxy().resource_modify(hTpl["id"], attrs)
-					logging.logMessage("template update", category="host", name=self.name, template=attrs)
-				else:
-					avail.append(tpl)
-		for tpl in template.Template.objects():
-			tpl.update_host_state(self, tpl in avail)
+			resources["network:%s" % net.id] = ("network", attrs)
+		for tpl in templates:
+			resources["template:%s" % tpl.id] = ("template", tpl.info_for_hosts())
+		if self.supportsCall("resource_sync"):
+			try:
+				avail = self._syncResourceChanges(resources, forced)
+			except Error as err:
+				if not rpc.isUnknownMethodError(err):
+					raise
+				self.setCallUnsupported("resource_sync")
+				avail = self._syncAllResources(resources)
+		else:
+			avail = self._syncAllResources(resources)
+		self._updateTemplateStates(templates, avail)
 		logging.logMessage("resource_sync end", category="host", name=self.name)
 		self.lastResourcesSync = time.time()
 		self.save_if_exists()
 
-	def updateAccountingData(self):
-		logging.logMessage("accounting_sync begin", category="host", name=self.name)
-		try:
-			orig_data = self.getProxy().accounting_statistics(type="single", after=self.accountingTimestamp)
-			data = {"elements": {}, "connections": {}}
-			max_timestamp = self.accountingTimestamp
-
-			# check for completeness
-			for el in self.elements.all():
-				if not str(el.num) in orig_data["elements"]:
-					print >>sys.stderr, "Missing accounting data for element #%d on host %s" % (el.num, self.name)
-			for con in self.connections.all():
-				if not str(con.num) in orig_data["connections"]:
-					print >>sys.stderr, "Missing accounting data for connection #%d on host %s" % (con.num, self.name)
+	@staticmethod
+	def _resourceVersion(type_, attrs):
+		# templates are only updated on the hosts when their file changes
+		if type_ == "template":
+			return (type_, attrs["checksum"])
+		return (type_, attrs)
+
+	@staticmethod
+	def _resourceDiffers(type_, attrs, hostAttrs):
+		if type_ == "template":
+			return hostAttrs.get("checksum") != attrs["checksum"]
+		return hostAttrs != attrs
+
+	@staticmethod
+	def _hostResourceKey(type_, attrs):
+		# how the hostmanager identifies networks and templates
+		if type_ == "network":
+			return (type_, attrs["bridge"])
+		return (type_, attrs["tech"], attrs["name"])
+
+	def _syncResourceChanges(self, resources, forced):
+		"""
+		sends all resources that changed since the last acknowledged sync to the host in one call.
+		If the resources on the host have been changed by someone else, all resources are compared and the differing
+		ones are sent in a second call.
+		:param resources: {key: (type, attrs)} of all resources the host should have
+		:return: keys of the templates that were up to date on the host before
+		"""
+		fingerprints = {key: util.fingerprint(self._resourceVersion(type_, attrs)) for key, (type_, attrs) in resources.iteritems()}
+		# when forced, the host is asked for all of its resources first
+		changed = set() if forced else set(key for key in resources if self.resourceState.get(key) != fingerprints[key])
+		for key in changed:
+			type_, attrs = resources[key]
+			logging.logMessage("%s sync" % type_, category="host", name=self.name, **{type_: attrs})
+		proxy = self.getProxy()
+		res = proxy.resource_sync([resources[key] for key in changed], None if forced else self.resourceFingerprint)
+		if res["resources"] is not None:
+			onHost = {self._hostResourceKey(r["type"], r["attrs"]): r["attrs"] for r in res["resources"]}
+			differing = set()
+			for key, (type_, attrs) in resources.iteritems():
+				hostAttrs = onHost.get(self._hostResourceKey(type_, attrs))
+				if hostAttrs is None or self._resourceDiffers(type_, attrs, hostAttrs):
+					differing.add(key)
+			if differing - changed:
+				res = proxy.resource_sync([resources[key] for key in differing - changed], res["fingerprint"])
+			changed |= differing
+		self.resourceState = fingerprints
+		self.resourceFingerprint = res["fingerprint"]
+		return set(key for key, (type_, _) in resources.iteritems() if type_ == "template" and not key in changed)
+
+	def _syncAllResources(self, resources):
+		"""
+		compares all resources with the ones on the host and creates or modifies them one by one.
+		This is only used for hostmanagers without resource_sync.
+		:param resources: {key: (type, attrs)} of all resources the host should have
+		:return: keys of the templates that were up to date on the host before
+		"""
+		proxy = self.getProxy()
+		onHost = {}
+		for type_ in ("network", "template"):
+			for r in proxy.resource_list(type_):
+				onHost[self._hostResourceKey(type_, r["attrs"])] = r
+		avail = set()
+		for key, (type_, attrs) in resources.iteritems():
+			hostRes = onHost.get(self._hostResourceKey(type_, attrs))
+			if hostRes is None:
+				proxy.resource_create(type_, attrs)
+				logging.logMessage("%s create" % type_, category="host", name=self.name, **{type_: attrs})
+			elif self._resourceDiffers(type_, attrs, hostRes["attrs"]):
+				proxy.resource_modify(hostRes["id"], attrs)
+				logging.logMessage("%s update" % type_, category="host", name=self.name, **{type_: attrs})
+			elif type_ == "template":
+				avail.add(key)
+		self.resourceState = {}
+		self.resourceFingerprint = None
+		return avail
+
+	def _updateTemplateStates(self, templates, avail):
+		"""
+		records on which templates are ready on this host, with a single bulk write for all changed templates.
+		:param avail: keys of the templates that are ready on this host
+		"""
+		if not "templateserver_port" in self.hostInfo:
+			return  # old hostmanager
+		from pymongo import UpdateOne
+		from ..resources.template import Template
+		updates = []
+		changed = []
+		for tpl in templates:
+			if not tpl.checksum:
+				continue
+			url = tpl.getHostUrl(self)
+			if "template:%s" % tpl.id in avail:
+				if self.name in tpl.hosts and url in tpl.host_urls:
+					continue
+				updates.append(UpdateOne({"_id": tpl.id}, {"$addToSet": {"hosts": self.name, "host_urls": url}}))
+			else:
+				if not self.name in tpl.hosts and not url in tpl.host_urls:
 					continue
+				updates.append(UpdateOne({"_id": tpl.id}, {"$pull": {"hosts": self.name, "host_urls": url}}))
+			changed.append(tpl)
+		if updates:
+			Template._get_collection().bulk_write(updates, ordered=False)
+		for tpl in changed:
+			tpl.publishChange()
+
+	def _accountingNums(self):
+		"""
+		:return: nums of the elements and connections on this host
+		"""
+		from .element import HostElement
+		from .connection import HostConnection
+		return [[obj["num"] for obj in cls._get_collection().find({"host": self.id}, {"num": 1})]
+			for cls in (HostElement, HostConnection)]
 
-			# transform
-			for type_ in ("elements", "connections"):
-				for obj_id, obj_recs in orig_data[type_].iteritems():
-					id_ = "%s@%s" % (obj_id, self.name)
-					for obj_rec in obj_recs:
-						new_rec = (int(obj_rec["begin"]), obj_rec["usage"]["memory"], obj_rec["usage"]["diskspace"], obj_rec["usage"]["traffic"], obj_rec["usage"]["cputime"])
-						max_timestamp = max(obj_rec["begin"], max_timestamp)
-						if obj_id in data[type_]:
-							data[type_][id_].append(new_rec)
-						else:
-							data[type_][id_] = [new_rec]
-
-			get_backend_accounting_proxy().push_usage(data["elements"], data["connections"])
-			self.accountingTimestamp = max_timestamp + 1  # one second greater than last record.
+	def _pushUsage(self, elements, connections):
+		"""
+		pushes converted records to backend_accounting and saves the accounting timestamp after every chunk, so that
+		no chunk is pushed twice
+		"""
+		proxy = get_backend_accounting_proxy()
+		for els, cons, last in usage.chunks(elements, connections):
+			proxy.push_usage(els, cons)
+			self.accountingTimestamp = max(self.accountingTimestamp, last + 1)  # one second greater than last record.
 			self.save_if_exists()
+
+	def _checkAccounting(self, elementNums, connectionNums, elements, connections):
+		for num in usage.missing(elementNums, elements):
+			print >>sys.stderr, "Missing accounting data for element #%d on host %s" % (num, self.name)
+		for num in usage.missing(connectionNums, connections):
+			print >>sys.stderr, "Missing accounting data for connection #%d on host %s" % (num, self.name)
+
+	def _fetchAccountingExport(self, proxy):
+		"""
+		:return: the next page of accounting_export(), None if the hostmanager does not support it
+		"""
+		try:
+			if self.accountingCursor:
+				return proxy.accounting_export(type="single", cursor=self.accountingCursor, limit=usage.EXPORT_LIMIT)
+			return proxy.accounting_export(type="single", after=self.accountingTimestamp, limit=usage.EXPORT_LIMIT)
+		except Error as err:
+			if not rpc.isUnknownMethodError(err):
+				raise
+			self.setCallUnsupported("accounting_export")
+			self.accountingCursor = None
+			return None
+
+	def _updateAccountingExport(self, proxy, elementNums, connectionNums):
+		"""
+		:return: whether the hostmanager supports accounting_export()
+		"""
+		seen = ({}, {})
+		more = True
+		while more:
+			data = self._fetchAccountingExport(proxy)
+			if data is None:
+				return False
+			seen[0].update(dict.fromkeys(data["elements"]))
+			seen[1].update(dict.fromkeys(data["connections"]))
+			# a page is pushed with one call and the cursor is saved together with the timestamp right after it.
+			# If the push fails, the host is loaded again in the next run.
+			self.accountingCursor = data["cursor"]
+			self._pushUsage(usage.fromExport(data["elements"], self.name), usage.fromExport(data["connections"], self.name))
+			self.save_if_exists()
+			more = data["more"]
+		if seen[0] or seen[1]:
+			self._checkAccounting(elementNums, connectionNums, *seen)
+		return True
+
+	def _updateAccountingStatistics(self, proxy, elementNums, connectionNums):
+		data = proxy.accounting_statistics(type="single", after=self.accountingTimestamp)
+		self._checkAccounting(elementNums, connectionNums, data["elements"], data["connections"])
+		self._pushUsage(usage.fromStatistics(data["elements"], self.name), usage.fromStatistics(data["connections"], self.name))
+
+	def updateAccountingData(self):
+		"""
+		fetches the new single usage records from the host and pushes them to backend_accounting.
+		Hostmanagers that support it send their records in pages of compact columns, older ones all at once.
+		"""
+		logging.logMessage("accounting_sync begin", category="host", name=self.name)
+		try:
+			proxy = self.getProxy()
+			elementNums, connectionNums = self._accountingNums()
+			if self.supportsCall("accounting_export") and self._updateAccountingExport(proxy, elementNums, connectionNums):
+				return
+			self._updateAccountingStatistics(proxy, elementNums, connectionNums)
 		finally:
 			logging.logMessage("accounting_sync end", category="host", name=self.name)
 
@@ -701,58 +911,54 @@ def select(site=None, elementTypes=None, connectionTypes=None, networkKinds=None
 	if not networkKinds: networkKinds = []
 	if not connectionTypes: connectionTypes = []
 	if not elementTypes: elementTypes = []
-	all_ = Host.getAll(site=site) if site else Host.getAll()
-	hosts = []
-	for host in all_:
-		if host.problems():
-			continue
-		if elementTypes and set(elementTypes) - set(host.elementTypes):
-			continue
-		if connectionTypes and set(connectionTypes) - set(host.connectionTypes):
-			continue
-		if networkKinds and set(networkKinds) - set(host.getNetworkKinds()):
-			continue
-		if template and host.name not in template.hosts:
-			continue
-		if not best:
-			return host
-		hosts.append(host)
+	hosts = placementIndex.candidates(site.id if site else None, elementTypes, connectionTypes, networkKinds,
+		template.hosts if template else None)
 	UserError.check(hosts, code=UserError.INVALID_CONFIGURATION, message="No hosts found for requirements", data={
 		'site': site.name if site else None, 'element_types': elementTypes, 'connection_types': connectionTypes, 'network_kinds': networkKinds
 	})
+	if not best:
+		return Host.get(name=hosts[0].name)
 	# any host in hosts can handle the request
-	prefs = dict([(h, 0.0) for h in hosts])
+	prefs = dict([(h.name, 0.0) for h in hosts])
 	# STEP 2: calculate preferences based on host load
 	els = 0.0
 	cons = 0.0
 	for h in hosts:
-		prefs[h] -= h.componentErrors * 25  # discourage hosts with previous errors
-		prefs[h] -= h.getLoad() * 100  # up to -100 points for load
-		els += h.elements.count()
-		cons += h.connections.count()
+		prefs[h.name] -= h.componentErrors * 25  # discourage hosts with previous errors
+		prefs[h.name] -= h.load * 100  # up to -100 points for load
+		els += h.elements
+		cons += h.connections
 	avgEls = els / len(hosts)
 	avgCons = cons / len(hosts)
 	for h in hosts:
 		# between -30 and +30 points for element/connection over-/under-population
 		if avgEls:
-			prefs[h] -= max(-20.0, min(10.0 * (h.elements.count() - avgEls) / avgEls, 20.0))
+			prefs[h.name] -= max(-20.0, min(10.0 * (h.elements - avgEls) / avgEls, 20.0))
 		if avgCons:
-			prefs[h] -= max(-10.0, min(10.0 * (h.connections.count() - avgCons) / avgCons, 10.0))
-		# STEP 3: calculate preferences based on host location
+			prefs[h.name] -= max(-10.0, min(10.0 * (h.connections - avgCons) / avgCons, 10.0))
+	# STEP 3: calculate preferences based on host location
+	hostPrefsByName = dict([(h.name, v) for h, v in hostPrefs.iteritems()])
+	sitePrefsById = dict([(s.id, v) for s, v in sitePrefs.iteritems()])
 	for h in hosts:
-		if h in hostPrefs:
-			prefs[h] += hostPrefs[h]
-		if h.site in sitePrefs:
-			prefs[h] += sitePrefs[h.site]
+		prefs[h.name] += hostPrefsByName.get(h.name, 0.0)
+		prefs[h.name] += sitePrefsById.get(h.siteId, 0.0)
 	#STEP 4: select the best host
-	hosts.sort(key=lambda h: prefs[h], reverse=True)
-	logging.logMessage("select", category="host", result=hosts[0].name,
-					   prefs=dict([(k.name, v) for k, v in prefs.iteritems()]),
+	hosts.sort(key=lambda h: prefs[h.name], reverse=True)
+	logging.logMessage("select", category="host", result=hosts[0].name, prefs=prefs,
 					   site=site.name if site else None, element_types=elementTypes, connection_types=connectionTypes,
-					   network_types=networkKinds,
-					   host_prefs=dict([(k.name, v) for k, v in hostPrefs.iteritems()]),
-					   site_prefs=dict([(k.name, v) for k, v in sitePrefs.iteritems()]))
-	return hosts[0]
+					   network_types=networkKinds, host_prefs=hostPrefsByName,
+					   site_prefs=dict([(s.name, v) for s, v in sitePrefs.iteritems()]))
+	return Host.get(name=hosts[0].name)
+
+
+def _mergeCapabilities(caps):
+	# the most detailed capabilities of every type win
+	for k, v in caps["elements"].iteritems():
+		if not k in element_caps or len(repr(element_caps[k])) < len(repr(v)):
+			element_caps[k] = v
+	for k, v in caps["connections"].iteritems():
+		if not k in connection_caps or len(repr(connection_caps[k])) < len(repr(v)):
+			connection_caps[k] = v
 
 
 def getElementTypes():
@@ -779,35 +985,56 @@ def getConnectionCapabilities(type_):
 
 checkingHostsLock = threading.RLock()
 checkingHosts = set()
+skippedSyncs = 0 # synchronizations that got no slot of the maintenanceLimit within the sync deadline
 
 
-@util.wrap_task
 def synchronizeHost(host_name):
-	try:
-		host = Host.objects.get(name=host_name)
-	except DoesNotExist:
-		return  # nothing to synchronize
+	"""
+	starts the synchronization of a host in the sync pool, unless the last one is still running.
+	All hosts are synchronized in parallel this way, a slow host only blocks one thread of the pool until the sync deadline.
+	"""
 	with checkingHostsLock:
-		if host in checkingHosts:
+		if host_name in checkingHosts:
 			return
-		checkingHosts.add(host)
+		checkingHosts.add(host_name)
+	syncPool.submit(_synchronizeHost, host_name, key=host_name)
+
+@util.wrap_task
+def _synchronizeHost(host_name):
+	global skippedSyncs
 	try:
+		# shares the per host budget with the accounting and element synchronization, so it waits for a slot.
+		# Syncs that get none within the deadline are retried in the next round.
+		if not maintenanceLimit.acquire(host_name, timeout=syncPool.deadline):
+			with checkingHostsLock:
+				skippedSyncs += 1
+			return
 		try:
-			try:
-				host.update()
-				host.synchronizeResources()
-			except Exception as e:
-				print >>sys.stderr, "Error updating host information from %s" % host
-				if isinstance(e, TransportError):
-					e.todump = False
-				else:
-					traceback.print_exc()
-				wrap_and_handle_current_exception(re_raise=True)
+			_synchronizeHostLimited(host_name)
 		finally:
-			host.checkProblems()
+			maintenanceLimit.release(host_name)
 	finally:
 		with checkingHostsLock:
-			checkingHosts.remove(host)
+			checkingHosts.remove(host_name)
+
+def _synchronizeHostLimited(host_name):
+	try:
+		host = Host.objects.get(name=host_name)
+	except DoesNotExist:
+		return  # nothing to synchronize
+	try:
+		try:
+			host.update()
+			host.synchronizeResources()
+		except Exception as e:
+			print >>sys.stderr, "Error updating host information from %s" % host
+			if isinstance(e, TransportError):
+				e.todump = False
+			else:
+				traceback.print_exc()
+			wrap_and_handle_current_exception(re_raise=True)
+	finally:
+		host.checkProblems()
 
 updatingAccountingHostsLock = threading.RLock()
 updatingAccountingHosts = set()
@@ -838,9 +1065,9 @@ def updateAccounting(host_name):
 from .site import Site
 
 def list_host_names():
-	return [h.name for h in Host.getAll().only("name")]
+	return {h.name: h.name for h in Host.getAll().only("name")}
 
 scheduler.scheduleMaintenance(settings.get_host_connections_settings()[Config.HOST_UPDATE_INTERVAL],
                               list_host_names, synchronizeHost)
 scheduler.scheduleMaintenance(settings.get_host_connections_settings()[Config.HOST_UPDATE_INTERVAL],
-                              list_host_names, updateAccounting)
+                              list_host_names, updateAccounting, limit=maintenanceLimit)
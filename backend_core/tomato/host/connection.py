@@ -2,7 +2,8 @@ from ..db import *
 from ..lib import logging, error, util
 from .. import scheduler
 
-from . import HostObject
+from . import HostObject, Host, maintenanceLimit
+from .placement import placementIndex
 from .element import HostElement
 
 class HostConnection(HostObject):
@@ -64,6 +65,7 @@ class HostConnection(HostObject):
 			self.host.incrementErrors()
 		if self.id:
 			self.delete()
+			placementIndex.count(self.host.name, connections=-1)
 
 	def getElements(self):
 		return [self.elementFrom, self.elementTo]
@@ -113,7 +115,8 @@ HostConnection.register_delete_rule(HostElement, "connection", NULLIFY)
 
 
 def list():
-	return [e.id for e in HostConnection.objects.all()]
+	hosts = {h.id: h.name for h in Host.objects.only("name")}
+	return {c.id: hosts.get(c.getFieldId("host")) for c in HostConnection.objects.only("id", "host")}
 
 @util.wrap_task
 def synchronize(id_):
@@ -122,4 +125,4 @@ def synchronize(id_):
 	except DoesNotExist:
 		pass  # nothing to synchronize
 
-scheduler.scheduleMaintenance(3600, list, synchronize)
+scheduler.scheduleMaintenance(3600, list, synchronize, limit=maintenanceLimit)
@@ -3,7 +3,8 @@ from ..lib import logging, error, util
 from ..lib.settings import settings
 from .. import scheduler
 import time
-from . import HostObject
+from . import HostObject, Host, maintenanceLimit
+from .placement import placementIndex
 
 class HostElement(HostObject):
 	"""
@@ -81,6 +82,7 @@ class HostElement(HostObject):
 		try:
 			if self.id:
 				self.delete()
+				placementIndex.count(self.host.name, elements=-1)
 		except OperationError:
 			from .connection import HostConnection
 			for hcon in HostConnection.objects(elementFrom=self):
@@ -136,7 +138,8 @@ class HostElement(HostObject):
 
 
 def list():
-	return [e.id for e in HostElement.objects.all()]
+	hosts = {h.id: h.name for h in Host.objects.only("name")}
+	return {e.id: hosts.get(e.getFieldId("host")) for e in HostElement.objects.only("id", "host")}
 
 @util.wrap_task
 def synchronize(id_):
@@ -145,4 +148,4 @@ def synchronize(id_):
 	except DoesNotExist:
 		pass  # nothong to synchronize
 
-scheduler.scheduleMaintenance(min(3600, settings.get_host_connections_settings()['component-timeout']), list, synchronize)
\ No newline at end of file
+scheduler.scheduleMaintenance(min(3600, settings.get_host_connections_settings()['component-timeout']), list, synchronize, limit=maintenanceLimit)
\ No newline at end of file
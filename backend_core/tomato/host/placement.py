@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# ToMaTo (Topology management software)
+# Copyright (C) 2010 Dennis Schwerdel, University of Kaiserslautern
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+In-memory index of everything host.select() needs to know about the hosts, so that placing an element does not load
+all hosts and count their elements and connections.
+
+Entries are updated whenever a host is saved, elements and connections are counted up and down when they are created
+and removed on a host, and counters and network kinds are re-read from the database on every host synchronization.
+
+planTopology() uses the index to place all VMs of a topology at once before it is prepared, see planner.py.
+"""
+
+import threading, time
+
+from ..lib.settings import settings, Config
+from .planner import PlacementPlanner
+
+
+class HostEntry(object):
+	__slots__ = ("name", "siteId", "elementTypes", "connectionTypes", "networkKinds", "problems", "reachableUntil",
+		"syncedUntil", "componentErrors", "load", "elements", "connections")
+
+	def __init__(self, name):
+		self.name = name
+		self.networkKinds = set()
+		self.elements = 0
+		self.connections = 0
+
+	def update(self, host):
+		hostSettings = settings.get_host_connections_settings()
+		self.siteId = host.getFieldId("site")
+		self.elementTypes = set(host.elementTypes)
+		self.connectionTypes = set(host.connectionTypes)
+		self.problems = host.problems()
+		# see Host.problems(), these problems appear without the host being saved
+		self.reachableUntil = host.hostInfoTimestamp + 2 * hostSettings[Config.HOST_UPDATE_INTERVAL] + 300
+		self.syncedUntil = host.lastResourcesSync + 2 * hostSettings[Config.HOST_RESOURCE_SYNC_INTERVAL] + 300
+		self.componentErrors = host.componentErrors
+		self.load = host.getLoad()
+
+	def usable(self, now):
+		return not self.problems and now <= self.reachableUntil and now <= self.syncedUntil
+
+	def info(self):
+		return {
+			"name": self.name,
+			"element_types": sorted(self.elementTypes),
+			"connection_types": sorted(self.connectionTypes),
+			"network_kinds": sorted(self.networkKinds),
+			"problems": self.problems,
+			"component_errors": self.componentErrors,
+			"load": self.load,
+			"elements": self.elements,
+			"connections": self.connections
+		}
+
+
+class PlacementIndex(object):
+	def __init__(self):
+		self.entries = None #{name: HostEntry}, loaded on first use
+		self.lock = threading.RLock()
+
+	def _load(self):
+		from . import Host
+		from .element import HostElement
+		from .connection import HostConnection
+		entries = {}
+		names = {}
+		for host in Host.objects():
+			entry = HostEntry(host.name)
+			entry.update(host)
+			entry.networkKinds = set(host.getNetworkKinds())
+			entries[host.name] = entry
+			names[host.id] = host.name
+		for cls, attr in ((HostElement, "elements"), (HostConnection, "connections")):
+			for group in cls._get_collection().aggregate([{"$group": {"_id": "$host", "count": {"$sum": 1}}}]):
+				if group["_id"] in names:
+					setattr(entries[names[group["_id"]]], attr, group["count"])
+		return entries
+
+	def _getEntries(self):
+		with self.lock:
+			if self.entries is None:
+				self.entries = self._load()
+			return self.entries
+
+	def update(self, host):
+		"""
+		updates the entry of a host after it has been saved
+		"""
+		with self.lock:
+			if self.entries is None:
+				return
+			entry = self.entries.get(host.name)
+			if entry is None:
+				# new host
+				entry = HostEntry(host.name)
+				entry.networkKinds = set(host.getNetworkKinds())
+				self.entries[host.name] = entry
+			entry.update(host)
+
+	def refresh(self, host):
+		"""
+		re-reads the element and connection counters and the network kinds of a host from the database, to correct
+		any drift, e.g. from objects that were removed by the host synchronization.
+		"""
+		if self.entries is None or not host.id:
+			return
+		elements, connections = host.elements.count(), host.connections.count()
+		networkKinds = set(host.getNetworkKinds())
+		with self.lock:
+			self.update(host)
+			entry = (self.entries or {}).get(host.name)
+			if entry:
+				entry.elements, entry.connections, entry.networkKinds = elements, connections, networkKinds
+
+	def remove(self, name):
+		with self.lock:
+			if self.entries is not None:
+				self.entries.pop(name, None)
+
+	def count(self, name, elements=0, connections=0):
+		"""
+		counts elements and connections on a host up or down
+		"""
+		with self.lock:
+			entry = (self.entries or {}).get(name)
+			if entry:
+				entry.elements = max(entry.elements + elements, 0)
+				entry.connections = max(entry.connections + connections, 0)
+
+	def candidates(self, siteId=None, elementTypes=None, connectionTypes=None, networkKinds=None, templateHosts=None):
+		"""
+		:return: entries of all hosts without problems that fulfill the requirements, sorted by name
+		:rtype: list of HostEntry
+		"""
+		now = time.time()
+		elementTypes = set(elementTypes or [])
+		connectionTypes = set(connectionTypes or [])
+		networkKinds = set(networkKinds or [])
+		res = []
+		with self.lock:
+			for entry in self._getEntries().itervalues():
+				if siteId and entry.siteId != siteId:
+					continue
+				if not entry.usable(now):
+					continue
+				if elementTypes - entry.elementTypes or connectionTypes - entry.connectionTypes:
+					continue
+				if networkKinds - entry.networkKinds:
+					continue
+				if templateHosts is not None and entry.name not in templateHosts:
+					continue
+				res.append(entry)
+		res.sort(key=lambda entry: entry.name)
+		return res
+
+	def info(self):
+		with self.lock:
+			if self.entries is None:
+				return None
+			return {name: entry.info() for name, entry in self.entries.iteritems()}
+
+
+placementIndex = PlacementIndex()
+
+
+_plans = {} #{element id: host name}
+_plansLock = threading.RLock()
+
+def planTopology(topology):
+	"""
+	plans the hosts of all VMs of a topology that have not been prepared yet. The elements use the planned hosts when
+	they are prepared, see takePlan().
+	:return: ids of the planned elements
+	:rtype: list
+	"""
+	from ..elements.generic import VMElement, VMInterface, ConnectingElement
+	from ..resources.template import Template
+	from .element import HostElement
+	from . import Host
+	elements = dict((el.id, el) for el in topology.elements)
+	vms = dict((id_, el) for id_, el in elements.iteritems() if isinstance(el, VMElement))
+	pending = [el for el in vms.itervalues() if el.state == "created"]
+	if not pending:
+		return []
+	# connected elements, i.e. both sides of a connection and all endpoints of a switch, form one group
+	groupOf = {}
+	def find(id_):
+		while groupOf.get(id_, id_) != id_:
+			id_ = groupOf[id_]
+		return id_
+	def union(a, b):
+		a, b = find(a), find(b)
+		if a != b:
+			groupOf[a] = b
+	for con in topology.connections:
+		union(con.getFieldId("elementFrom"), con.getFieldId("elementTo"))
+	for el in elements.itervalues():
+		if isinstance(el, ConnectingElement) and el.getFieldId("parent") in elements:
+			union(el.id, el.getFieldId("parent"))
+	# hosts of the VMs that have already been placed
+	hostIds = {}
+	placedIds = [el.getFieldId("element") for el in vms.itervalues() if el.state != "created"]
+	for hel in HostElement._get_collection().find({"_id": {"$in": filter(bool, placedIds)}}, {"host": 1}):
+		hostIds[hel["_id"]] = hel["host"]
+	hostNames = dict((h["_id"], h["name"]) for h in Host._get_collection().find({"_id": {"$in": hostIds.values()}}, {"name": 1}))
+	entries = placementIndex._getEntries()
+	placedOn = {}
+	for el in vms.itervalues():
+		name = hostNames.get(hostIds.get(el.getFieldId("element")))
+		if name in entries:
+			placedOn[el.id] = entries[name]
+	groups = {} #{group: ([members], [placed members])}
+	sizes = {}
+	for el in elements.itervalues():
+		vmId = el.getFieldId("parent")
+		if not isinstance(el, VMInterface) or not vmId in vms:
+			continue
+		sizes[vmId] = sizes.get(vmId, 1) + 1
+		if not el.getFieldId("connection"):
+			continue
+		members, placed = groups.setdefault(find(el.id), ([], []))
+		if vmId in placedOn:
+			placed.append((placedOn[vmId], el.SAME_HOST_AFFINITY, el.SAME_SITE_AFFINITY))
+		elif vms[vmId].state == "created":
+			members.append((vmId, el.SAME_HOST_AFFINITY, el.SAME_SITE_AFFINITY))
+	templates = dict((tpl.id, tpl.hosts) for tpl in Template.objects(id__in=set(filter(bool, [el.getFieldId("template") for el in pending]))))
+	planner = PlacementPlanner()
+	candidates = {}
+	topologySite = topology.getFieldId("site")
+	for el in pending:
+		siteId = el.getPlacementSiteId(topologySite)
+		elementTypes = [el.TYPE] + el.CAP_CHILDREN.keys()
+		templateId = el.getFieldId("template")
+		key = (siteId, tuple(elementTypes), templateId)
+		if not key in candidates:
+			candidates[key] = placementIndex.candidates(siteId, elementTypes, templateHosts=templates.get(templateId) if templateId else None)
+		planner.addElement(el.id, candidates[key], sizes.get(el.id, 1))
+	for members, placed in groups.itervalues():
+		if len(members) + len(placed) > 1 and members:
+			planner.addGroup(members, placed)
+	plan = planner.solve()
+	with _plansLock:
+		_plans.update(plan)
+	return plan.keys()
+
+def takePlan(elementId):
+	"""
+	:return: the planned host of an element, the plan is removed
+	:rtype: Host or None
+	"""
+	from . import Host
+	with _plansLock:
+		name = _plans.pop(elementId, None)
+	if not name:
+		return None
+	entry = placementIndex._getEntries().get(name)
+	if not entry or not entry.usable(time.time()):
+		return None
+	return Host.get(name=name)
+
+def getPlan(elementId):
+	"""
+	:return: name of the planned host of an element, the plan is kept
+	"""
+	with _plansLock:
+		return _plans.get(elementId)
+
+def dropPlans(elementIds):
+	with _plansLock:
+		for id_ in elementIds:
+			_plans.pop(id_, None)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# ToMaTo (Topology management software)
+# Copyright (C) 2010 Dennis Schwerdel, University of Kaiserslautern
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Places all elements of a topology at once instead of one after another.
+
+The planner uses the same preferences as host.select(): host errors, load and element/connection population,
+plus the affinities between connected elements. Instead of only seeing the neighbours that have already been placed,
+it assigns all elements in a greedy pass (most constrained elements first) and then moves single elements to a better
+host as long as this improves their score. Element counts of the hosts include what has been planned so far, so large
+topologies are spread like the population term of select() intends.
+
+Connected elements are given as groups: all members of a group are pairwise neighbours, e.g. the interfaces of all VMs
+connected to one switch. The affinity between two members is the sum of their affinities, just like in
+Element.getLocationPrefs(). The affinity sums of every group are kept per host and per site, so scoring an element
+costs O(hosts and sites its groups are on) instead of O(neighbours).
+
+This module does not depend on the database, hosts are given as objects with the attributes name, siteId,
+componentErrors, load, elements and connections, e.g. placement.HostEntry.
+"""
+
+
+class _Element(object):
+	__slots__ = ("id", "candidates", "size", "groups", "host")
+
+	def __init__(self, id_, candidates, size):
+		self.id = id_
+		self.candidates = candidates
+		self.size = size
+		self.groups = [] #[(group, sameHostAffinity, sameSiteAffinity)]
+		self.host = None
+
+
+class _Group(object):
+	__slots__ = ("hosts", "sites")
+
+	def __init__(self):
+		self.hosts = {} #{hostName: [members, sum of same host affinities]}
+		self.sites = {} #{siteId: [members, sum of same site affinities]}
+
+	def add(self, host, sha, ssa, count=1):
+		entry = self.hosts.setdefault(host.name, [0, 0.0])
+		entry[0] += count
+		entry[1] += count * sha
+		entry = self.sites.setdefault(host.siteId, [0, 0.0])
+		entry[0] += count
+		entry[1] += count * ssa
+
+
+class PlacementPlanner(object):
+	def __init__(self):
+		self.elements = {} #{id: _Element}
+		self.planned = {} #{hostName: number of planned host elements}
+		self.static = {} #{id(candidates): [preference]}
+
+	def addElement(self, id_, candidates, size=1):
+		"""
+		adds an element that needs a host
+		:param id_: id of the element
+		:param candidates: hosts that can take the element, e.g. from PlacementIndex.candidates(). Elements with the
+		                   same requirements should share the list.
+		:param int size: number of host elements that will be created for it (the element and its interfaces)
+		"""
+		self.elements[id_] = _Element(id_, candidates, size)
+
+	def addGroup(self, members, placed=None):
+		"""
+		adds a group of connected elements
+		:param members: list of (element id, same host affinity, same site affinity) of elements that are planned
+		:param placed: list of (host, same host affinity, same site affinity) of members that already have a host
+		"""
+		group = _Group()
+		for host, sha, ssa in placed or []:
+			group.add(host, sha, ssa)
+		for id_, sha, ssa in members:
+			self.elements[id_].groups.append((group, sha, ssa))
+
+	def _place(self, el, host, count=1):
+		el.host = host if count > 0 else None
+		self.planned[host.name] = self.planned.get(host.name, 0) + count * el.size
+		for group, sha, ssa in el.groups:
+			group.add(host, sha, ssa, count)
+
+	def _staticPrefs(self, hosts):
+		# the terms of select() that do not change while planning
+		key = id(hosts)
+		if not key in self.static:
+			avgCons = float(sum(h.connections for h in hosts)) / len(hosts)
+			prefs = []
+			for h in hosts:
+				pref = - h.componentErrors * 25 - h.load * 100
+				if avgCons:
+					pref -= max(-10.0, min(10.0 * (h.connections - avgCons) / avgCons, 10.0))
+				prefs.append(pref)
+			self.static[key] = prefs
+		return self.static[key]
+
+	def _best(self, el):
+		hosts = el.candidates
+		counts = [h.elements + self.planned.get(h.name, 0) for h in hosts]
+		avgEls = float(sum(counts)) / len(hosts)
+		hostPrefs, sitePrefs = {}, {}
+		for group, sha, ssa in el.groups:
+			for name, (members, affinity) in group.hosts.iteritems():
+				hostPrefs[name] = hostPrefs.get(name, 0.0) + members * sha + affinity
+			for siteId, (members, affinity) in group.sites.iteritems():
+				sitePrefs[siteId] = sitePrefs.get(siteId, 0.0) + members * ssa + affinity
+		best, bestPref = None, None
+		for h, els, pref in zip(hosts, counts, self._staticPrefs(hosts)):
+			if avgEls:
+				pref -= max(-20.0, min(10.0 * (els - avgEls) / avgEls, 20.0))
+			pref += hostPrefs.get(h.name, 0.0) + sitePrefs.get(h.siteId, 0.0)
+			if bestPref is None or pref > bestPref:
+				best, bestPref = h, pref
+		return best
+
+	def solve(self, rounds=3):
+		"""
+		computes the placement
+		:param int rounds: maximal number of improvement rounds after the greedy assignment
+		:return: host name of every element that has candidates
+		:rtype: dict
+		"""
+		order = [el for el in self.elements.itervalues() if el.candidates]
+		# most constrained first, then the most connected ones so that their neighbours follow them
+		order.sort(key=lambda el: (len(el.candidates), -len(el.groups), el.id))
+		for el in order:
+			self._place(el, self._best(el))
+		for _ in xrange(rounds):
+			moved = False
+			for el in order:
+				if len(el.candidates) < 2:
+					continue
+				current = el.host
+				self._place(el, current, -1)
+				host = self._best(el)
+				self._place(el, host)
+				moved = moved or host is not current
+			if not moved:
+				break
+		return dict((el.id, el.host.name) for el in order)
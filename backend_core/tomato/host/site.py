@@ -11,6 +11,8 @@ class Site(Entity, BaseDocument):
 	location = StringField()
 	geolocation = GeoPointField()
 	description = StringField()
+	CHANGE_TYPE = "site"
+	CHANGE_ID = "name"
 	meta = {
 		'ordering': ['organization', 'name'],
 		'indexes': [
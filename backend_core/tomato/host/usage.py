@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# ToMaTo (Topology management software)
+# Copyright (C) 2010 Dennis Schwerdel, University of Kaiserslautern
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+Converts the usage records of a hostmanager into the records that push_usage() of backend_accounting takes:
+{"<num>@<host name>": [(begin, memory, diskspace, traffic, cputime)]} for elements and connections.
+
+accounting_export() of the hostmanager returns one list per field and object, so the record tuples are built with
+zip() instead of looking up every field of every record. The records are pushed in chunks that fit into one RPC
+frame. Chunks are cut in the order of the records' begin, so that the progress can be saved after every chunk and
+a failed push does not make the chunks before it be pushed again. Pages of accounting_export() are limited to
+EXPORT_LIMIT records, so that every page is pushed with one call.
+
+This module does not depend on the database.
+"""
+
+# sslrpc2 frames carry at most 16 MiB, stay well below as payloads are not always compressed
+MAX_PUSH_BYTES = 1 << 23
+
+# msgpack size of a record: array header, integer timestamp and four floats
+RECORD_BYTES = 1 + 5 + 4 * 9
+
+# msgpack size of an object without its id: string and array headers
+OBJECT_BYTES = 8
+
+# records per page of accounting_export(), a page fits into one chunk even if every record is of another object
+EXPORT_LIMIT = MAX_PUSH_BYTES // (RECORD_BYTES + OBJECT_BYTES + 64)
+
+
+def _id(num, hostName):
+	return "%s@%s" % (num, hostName)
+
+
+def fromExport(objects, hostName):
+	"""
+	:param objects: elements or connections as returned by accounting_export(): {num: {field: [value]}}
+	:return: {id: [(begin, memory, diskspace, traffic, cputime)]}
+	"""
+	res = {}
+	for num, columns in objects.iteritems():
+		res[_id(num, hostName)] = zip(map(int, columns["begin"]), columns["memory"], columns["diskspace"],
+			columns["traffic"], columns["cputime"])
+	return res
+
+
+def fromStatistics(objects, hostName):
+	"""
+	:param objects: elements or connections as returned by accounting_statistics(type="single"): {num: [record]}
+	:return: {id: [(begin, memory, diskspace, traffic, cputime)]}
+	"""
+	res = {}
+	for num, records in objects.iteritems():
+		res[_id(num, hostName)] = [(int(rec["begin"]), rec["usage"]["memory"], rec["usage"]["diskspace"],
+			rec["usage"]["traffic"], rec["usage"]["cputime"]) for rec in records]
+	return res
+
+
+def lastBegin(*data):
+	"""
+	:param data: converted records
+	:return: the latest begin of all records, None if there are none
+	"""
+	last = None
+	for objects in data:
+		for records in objects.itervalues():
+			if records:
+				last = max(last, max(rec[0] for rec in records))
+	return last
+
+
+def missing(nums, objects):
+	"""
+	:param nums: nums of the objects the backend knows on the host
+	:param objects: elements or connections as returned by the hostmanager
+	:return: nums without records
+	"""
+	return [num for num in nums if not str(num) in objects]
+
+
+def _size(elements, connections):
+	return sum(OBJECT_BYTES + len(id_) + len(records) * RECORD_BYTES
+		for objects in (elements, connections) for id_, records in objects.iteritems() if records)
+
+
+def chunks(elements, connections, maxBytes=MAX_PUSH_BYTES):
+	"""
+	splits the records into parts of at most maxBytes (as estimated) in the order of their begin. Records with the
+	same begin are never split up, so once a part has been pushed, all records up to its last begin have been.
+	:param elements: converted records of the elements
+	:param connections: converted records of the connections
+	:return: generator of (elements, connections, last begin)
+	"""
+	if _size(elements, connections) <= maxBytes:
+		last = lastBegin(elements, connections)
+		if last is not None:
+			yield (dict((id_, recs) for id_, recs in elements.iteritems() if recs),
+				dict((id_, recs) for id_, recs in connections.iteritems() if recs), last)
+		return
+	records = [(rec[0], index, id_, rec) for index, objects in enumerate((elements, connections))
+		for id_, recs in objects.iteritems() for rec in recs]
+	records.sort(key=lambda entry: entry[0])
+	chunk, size, last = ({}, {}), 0, None
+	for begin, index, id_, rec in records:
+		recSize = RECORD_BYTES if id_ in chunk[index] else OBJECT_BYTES + len(id_) + RECORD_BYTES
+		if size and begin != last and size + recSize > maxBytes:
+			yield chunk + (last,)
+			chunk, size = ({}, {}), 0
+			recSize = OBJECT_BYTES + len(id_) + RECORD_BYTES
+		chunk[index].setdefault(id_, []).append(rec)
+		size += recSize
+		last = begin
+	if size:
+		yield chunk + (last,)
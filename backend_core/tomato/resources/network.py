@@ -18,6 +18,7 @@
 from ..db import *
 from ..generic import *
 from ..host import Host
+from ..host.placement import placementIndex
 from ..lib.error import UserError
 
 class Network(Entity, BaseDocument):
@@ -28,6 +29,8 @@ class Network(Entity, BaseDocument):
 	description = StringField()
 	big_icon = BooleanField(default=False)
 	show_as_common = BooleanField(default=False)
+	CHANGE_TYPE = "network"
+	CHANGE_ID = "kind"
 	meta = {
 		'ordering': ['-preference', 'kind'],
 		'indexes': [
@@ -87,6 +90,7 @@ class NetworkInstance(Entity, BaseDocument):
 	network = ReferenceField(Network, required=True, reverse_delete_rule=CASCADE)
 	host = ReferenceField(Host, required=True, reverse_delete_rule=CASCADE)
 	bridge = StringField(required=True)
+	CHANGE_TYPE = "network_instance"
 	meta = {
 		'collection': 'network_instance',
 		'ordering': ['network', 'host', 'bridge'],
@@ -99,6 +103,16 @@ class NetworkInstance(Entity, BaseDocument):
 		if self.id:
 			self.delete()
 
+	def save(self, *args, **kwargs):
+		res = Entity.save(self, *args, **kwargs)
+		placementIndex.refresh(self.host)
+		return res
+
+	def delete(self, *args, **kwargs):
+		res = Entity.delete(self, *args, **kwargs)
+		placementIndex.refresh(self.host)
+		return res
+
 	ACTIONS = {
 		Entity.REMOVE_ACTION: Action(fn=remove)
 	}
@@ -38,6 +38,7 @@ class Profile(Entity, BaseDocument):
 	ram = IntField(min_value=0)
 	cpus = FloatField(min_value=0)
 	diskspace = IntField(min_value=0)
+	CHANGE_TYPE = "profile"
 	meta = {
 		'ordering': ['tech', '+preference', 'name'],
 		'indexes': [
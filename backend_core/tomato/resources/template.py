@@ -63,6 +63,7 @@ class Template(Entity, BaseDocument):
 	creationDate = FloatField(db_field='creation_date', required=False)
 	hosts = ListField(StringField())
 	icon = StringField()
+	CHANGE_TYPE = "template"
 	meta = {
 		'ordering': ['tech', '+preference', 'name'],
 		'indexes': [
@@ -75,21 +76,12 @@ class Template(Entity, BaseDocument):
 		from ..elements.generic import VMElement
 		return VMElement.objects(template=self)
 
-	def update_host_state(self, host, ready):
-		if not "templateserver_port" in host.hostInfo:
-			return  # old hostmanager
-		if not self.checksum:
-			return
+	def getHostUrl(self, host):
+		"""
+		url of this template on the template server of the host. The host state is updated by Host.synchronizeResources.
+		"""
 		_, checksum = self.checksum.split(":")
-		url = ("http://%s:%d/" + PATTERNS[self.tech]) % (host.address, host.hostInfo["templateserver_port"], checksum)
-		if url in self.host_urls:
-			self.host_urls.remove(url)
-		if host.name in self.hosts:
-			self.hosts.remove(host.name)
-		if ready:
-			self.hosts.append(host.name)
-			self.host_urls.append(url)
-		self.save()
+		return ("http://%s:%d/" + PATTERNS[self.tech]) % (host.address, host.hostInfo["templateserver_port"], checksum)
 
 	@property
 	def all_urls(self):
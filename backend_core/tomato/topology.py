@@ -20,7 +20,7 @@ from .generic import *
 import time
 from lib import logging #@UnresolvedImport
 from . import scheduler
-from .lib.error import UserError #@UnresolvedImport
+from .lib.error import UserError, Error #@UnresolvedImport
 from .lib import util
 from .lib.topology_role import Role
 from .lib.remote_info import get_user_info
@@ -56,6 +56,7 @@ class Topology(Entity, BaseDocument):
 	site = ReferenceField(Site, reverse_delete_rule=NULLIFY)
 	name = StringField()
 	clientData = DictField(db_field='client_data')
+	CHANGE_TYPE = "topology"
 	meta = {
 		'ordering': ['name'],
 		'indexes': [
@@ -102,9 +103,19 @@ class Topology(Entity, BaseDocument):
 				self.clientData[key[1:]] = value
 
 	def action_prepare(self):
-		self._compoundAction(action="prepare", stateFilter=lambda state: state=="created", 
-							 typeOrder=["kvm","kvmqm", "openvz", "repy", "tinc_vpn", "udp_endpoint"],
-							 typesExclude=["kvm_interface", "kvmqm_interface", "openvz_interface", "repy_interface", "external_network", "external_network_endpoint", "fixed_bridge", "bridge"])
+		# place all VMs at once, the elements pick up their planned hosts when they are prepared
+		try:
+			planned = placement.planTopology(self)
+		except:
+			# the elements are placed one by one then
+			wrap_and_handle_current_exception(re_raise=False)
+			planned = []
+		try:
+			self._compoundAction(action="prepare", stateFilter=lambda state: state=="created",
+								 typeOrder=["kvm","kvmqm", "openvz", "repy", "tinc_vpn", "udp_endpoint"],
+								 typesExclude=["kvm_interface", "kvmqm_interface", "openvz_interface", "repy_interface", "external_network", "external_network_endpoint", "fixed_bridge", "bridge"])
+		finally:
+			placement.dropPlans(planned)
 	
 	def action_destroy(self):
 		self.action_stop()
@@ -131,26 +142,95 @@ class Topology(Entity, BaseDocument):
 		self.timeoutStep = TimeoutStep.INITIAL if timeout > topology_config[Config.TOPOLOGY_TIMEOUT_WARNING] else TimeoutStep.WARNED
 		
 	def _compoundAction(self, action, stateFilter, typeOrder, typesExclude):
+		# load elements once, the stages only re-read their states
+		els = list(self.elements)
 		# execute action in order
 		for type_ in typeOrder:
-			for el in self.elements:
-				if el.type != type_ or not stateFilter(el.state) or el.type in typesExclude:
-					continue
-				el.action(action)
+			self._refreshElements(els)
+			self._parallelAction(action, [el for el in els if el.type == type_ and stateFilter(el.state) and not el.type in typesExclude])
 		# execute action on rest
-		for el in self.elements:
-			if not stateFilter(el.state) or el.type in typesExclude or el.type in typeOrder:
-				continue
-			el.action(action)
+		self._refreshElements(els)
+		self._parallelAction(action, [el for el in els if stateFilter(el.state) and not el.type in typesExclude and not el.type in typeOrder])
 		# execute action on connections
 		for con in self.connections:
 			if not stateFilter(con.state) or con.type in typesExclude:
 				continue
 			con.action(action)
 
+	def _refreshElements(self, els):
+		"""
+		reloads the elements that have been changed by actions on other elements, e.g. endpoints of a switch
+		"""
+		states = dict((el["_id"], el["state"]) for el in elements.Element._get_collection().find({"topology": self.id}, {"state": 1}))
+		for el in els:
+			if el.id in states and states[el.id] != el.state:
+				el.reload()
 
+	def _parallelAction(self, action, els):
+		"""
+		executes an action on elements concurrently, elements on the same host are limited by the action concurrency
+		per host. Elements without a known host run one after another, so that select() still sees where the previous
+		ones were placed. Children run after their parents.
+		If actions fail, the first error is raised after all actions have finished, with all errors in its data.
+		"""
+		if not els:
+			return
+		if len(els) == 1:
+			els[0].action(action)
+			return
+		hosts = self._elementHosts(els)
+		byId = dict((el.id, el) for el in els)
+		def depth(el):
+			parent = byId.get(el.getFieldId("parent"))
+			return depth(parent) + 1 if parent else 0
+		levels = {}
+		for el in els:
+			levels.setdefault(depth(el), []).append(el)
+		perHost = settings.get_topology_settings()[Config.TOPOLOGY_ACTION_CONCURRENCY_PER_HOST]
+		errors = []
+		def run(chain):
+			for el in chain:
+				try:
+					el.action(action)
+				except Exception, exc:
+					errors.append((el, exc))
+		for level in sorted(levels.keys()):
+			byHost = {}
+			for el in levels[level]:
+				byHost.setdefault(hosts.get(el.id), []).append(el)
+			calls = []
+			for host, hostEls in byHost.iteritems():
+				chains = min(perHost, len(hostEls)) if host else 1
+				for i in xrange(chains):
+					calls.append(actionPool.submit(run, hostEls[i::chains], key=host))
+			for call in calls:
+				call.get()
+			if errors:
+				break
+		if errors:
+			_, err = errors[0]
+			if len(errors) > 1 and isinstance(err, Error):
+				err.data.update(errors=[{"element": str(el.id), "type": el.type, "error": str(exc)} for el, exc in errors])
+			raise err
 
-
+	def _elementHosts(self, els):
+		"""
+		:return: name of the host of every element, planned hosts for elements that are not prepared yet
+		:rtype: dict
+		"""
+		hostElements = {}
+		for el in els:
+			if "element" in el._fields and el.getFieldId("element"):
+				hostElements[el.getFieldId("element")] = el.id
+		hostIds = {}
+		for hel in HostElement._get_collection().find({"_id": {"$in": hostElements.keys()}}, {"host": 1}):
+			hostIds[hostElements[hel["_id"]]] = hel["host"]
+		names = dict((h["_id"], h["name"]) for h in Host._get_collection().find({"_id": {"$in": list(set(hostIds.values()))}}, {"name": 1}))
+		res = dict((id_, names.get(hostId)) for id_, hostId in hostIds.iteritems())
+		for el in els:
+			if not res.get(el.id):
+				res[el.id] = placement.getPlan(el.id)
+		return res
 
 	def set_role(self, username, role, skip_save=False):
 		"""
@@ -400,3 +480,9 @@ import elements
 from .connections import Connection
 from lib.settings import settings, Config
 from .host.site import Site
+from .host import Host, placement
+from .host.element import HostElement
+from .lib.tasks import ThreadPool
+
+# runs the element actions of compound actions, see Topology._parallelAction()
+actionPool = ThreadPool(threads=settings.get_topology_settings()[Config.TOPOLOGY_ACTION_THREADS])
@@ -1,4 +1,4 @@
-from debug import debug_stats, ping, debug_execute_task, debug_debug_internal_api_call, debug_throw_error
+from debug import debug_stats, debug_scheduler_stats, ping, debug_execute_task, debug_debug_internal_api_call, debug_throw_error
 
 from misc import statistics
 
@@ -6,6 +6,30 @@ from ..lib.exceptionhandling import wrap_and_handle_current_exception
 from ..lib.service import get_backend_users_proxy
 from ..lib.userflags import Flags
 from ..lib import util
+from .. import scheduler
+
+def select_dumps_to_keep(keys):
+	"""
+	select the dumps that are kept when shrinking a group.
+	The first and last 5 dumps are kept under any circumstance, of the others only those with a source or
+	software version that has not been found in a kept dump before.
+	:param list keys: (source, software version) of all dumps of the group, in the order of the group
+	:return: sorted indices of the dumps to keep
+	:rtype: list(int)
+	"""
+	count = len(keys)
+	keep = set(range(5) + range(count-5, count))
+	sources = set()  # sources that have been found in following loop
+	versions = []  # versions that have been found in following loop. these are dicts, so no set here.
+	for i in range(5) + range(count-5, count) + range(5, count-5):  # prioritize those that are kept under any circumstance.
+		source, version = keys[i]
+		if source not in sources:
+			sources.add(source)
+			keep.add(i)
+		if version not in versions:
+			versions.append(version)
+			keep.add(i)
+	return sorted(keep)
 
 class ErrorGroup(BaseDocument):
 	"""
@@ -66,37 +90,20 @@ class ErrorGroup(BaseDocument):
 					raise UserError(code=UserError.UNSUPPORTED_ATTRIBUTE,
 												message="Unsupported attribute for error group", data={'key': k, 'value': v})
 
+	# groups with more dumps than this are shrunk in a worker process
+	SHRINK_IN_PROCESS = 1000
+
 	def shrink(self):
 		with self.lock:
 			oldLen = len(self.dumps)
 			if oldLen <= 10:
 				return
-
-			# first and last 5 dumps are kept under any circumstance.
-			#            first 5          last 5
-			dumps_keep = self.dumps[:5] + self.dumps[-5:]
-			# all except first and last 5
-			toremove = self.dumps[5:-5]
-
-			tokeep = []  # dumps in toremove, that should be kept
-			sources = set()  # sources that have been found in following loop
-			versions = []  # versions that have been found in following loop
-
-			for d in dumps_keep + toremove:  # prioritize those that are kept under any circumstance.
-				keep = False
-				if d.source not in sources:  # this source has not been found in a previous loop cycle
-					sources.add(d.source)
-					keep = True
-				if d.softwareVersion not in versions:  # this version has not been found in a previous loop cycle
-					versions.append(d.softwareVersion)
-					keep = True
-				if keep and (d in toremove):  # source or version haven't been found in previous cycle.
-					# Also make sure that tokeep is a subset of toremove
-					tokeep.append(d)
-
-			#            first 5                   last 5
-			self.dumps = self.dumps[:5] + tokeep + self.dumps[-5:]
-			# before:    self.dumps[:5] + toremove + self.dumps[-5:]
+			keys = [(d.source, d.softwareVersion) for d in self.dumps]
+			if oldLen > self.SHRINK_IN_PROCESS:
+				keep = scheduler.runInProcess(select_dumps_to_keep, keys)
+			else:
+				keep = select_dumps_to_keep(keys)
+			self.dumps = [self.dumps[i] for i in keep]
 			self.removedDumps += oldLen - len(self.dumps)
 
 	def info(self, as_user=None):
@@ -40,6 +40,7 @@ scheduler = tasks.TaskScheduler(maxLateTime=30.0, minWorkers=5, maxWorkers=setti
 starttime = time.time()
 
 from . import db, organization, user, rpcserver #@UnresolvedImport
+from .lib import changes
 
 stopped = threading.Event()
 
@@ -57,6 +58,9 @@ def start():
 	else:
 		print >>sys.stderr, "Skipping migrations"
 	#auth.init()
+	changes_settings = settings.settings.get_change_events_settings()
+	if changes_settings[settings.Config.CHANGE_EVENTS_ENABLED]:
+		changes.init(changes_settings[settings.Config.CHANGE_EVENTS_BUFFER_SIZE])
 	global starttime
 	rpcserver.start()
 	starttime = time.time()
@@ -2,7 +2,7 @@ from auth import user_check_password
 
 from dump import dump_list
 
-from debug import debug_stats, ping, debug_execute_task, debug_debug_internal_api_call, debug_throw_error
+from debug import debug_stats, debug_scheduler_stats, ping, debug_execute_task, debug_debug_internal_api_call, debug_throw_error
 
 from notification import notification_get, notification_list, notification_set_read, notification_set_all_read, \
 	send_message,	broadcast_message, broadcast_message_multifilter
@@ -13,6 +13,6 @@ from organization import organization_remove, organization_modify, organization_
 from user import user_create, user_exists, user_info, user_list, user_modify, user_modify_password,\
 	user_remove, username_list
 
-from misc import statistics
+from misc import statistics, change_events
 
 from hierarchy import object_exists, object_parents, objects_available
@@ -1,4 +1,6 @@
 from ..lib.cache import cached
+from ..lib.settings import settings, Config
+from ..lib import changes
 from ..user import User
 import time
 
@@ -10,3 +12,11 @@ def statistics():
 			'users_active_30days': User.objects.filter(lastLogin__gte = time.time() - 30*24*60*60).count()
 		}
 	}
+
+def change_events(since=0, epoch=None, timeout=0):
+	"""
+	get the changes of objects of this service, see lib/changes.py.
+	Waits up to timeout seconds if there are no changes after since.
+	"""
+	timeout = min(timeout, settings.get_change_events_settings()[Config.CHANGE_EVENTS_POLL_TIMEOUT])
+	return changes.poll(since, epoch, timeout)
@@ -10,6 +10,8 @@ class Organization(Entity, BaseDocument):
 	homepageUrl = URLField(db_field='homepage_url')
 	imageUrl = URLField(db_field='image_url')
 	description = StringField()
+	CHANGE_TYPE = "organization"
+	CHANGE_ID = "name"
 	meta = {
 		'ordering': ['name'],
 		'indexes': [
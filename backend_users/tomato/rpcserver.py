@@ -23,7 +23,7 @@ from . import api
 from .lib import util, sslrpc2, logging, exceptionhandling  #@UnresolvedImport
 from .lib.error import Error, UserError, InternalError
 
-from lib.settings import settings
+from lib.settings import settings, Config
 
 import ssl
 
@@ -53,8 +53,12 @@ def start():
 	def wrapError(error, method, args, kwargs):
 		error = handleError(error, method, args, kwargs)
 		return sslrpc2.Failure(error.raw)
+	server_config = settings.get_rpc_server_settings()
+	server_class = sslrpc2.EventServer if server_config[Config.RPC_TRANSPORT] == Config.RPC_TRANSPORT_EVENTS else sslrpc2.Server
 	for config in settings.get_own_interface_config():
-		server = sslrpc2.Server(('0.0.0.0', config['port']), beforeExecute=logCall, onError=wrapError, keyfile=settings.get_ssl_key_filename(),
+		server = server_class(('0.0.0.0', config['port']), beforeExecute=logCall, onError=wrapError,
+							maxWorkers=server_config[Config.RPC_SERVER_MAX_WORKERS], maxQueue=server_config[Config.RPC_SERVER_MAX_QUEUE],
+							keyfile=settings.get_ssl_key_filename(),
 							certfile=settings.get_ssl_cert_filename(), ca_certs=settings.get_ssl_ca_filename(), cert_reqs=ssl.CERT_REQUIRED)
 		server.registerContainer(api)
 		util.start_thread(server.serve_forever)
@@ -81,6 +81,8 @@ class User(Entity, BaseDocument):
 	clientData = DictField(db_field='client_data')
 	_origin = StringField(db_field="origin")
 	_passwordTime = FloatField(db_field='password_time')
+	CHANGE_TYPE = "user"
+	CHANGE_ID = "name"
 	meta = {
 		'ordering': ['name'],
 		'indexes': [
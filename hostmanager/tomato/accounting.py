@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from django.db import models
+from django.db import models, connection, transaction
 from django.core import exceptions
 import traceback
 import time
@@ -23,7 +23,8 @@ from datetime import datetime, timedelta
 
 from lib import db, attributes, logging #@UnresolvedImport
 from lib.decorators import *
-from . import scheduler
+from lib.newcmd.util import counters
+from . import scheduler, rollup
 
 # storage needs:
 # <100 bytes per record
@@ -40,12 +41,6 @@ KEEP_RECORDS = {
     "year": 5,
 }
 
-def _avg(data, weightSum):
-    return sum([k * v for (k, v) in data]) / weightSum
-        
-def _sum(data, weightSum):
-    return sum(v for (v, _) in  data)
-
 def _lastRange(type_):
     if type_ == "5minutes":
         end = datetime.utcnow().replace(second=0, microsecond=0)
@@ -65,19 +60,6 @@ def _lastRange(type_):
         begin = datetime(end.year - 1, 1, 1)
     return (util.utcDatetimeToTimestamp(begin), util.utcDatetimeToTimestamp(end))        
     
-def _combine(begin, end, records):
-    #calculate coverage
-    measurements = sum([r.measurements for r in records])
-    #combine attributes
-    combined = Usage()
-    if not measurements:
-        return (combined, 0)
-    combined.cputime = _sum([(r.cputime, r.measurements) for r in records], measurements)
-    combined.diskspace = _avg([(r.diskspace, r.measurements) for r in records], measurements)
-    combined.memory = _avg([(r.memory, r.measurements) for r in records], measurements)
-    combined.traffic = _sum([(r.traffic, r.measurements) for r in records], measurements)
-    return (combined, measurements)
-
 class Usage:
     def __init__(self):
         self.cputime = 0.0
@@ -126,14 +108,6 @@ class UsageStatistics(attributes.Mixin, models.Model):
             all_ = all_.filter(begin__lte=before)
         return all_
        
-    def createRecord(self, type_, begin, end, measurements, usage):
-        record = UsageRecord()
-        record.init(self, type_, begin, end, measurements, usage)
-        record.save()
-        self.records.add(record)
-        obj = self._object()
-        logging.logMessage("record", category="accounting", type=type_, begin=begin, end=end, measurements=measurements, object=(obj.__class__.__name__.lower(), obj.id), usage=usage.info())
-       
     def _object(self):
         try:
             if self.element:
@@ -146,46 +120,25 @@ class UsageStatistics(attributes.Mixin, models.Model):
         except exceptions.ObjectDoesNotExist:
             pass
        
-    @db.commit_after
-    def update(self):
+    def measure(self, sample, obj):
+        """
+        measures the usage of the object since the last measurement. The counters in attrs are not saved here but
+        by update(), in the same transaction as the record.
+        :param sample: counters.Sample with the counters of the object
+        :param obj: upcasted element or connection
+        :return: (begin, end, usage)
+        """
         usage = Usage()
         begin = time.time()
-        obj = self._object()
-        if not obj:
-            self.remove()
-            return
-        obj = obj.upcast()
         try:
-            obj.updateUsage(usage, self.attrs)
+            obj.updateUsage(usage, self.attrs, sample)
         except:
             obj.dumpException()
             raise
         end = time.time()
-        self.createRecord("single", begin, end, 1, usage)
-        self._combine()
-        self._removeOld()
-        self.save()
-       
-    def _combine(self):
-        lastType = TYPES[0]
-        for type_ in TYPES[1:]:
-            begin, end = _lastRange(type_)
-            if self.begin > begin:
-                begin = self.begin
-            if self.begin > end:
-                break
-            if self.records.filter(type=type_, begin=begin, end=end).exists():
-                break
-            records = self.records.filter(type=lastType, begin__gte=begin, end__lte=end)
-            usage, coverage = _combine(begin, end, records)
-            self.createRecord(type_, begin, end, coverage, usage)
-            lastType = type_
-            
-    def _removeOld(self):
-        for type_ in TYPES:
-            for r in self.getRecords(type_).order_by("-begin")[KEEP_RECORDS[type_]:]:
-                r.delete()
-    
+        logging.logMessage("record", category="accounting", type=TYPES[0], begin=begin, end=end, measurements=1, object=(obj.__class__.__name__.lower(), obj.id), usage=usage.info())
+        return (begin, end, usage)
+
 class UsageRecord(models.Model):
     statistics = models.ForeignKey(UsageStatistics, related_name="records")
     type = models.CharField(max_length=10, choices=[(t, t) for t in TYPES]) #@ReservedAssignment
@@ -221,13 +174,94 @@ class UsageRecord(models.Model):
             "measurements": self.measurements,
             "usage": {"cputime": self.cputime, "diskspace": self.diskspace, "memory": self.memory, "traffic": self.traffic},
         }
-        
+
+EXPORT_FIELDS = ["begin", "end", "measurements", "memory", "diskspace", "traffic", "cputime"]
+
+def exportRecords(objects, type_, afterId=0, afterBegin=None, limit=10000):
+    """
+    exports usage records as one list per field and object, in the order of their ids
+    :param objects: {statistics id: (kind, object id)} of the objects to export, kind being "elements" or "connections"
+    :param afterId: only records with a greater id are exported
+    :param afterBegin: without afterId, only records that begin after this timestamp are exported. Pages are only
+                       selected by id, since many records begin at the same time and clocks may step back.
+    :param limit: maximal number of records to read, records of other objects count as well
+    :return: dict with elements and connections as {object id: {field: [value]}}, lastId of the last record that has
+             been read, lastBegin of the latest one and more if there might be more records
+    """
+    records = UsageRecord.objects.filter(type=type_, id__gt=afterId)
+    if afterBegin is not None and not afterId:
+        records = records.filter(begin__gt=afterBegin)
+    records = records.order_by("id").values_list("id", "statistics", *EXPORT_FIELDS)[:limit]
+    res = {"elements": {}, "connections": {}, "lastId": afterId, "lastBegin": afterBegin, "more": False}
+    count = 0
+    for row in records.iterator():
+        count += 1
+        # the latest begin is only needed if the ids are reset
+        res["lastId"], res["lastBegin"] = row[0], max(res["lastBegin"], row[2])
+        if not row[1] in objects:
+            continue
+        kind, id_ = objects[row[1]]
+        columns = res[kind].get(id_)
+        if columns is None:
+            columns = res[kind][id_] = dict((field, []) for field in EXPORT_FIELDS)
+        for field, value in zip(EXPORT_FIELDS, row[2:]):
+            columns[field].append(value)
+    res["more"] = count == limit
+    if not count and afterId and (UsageRecord.objects.aggregate(models.Max("id"))["id__max"] or 0) < afterId:
+        # the ids have been reset, e.g. the database has been recreated, continue with the timestamp
+        return exportRecords(objects, type_, 0, afterBegin, limit)
+    return res
+
+# kept open between the updates
+_counterFiles = counters.CounterFiles()
+
 @util.wrap_task
 def update():
+    objects = []
+    pids, ifnames = [], []
     for us in UsageStatistics.objects.all():
         try:
-            us.update()
+            obj = us._object()
+            if not obj:
+                us.remove()
+                continue
+            obj = obj.upcast()
+            objects.append((us, obj))
+            objPids, objIfnames = obj.usageSources()
+            pids.extend(objPids)
+            ifnames.extend(objIfnames)
         except:
             traceback.print_exc()
+    # read the counters of all objects at once, so they are taken at the same time and files are not reopened
+    sample = counters.Sample(_counterFiles)
+    sample.collect(pids, ifnames)
+    records, attrs = [], []
+    attrsField = UsageStatistics._meta.get_field("attrs")
+    for us, obj in objects:
+        try:
+            begin, end, usage = us.measure(sample, obj)
+            records.append((us.id, TYPES[0], begin, end, 1, usage.memory, usage.diskspace, usage.traffic, usage.cputime))
+            attrs.append((attrsField.get_db_prep_save(us.attrs, connection=connection), us.id))
+        except:
+            traceback.print_exc()
+    _counterFiles.expire()
+    _storeRecords(records, attrs)
+
+@transaction.commit_on_success
+def _storeRecords(records, attrs):
+    """
+    stores the single records and counters of all objects, creates the combined records and removes old records,
+    with a few statements for all objects in one transaction. If anything fails, the counters stay at the last stored
+    records, so the usage is accounted in the next update.
+    :param attrs: list of (serialized attrs, statistics id)
+    """
+    cursor = connection.cursor()
+    recordTable, statisticsTable = UsageRecord._meta.db_table, UsageStatistics._meta.db_table
+    rollup.updateAttrs(cursor, statisticsTable, attrs)
+    rollup.insertRecords(cursor, recordTable, records)
+    ranges = dict((type_, _lastRange(type_)) for type_ in TYPES[1:])
+    combined = rollup.combine(cursor, recordTable, statisticsTable, [r[0] for r in records], TYPES, ranges)
+    removed = rollup.removeOld(cursor, recordTable, KEEP_RECORDS)
+    logging.logMessage("records", category="accounting", single=len(records), combined=dict(combined), removed=removed)
         
 scheduler.scheduleRepeated(60, update) #@UndefinedVariable
\ No newline at end of file
@@ -20,6 +20,8 @@ See :doc:`/docs/accountingdata` for documentation of the data type used for
 accounting. 
 """
 
+MAX_EXPORT_RECORDS = 100000
+
 def accounting_statistics(type=None, after=None, before=None): #@ReservedAssignment
     """
     Returns usage statistics for all elements and all connections.
@@ -58,6 +60,75 @@ def accounting_statistics(type=None, after=None, before=None): #@ReservedAssignm
     conSt = dict([(str(con.id), con.getUsageStatistics().info(type, after, before)) for con in connections.getAll(owner=currentUser())])
     return {"elements": elSt, "connections": conSt}
 
+def _decodeCursor(cursor):
+    try:
+        lastId, lastBegin = cursor.split(":", 1)
+        return int(lastId), float(lastBegin)
+    except (AttributeError, ValueError):
+        raise UserError(code=UserError.INVALID_VALUE, message="Invalid cursor", data={"cursor": cursor})
+
+def accounting_export(type="single", cursor=None, after=None, limit=10000): #@ReservedAssignment
+    """
+    Returns usage records of all elements and all connections in a compact 
+    form, one list per field instead of one dict per record, page by page.
+    
+    Parameter *type*:
+      Only usage records of the given type are returned.
+      
+    Parameter *cursor*:
+      The ``cursor`` returned by the last call. If this parameter is set, the
+      records following the ones returned by the last call are returned.
+      The cursor must be treated as an opaque value.
+      If this parameter is omitted, the first records are returned.
+      
+    Parameter *after*:
+      If this parameter is set and *cursor* is omitted, only usage records 
+      with a start date after the given date will be returned. The date must 
+      be given as the number of seconds since the epoch (1970-01-01 00:00:00).
+      
+    Parameter *limit*:
+      The maximal number of records to return in one call, at most 100000.
+      
+    Return value:
+      This method returns a dict with the following keys.
+      
+      ``elements``:
+        A dict with the records of all elements. The keys of the dict are
+        the element ids (as strings) and the values are dicts with the keys
+        ``begin``, ``end``, ``measurements``, ``memory``, ``diskspace``, 
+        ``traffic`` and ``cputime``, each containing a list with the values of 
+        the records in the order of recording. See :doc:`/docs/accountingdata`
+        for the meaning of the fields.
+      
+      ``connections``:
+        A dict with the records of all connections, like ``elements``.
+        
+      ``cursor``:
+        The cursor to get the following records with.
+        
+      ``more``:
+        Whether there might be more records, i.e. the call should be repeated
+        with the new cursor right away.
+    """
+    UserError.check(type in accounting.TYPES, UserError.INVALID_VALUE, "Invalid record type", data={"type": type})
+    if cursor is not None:
+        afterId, afterBegin = _decodeCursor(cursor)
+    else:
+        afterId, afterBegin = 0, after
+    limit = max(1, min(int(limit), MAX_EXPORT_RECORDS))
+    objects = {}
+    for statsId, id_ in Element.objects.filter(owner=currentUser(), usageStatistics__isnull=False).values_list("usageStatistics", "id"):
+        objects[statsId] = ("elements", str(id_))
+    for statsId, id_ in Connection.objects.filter(owner=currentUser(), usageStatistics__isnull=False).values_list("usageStatistics", "id"):
+        objects[statsId] = ("connections", str(id_))
+    res = accounting.exportRecords(objects, type, afterId, afterBegin, limit)
+    return {
+        "elements": res["elements"],
+        "connections": res["connections"],
+        "cursor": "%d:%r" % (res["lastId"], res["lastBegin"] or 0.0),
+        "more": res["more"],
+    }
+
 def accounting_element_statistics(id, type=None, after=None, before=None): #@ReservedAssignment
     """
     Returns accounting statistics for one element.
@@ -120,4 +191,7 @@ def accounting_connection_statistics(id, type=None, after=None, before=None): #@
 
 from elements import _getElement
 from connections import _getConnection
-from .. import currentUser, elements, connections
\ No newline at end of file
+from ..elements import Element
+from ..connections import Connection
+from .. import currentUser, elements, connections, accounting
+from ..lib.error import UserError
\ No newline at end of file
@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 import os
-from ..lib.util import xml_rpc_sanitize #@UnresolvedImport
+from ..lib.util import xml_rpc_sanitize, fingerprint #@UnresolvedImport
 from ..lib.newcmd.util.cache import cached #@UnresolvedImport
 
 def host_info():
@@ -262,6 +262,14 @@ def host_capabilities():
 		"resources": dict([(type_, {}) for type_ in resources.TYPES]),
 	})
 
+@cached(300)
+def host_capabilities_hash():
+	"""
+	Returns a hash of the result of :py:func:`host_capabilities` that changes
+	whenever the capabilities change.
+	"""
+	return fingerprint(host_capabilities())
+
 def host_ping(dst):
 	return net.ping(dst)
 
@@ -277,6 +285,48 @@ def host_networks():
 		res.append(data)
 	return res
 
+def host_sync_bundle(capabilities_hash=None):
+	"""
+	Retrieves everything the backend needs to synchronize a host in one call
+	instead of three.
+	
+	Parameter *capabilities_hash*:
+	  The ``capabilities_hash`` returned by the last call. If the capabilities
+	  did not change since then, they are not sent again.
+	
+	This method returns a dict with the following fields:
+	
+	``info``
+	  The result of :py:func:`host_info`
+	``networks``
+	  The result of :py:func:`host_networks`, or an empty list if the 
+	  networks could not be listed.
+	``capabilities_hash``
+	  The result of :py:func:`host_capabilities_hash`
+	``capabilities``
+	  The result of :py:func:`host_capabilities`, or ``None`` if it has the 
+	  hash given as *capabilities_hash*.
+	"""
+	try:
+		networks = host_networks()
+	except:
+		networks = []
+	caps_hash = host_capabilities_hash()
+	return xml_rpc_sanitize({
+		"info": host_info(),
+		"networks": networks,
+		"capabilities_hash": caps_hash,
+		"capabilities": host_capabilities() if caps_hash != capabilities_hash else None
+	})
+
+
+def host_scheduler_stats():
+	"""
+	Returns statistics of the task scheduler of the hostmanager as described in
+	tasks.TaskScheduler.stats(): per task function histograms of start lateness,
+	duration and CPU time, and worker saturation per minute.
+	"""
+	return xml_rpc_sanitize(scheduler.stats())
 
 def host_server_logs():
 	with open(config.SERVER_LOG_FILE, "rb") as fp:
@@ -284,6 +334,6 @@ def host_server_logs():
 		return fp.read().splitlines()[1:]
 
 
-from .. import dump, elements, connections, resources, config, currentUser
+from .. import dump, elements, connections, resources, config, currentUser, scheduler
 from ..lib.cmd import hostinfo, net, dhcp #@UnresolvedImport
 import time
@@ -152,5 +152,71 @@ def resource_list(type_filter=None):
 	return [r.info() for r in res]
 
 
+SYNC_TYPES = ("network", "template")
+
+def _syncKey(type_, attrs):
+	if type_ == "network":
+		return (type_, attrs.get("bridge"))
+	return (type_, attrs.get("tech"), attrs.get("name"))
+
+def _syncFingerprint(infos):
+	return util.fingerprint(sorted(infos, key=lambda info: (info["type"], info["id"])))
+
+def resource_sync(changes, fingerprint=None):
+	"""
+	Creates or modifies several networks and templates in one call.
+
+	Parameter *changes*:
+	  A list of ``[type, attrs]`` pairs with *type* being ``network`` or
+	  ``template``. Networks are identified by their ``bridge`` attribute,
+	  templates by their ``tech`` and ``name`` attributes. Existing resources
+	  are modified if any of the given attributes differ, all others are
+	  created.
+
+	Parameter *fingerprint*:
+	  The ``fingerprint`` returned by the previous call.
+
+	Return value:
+	  A dict with the following fields:
+
+	``fingerprint``
+	  A hash of all networks and templates after the changes.
+
+	``resources``
+	  If the networks and templates did not match *fingerprint* before the
+	  changes, i.e. they have been changed by someone else in the meantime,
+	  a list of all of them as returned by :py:func:`resource_list`.
+	  Otherwise ``None``.
+
+	Exceptions:
+	  If a change fails, its exception is raised and the following changes
+	  are not applied.
+	"""
+	existing = {}
+	infos = []
+	for res in resources.getAll():
+		if res.type in SYNC_TYPES:
+			info = res.info()
+			existing[_syncKey(res.type, info["attrs"])] = res
+			infos.append(info)
+	unchanged = _syncFingerprint(infos) == fingerprint
+	for type_, attrs in changes:
+		attrs = dict(attrs)
+		UserError.check(type_ in SYNC_TYPES, UserError.UNSUPPORTED_TYPE, "Unsupported resource type for sync", data={"type": type_})
+		res = existing.get(_syncKey(type_, attrs))
+		if res is None:
+			existing[_syncKey(type_, attrs)] = resources.create(type_, attrs)
+		else:
+			current = res.info()["attrs"]
+			if filter(lambda (key, value): current.get(key) != value, attrs.iteritems()):
+				res.modify(attrs)
+	infos = [res.info() for res in existing.values()]
+	return {
+		"fingerprint": _syncFingerprint(infos),
+		"resources": None if unchanged else infos
+	}
+
+
 from .. import resources
-from ..lib.error import UserError
\ No newline at end of file
+from ..lib.error import UserError
+from ..lib import util
\ No newline at end of file
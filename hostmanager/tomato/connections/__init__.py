@@ -310,7 +310,13 @@ class Connection(db.ChangesetMixin, attributes.Mixin, models.Model):
 		from .. import resources #needed to break import cycle
 		resources.give(type_, num, self)
 		
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		"""
+		:return: process ids and interface names whose counters updateUsage() needs, see Element.usageSources()
+		"""
+		return ((), ())
+
+	def updateUsage(self, usage, data, sample):
 		pass
 
 	def tearDown(self):
@@ -20,6 +20,7 @@ from ..lib import cmd #@UnresolvedImport
 from ..lib.attributes import Attr #@UnresolvedImport
 from ..lib.cmd import tc, net, process, path, fileserver #@UnresolvedImport
 from ..lib.error import UserError
+from ..lib.newcmd.util import diskusage
 from ..lib.constants import ActionName,StateName
 
 import os
@@ -354,15 +355,20 @@ class Bridge(connections.Connection):
 		info = connections.Connection.info(self)
 		return info
 	
-	def updateUsage(self, usage, data):
-		if net.bridgeExists(self.bridge):
-			traffic = sum(net.trafficInfo(self.bridge))
+	def usageSources(self):
+		return ((self.capture_pid,), (self.bridge,))
+
+	def updateUsage(self, usage, data, sample):
+		traffic = sample.trafficTotal(self.bridge) if self.bridge else None
+		if traffic is not None:
 			usage.updateContinuous("traffic", traffic, data)
-		if self.capture_pid and process.exists(self.capture_pid):
-			cputime = process.cputime(self.capture_pid)
-			usage.updateContinuous("cputime", cputime, data)
-			usage.memory = process.memory(self.capture_pid)
-		usage.diskspace = path.diskspace(self.dataPath())
+		stats = sample.processStatistics(self.capture_pid) if self.capture_pid else None
+		if stats:
+			usage.updateContinuous("cputime", stats.cputime_total, data)
+			usage.memory = stats.memory_used
+		diskspace = diskusage.getSize(self.dataPath())
+		if diskspace is not None:
+			usage.diskspace = diskspace
 
 if not config.MAINTENANCE:
 	bridgeUtilsVersion = cmd.getDpkgVersion("bridge-utils")
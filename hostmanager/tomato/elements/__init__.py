@@ -339,7 +339,14 @@ class Element(db.ChangesetMixin, attributes.Mixin, models.Model):
 		res['attrs']['rextfv_supported'] = False
 		return res
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		"""
+		:return: process ids and interface names whose counters updateUsage() needs. The counters of all elements
+		         are read in one sweep before updateUsage() is called.
+		"""
+		return ((), ())
+
+	def updateUsage(self, usage, data, sample):
 		pass
 
 
@@ -104,7 +104,7 @@ class External_Network(elements.Element):
 	def bridgeName(self):
 		return self.network.getBridge() if self.network else None
 
-	def updateUsage(self, usage, data):
+	def updateUsage(self, usage, data, sample):
 		pass
 
 elements.TYPES[External_Network.TYPE] = External_Network
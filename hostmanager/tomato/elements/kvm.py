@@ -6,7 +6,7 @@ from ..lib.attributes import Attr #@UnresolvedImport
 from ..lib import cmd #@UnresolvedImport
 from ..lib.cmd import fileserver
 from ..lib.newcmd import virsh, vfat, qemu_img, ipspy
-from ..lib.newcmd.util import io,  net, proc
+from ..lib.newcmd.util import io,  net, proc, diskusage
 from ..lib.error import UserError, InternalError
 from ..lib.util import joinDicts #@UnresolvedImport
 
@@ -393,27 +393,31 @@ class KVM(elements.RexTFVElement,elements.Element):
 	def _imagePath(self, file="disk.qcow2"): #@ReservedAssignment
 		return os.path.join(self._imagePathDir(), file)
 
-	def updateUsage(self, usage, data):
+	def _usagePids(self):
+		try:
+			pid = self.vir.getPid(self.vmid)
+		except virsh.VirshError:
+			return []
+		return [pid] + [p for p in (self.vncpid, self.websocket_pid) if p]
+
+	def usageSources(self):
+		if self.state == StateName.STARTED:
+			return (self._usagePids(), ())
+		return ((), ())
+
+	def updateUsage(self, usage, data, sample):
 		self._checkState()
 		if self.state == StateName.CREATED:
 			return
 		if self.state == StateName.STARTED:
-			memory = 0
-			cputime = 0
-			stats = self.vir.getStatistics(self.vmid)
-			memory += stats.memory_used
-			cputime += stats.cputime_total
-			if self.vncpid and proc.isAlive(self.vncpid):
-				stats = proc.getStatistics(self.vncpid)
-				memory += stats.memory_used
-				cputime += stats.cputime_total
-			if self.websocket_pid and proc.isAlive(self.websocket_pid):
-				stats = proc.getStatistics(self.websocket_pid)
-				memory += stats.memory_used
-				cputime += stats.cputime_total
-			usage.memory = memory
-			usage.updateContinuous("cputime", cputime, data)
-		usage.diskspace = io.getSize(self._imagePathDir())
+			stats = [sample.processStatistics(pid) for pid in self._usagePids()]
+			# without the VM process the values would be incomplete
+			if stats and stats[0]:
+				usage.memory = sum(s.memory_used for s in stats if s)
+				usage.updateContinuous("cputime", sum(s.cputime_total for s in stats if s), data)
+		diskspace = diskusage.getSize(self._imagePathDir())
+		if diskspace is not None:
+			usage.diskspace = diskspace
 
 	"""
 	RexTFV
@@ -603,11 +607,15 @@ class KVM_Interface(elements.Element):
 		info["attrs"]["name"] = "eth%d" % (self.num or 0)
 		return info
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		if self.state == StateName.STARTED:
+			return ((), (self.interfaceName(),))
+		return ((), ())
+
+	def updateUsage(self, usage, data, sample):
 		if self.state == StateName.STARTED:
-			ifname = self.interfaceName()
-			if net.ifaceExists(ifname):
-				traffic = sum(net.trafficInfo(ifname))
+			traffic = sample.trafficTotal(self.interfaceName())
+			if traffic is not None:
 				usage.updateContinuous("traffic", traffic, data)
 
 
@@ -24,6 +24,7 @@ from ..lib import decorators, util, cmd #@UnresolvedImport
 from ..lib.cmd import fileserver, process, net, path, CommandError #@UnresolvedImport
 from ..lib.util import joinDicts #@UnresolvedImport
 from ..lib.error import UserError, InternalError
+from ..lib.newcmd.util import diskusage
 from ..lib.constants import ActionName, StateName, TypeName
 
 DHCP_CMDS = ["[ -e /sbin/dhclient ] && /sbin/dhclient -nw %s",
@@ -613,9 +614,9 @@ class OpenVZ(elements.RexTFVElement,elements.Element):
 					return None
 				return int(fp.readline().split()[1]) * 1024
 		else:
-			path.diskspace(self._imagePath())
+			return diskusage.getSize(self._imagePath())
 		
-	def updateUsage(self, usage, data):
+	def updateUsage(self, usage, data, sample):
 		self._checkState()
 		if self.state == StateName.CREATED:
 			return
@@ -800,10 +801,12 @@ class OpenVZ_Interface(elements.Element):
 		info = elements.Element.info(self)
 		return info
 
-	def updateUsage(self, usage, data):
-		ifname = self.interfaceName()
-		if net.ifaceExists(ifname):
-			traffic = sum(net.trafficInfo(ifname))
+	def usageSources(self):
+		return ((), (self.interfaceName(),))
+
+	def updateUsage(self, usage, data, sample):
+		traffic = sample.trafficTotal(self.interfaceName())
+		if traffic is not None:
 			usage.updateContinuous("traffic", traffic, data)
 			
 OpenVZ_Interface.__doc__ = DOC_IFACE
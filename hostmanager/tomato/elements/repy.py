@@ -23,6 +23,7 @@ from ..lib.attributes import Attr #@UnresolvedImport
 from ..lib import util, cmd #@UnresolvedImport
 from ..lib.cmd import fileserver, process, net, path #@UnresolvedImport
 from ..lib.error import UserError, InternalError
+from ..lib.newcmd.util import diskusage
 from ..lib.constants import ActionName, StateName, TypeName
 
 DOC="""
@@ -338,16 +339,20 @@ class Repy(elements.Element):
 		info["attrs"]["template"] = self.template.upcast().name if self.template else None
 		return info
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		if self.state == StateName.STARTED:
+			return ((self.pid, self.vncpid), ())
+		return ((), ())
+
+	def updateUsage(self, usage, data, sample):
 		self._checkState()
-		usage.diskspace = path.diskspace(self.dataPath())
+		diskspace = diskusage.getSize(self.dataPath())
+		if diskspace is not None:
+			usage.diskspace = diskspace
 		if self.state == StateName.STARTED:
-			usage.memory = process.memory(self.pid)
-			cputime = process.cputime(self.pid)
-			if self.vncpid:
-				usage.memory += process.memory(self.vncpid)
-				cputime += process.cputime(self.vncpid)
-			usage.updateContinuous("cputime", cputime, data)
+			stats = filter(None, [sample.processStatistics(pid) for pid in (self.pid, self.vncpid)])
+			usage.memory = sum(s.memory_used for s in stats)
+			usage.updateContinuous("cputime", sum(s.cputime_total for s in stats), data)
 
 Repy.__doc__ = DOC
 
@@ -433,10 +438,12 @@ class Repy_Interface(elements.Element):
 		info = elements.Element.info(self)
 		return info
 
-	def updateUsage(self, usage, data):
-		ifname = self.interfaceName()
-		if net.ifaceExists(ifname):
-			traffic = sum(net.trafficInfo(ifname))
+	def usageSources(self):
+		return ((), (self.interfaceName(),))
+
+	def updateUsage(self, usage, data, sample):
+		traffic = sample.trafficTotal(self.interfaceName())
+		if traffic is not None:
 			usage.updateContinuous("traffic", traffic, data)
 	
 			
@@ -21,6 +21,7 @@ from ..lib import util, cmd #@UnresolvedImport
 from ..lib.attributes import Attr #@UnresolvedImport
 from ..lib.cmd import process, net, path #@UnresolvedImport
 from ..lib.error import UserError, InternalError
+from ..lib.newcmd.util import diskusage
 from ..lib.constants import ActionName, StateName, TypeName
 
 DOC="""
@@ -222,21 +223,26 @@ class Tinc(elements.Element):
 		with open(pidFile) as fp:
 			return int(fp.readline().strip())
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		if not self.path or self.state == StateName.STARTED:
+			return ((), ())
+		return ((self._getPid(),), (self.interfaceName(),))
+
+	def updateUsage(self, usage, data, sample):
 		if not self.path:
 			return
-		if path.exists(self.path):
-			usage.diskspace = path.diskspace(self.path)
+		diskspace = diskusage.getSize(self.path) if path.exists(self.path) else None
+		if diskspace is not None:
+			usage.diskspace = diskspace
 		if self.state == StateName.STARTED:
 			return
 		pid = self._getPid()
 		if pid:
-			usage.memory = process.memory(pid)
-			cputime = process.cputime(pid)
-			usage.updateContinuous("cputime", cputime, data)
-			trafficA, trafficB = net.trafficInfo(self.interfaceName())
-			if not trafficA is None and not trafficB is None:
-				traffic = trafficA + trafficB
+			stats = sample.processStatistics(pid)
+			usage.memory = stats.memory_used if stats else 0
+			usage.updateContinuous("cputime", stats.cputime_total if stats else 0, data)
+			traffic = sample.trafficTotal(self.interfaceName())
+			if traffic is not None:
 				usage.updateContinuous("traffic", traffic, data)
 			
 if not config.MAINTENANCE:
@@ -156,18 +156,20 @@ class UDP_Tunnel(elements.Element):
 		info = elements.Element.info(self)
 		return info
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		if self.state == StateName.CREATED:
+			return ((), ())
+		return ((self.pid,), (self.interfaceName(),))
+
+	def updateUsage(self, usage, data, sample):
 		self._checkState()
 		if self.state == StateName.CREATED:
 			return
-		usage.memory = process.memory(self.pid)
-		cputime = process.cputime(self.pid)
-		usage.updateContinuous("cputime", cputime, data)
-		try:
-			traffic = sum(net.trafficInfo(self.interfaceName()))
-		except: #Tunnel just quit
-			traffic = 0
-		usage.updateContinuous("traffic", traffic, data)
+		stats = sample.processStatistics(self.pid)
+		usage.memory = stats.memory_used if stats else 0
+		usage.updateContinuous("cputime", stats.cputime_total if stats else 0, data)
+		traffic = sample.trafficTotal(self.interfaceName())
+		usage.updateContinuous("traffic", traffic or 0, data) #Tunnel just quit if None
 
 if not config.MAINTENANCE:
 	socatVersion = cmd.getDpkgVersion("socat")
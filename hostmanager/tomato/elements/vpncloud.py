@@ -101,14 +101,18 @@ class VpnCloud(elements.Element):
 	def upcast(self):
 		return self
 
-	def updateUsage(self, usage, data):
+	def usageSources(self):
+		if not self.pid:
+			return ((), ())
+		return ((self.pid,), (self.interfaceName(),))
+
+	def updateUsage(self, usage, data, sample):
 		if self.pid:
-			usage.memory = process.memory(self.pid)
-			cputime = process.cputime(self.pid)
-			usage.updateContinuous("cputime", cputime, data)
-			trafficA, trafficB = net.trafficInfo(self.interfaceName())
-			if not trafficA is None and not trafficB is None:
-				traffic = trafficA + trafficB
+			stats = sample.processStatistics(self.pid)
+			usage.memory = stats.memory_used if stats else 0
+			usage.updateContinuous("cputime", stats.cputime_total if stats else 0, data)
+			traffic = sample.trafficTotal(self.interfaceName())
+			if traffic is not None:
 				usage.updateContinuous("traffic", traffic, data)
 			
 if not config.MAINTENANCE:
@@ -0,0 +1 @@
+../../../../../shared/lib/newcmd/util/counters.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../../../shared/lib/newcmd/util/diskusage.py
\ No newline at end of file
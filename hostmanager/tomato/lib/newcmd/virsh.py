@@ -300,6 +300,12 @@ class virsh:
 			pid = self._getPid(vmid)
 			return proc.getStatistics(pid)
 
+	def getPid(self, vmid):
+		"""
+		:return: process id of a running VM, without waiting for the VM lock
+		"""
+		return self._getPid(vmid)
+
 	def _getPid(self, vmid):
 		try:
 			with open("/var/run/libvirt/qemu/vm_%d.pid" % vmid) as fp:
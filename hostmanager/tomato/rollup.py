@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# ToMaTo (Topology management software)
+# Copyright (C) 2010 Dennis Schwerdel, University of Kaiserslautern
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Set-based SQL for the usage records of all elements and connections, used by accounting.update().
+
+Instead of a few queries per object and record type, every step is one statement for all objects: storing the
+counters of the objects, inserting the new single records, creating the records of every combined type from the
+records of the type below, and removing old records. The functions take a DB-API cursor with %s parameters (as Django
+cursors have) and do not depend on Django, so they can be benchmarked on their own.
+
+Combined records sum up measurements, cputime and traffic of the records of the type below, memory and diskspace are
+averaged weighted by measurements.
+"""
+
+RECORD_COLUMNS = ("statistics_id", "type", "begin", "end", "measurements", "memory", "diskspace", "traffic", "cputime")
+
+IDS_PER_STATEMENT = 500
+
+
+def _chunks(ids):
+	ids = list(ids)
+	for i in xrange(0, len(ids), IDS_PER_STATEMENT):
+		yield ids[i:i+IDS_PER_STATEMENT]
+
+
+def updateAttrs(cursor, statisticsTable, attrs):
+	"""
+	stores the counters of the statistics
+	:param attrs: list of (serialized attrs, statistics id)
+	"""
+	if not attrs:
+		return
+	cursor.executemany('UPDATE ' + statisticsTable + ' SET attrs = %s WHERE id = %s', attrs)
+
+
+def insertRecords(cursor, recordTable, records):
+	"""
+	inserts records
+	:param records: list of tuples with the values of RECORD_COLUMNS
+	"""
+	if not records:
+		return
+	cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (recordTable, ", ".join('"%s"' % c for c in RECORD_COLUMNS),
+		", ".join(["%s"] * len(RECORD_COLUMNS))), records)
+
+
+def combine(cursor, recordTable, statisticsTable, ids, types, ranges):
+	"""
+	creates the combined records of the last finished range of every type.
+	Like before, an object only gets a record of a type if it got one of the type below in this run, the range has
+	started after the object was created and the record does not exist yet.
+	:param ids: ids of the statistics that got new single records
+	:param types: record types, the first one being the single measurements
+	:param ranges: {type: (begin, end)} of the last finished range of each combined type
+	:return: [(type, number of created records)]
+	"""
+	created = []
+	lastType = types[0]
+	for type_ in types[1:]:
+		if not ids:
+			break
+		begin, end = ranges[type_]
+		params = {"type": type_, "lastType": lastType, "begin": begin, "end": end}
+		# the range begins when the object was created, if that was later
+		rangeBegin = 'CASE WHEN s."begin" > %(begin)s THEN s."begin" ELSE %(begin)s END'
+		nextIds = []
+		for chunk in _chunks(ids):
+			cursor.execute(('SELECT s.id FROM ' + statisticsTable + ' s WHERE s.id IN (' +
+				", ".join(str(int(id_)) for id_ in chunk) + ') AND s."begin" <= %(end)s AND NOT EXISTS ('
+				'SELECT 1 FROM ' + recordTable + ' e WHERE e.statistics_id = s.id AND e.type = %(type)s '
+				'AND e."begin" = ' + rangeBegin + ' AND e."end" = %(end)s)'), params)
+			nextIds.extend(row[0] for row in cursor.fetchall())
+		for chunk in _chunks(nextIds):
+			cursor.execute(('INSERT INTO ' + recordTable + ' (' + ", ".join('"%s"' % c for c in RECORD_COLUMNS) + ') '
+				'SELECT s.id, %(type)s, ' + rangeBegin + ', %(end)s, '
+				'COALESCE(SUM(r.measurements), 0), '
+				'COALESCE(SUM(r.memory * r.measurements) / NULLIF(SUM(r.measurements), 0), 0), '
+				'COALESCE(SUM(r.diskspace * r.measurements) / NULLIF(SUM(r.measurements), 0), 0), '
+				'COALESCE(SUM(r.traffic), 0), COALESCE(SUM(r.cputime), 0) '
+				'FROM ' + statisticsTable + ' s LEFT JOIN ' + recordTable + ' r ON r.statistics_id = s.id '
+				'AND r.type = %(lastType)s AND r."begin" >= ' + rangeBegin + ' AND r."end" <= %(end)s '
+				'WHERE s.id IN (' + ", ".join(str(int(id_)) for id_ in chunk) + ') '
+				'GROUP BY s.id, s."begin"'), params)
+		created.append((type_, len(nextIds)))
+		ids = nextIds
+		lastType = type_
+	return created
+
+
+def removeOld(cursor, recordTable, keep):
+	"""
+	removes all but the newest records of every object, one statement per type
+	:param keep: {type: number of records to keep}
+	:return: number of removed records
+	"""
+	removed = 0
+	for type_, count in keep.iteritems():
+		cursor.execute('DELETE FROM ' + recordTable + ' WHERE id IN (SELECT id FROM ('
+			'SELECT id, ROW_NUMBER() OVER (PARTITION BY statistics_id ORDER BY "begin" DESC) AS n '
+			'FROM ' + recordTable + ' WHERE type = %s) ranked WHERE n > %s)', [type_, count])
+		removed += max(cursor.rowcount, 0)
+	return removed
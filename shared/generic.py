@@ -1,6 +1,6 @@
 import threading
 from .lib.error import UserError as Error
-from .lib import schema
+from .lib import schema, changes
 
 class Action(object):
 	__slots__ = ("fn", "description", "checkFn", "paramSchema")
@@ -90,8 +90,11 @@ class Entity(object):
 	DEFAULT_ATTRIBUTES = {}
 	REMOVE_ACTION = "(remove)"
 
-	save = id = delete = None
-	del save, id, delete
+	CHANGE_TYPE = None # type of the change events published when this is saved or removed, None to publish no events
+	CHANGE_ID = "idStr" # attribute used as id in the change events
+
+	id = None
+	del id
 
 	@property
 	def type(self):
@@ -113,6 +116,20 @@ class Entity(object):
 	def onError(self, exc):
 		pass
 
+	def publishChange(self):
+		if self.CHANGE_TYPE:
+			changes.publish(self.CHANGE_TYPE, getattr(self, self.CHANGE_ID))
+
+	def save(self, *args, **kwargs):
+		res = super(Entity, self).save(*args, **kwargs)
+		self.publishChange()
+		return res
+
+	def delete(self, *args, **kwargs):
+		res = super(Entity, self).delete(*args, **kwargs)
+		self.publishChange()
+		return res
+
 	def modify(self, **attrs):
 		ATTRIBUTES = self.ATTRIBUTES
 		for key, value in attrs.items():
@@ -15,7 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-import time, sys, threading
+import time, sys, threading, weakref
+from collections import OrderedDict
 
 class CacheUpdater:
 	caches = []
@@ -31,30 +32,134 @@ class CacheUpdater:
 			cache.update_all()
 cache_updater = None
 
+_caches = weakref.WeakValueDictionary() #{name:Cache}, all named caches for info()
+
+def estimateSize(value, _depth=0):
+	"""
+	Roughly estimates the memory used by a value, including nested containers.
+	Shared objects are counted every time they are referenced, so the result is an upper bound.
+	:param value: value to estimate
+	:return: estimated size in bytes
+	"""
+	size = sys.getsizeof(value)
+	if _depth > 10:
+		return size
+	if isinstance(value, dict):
+		for k, v in value.iteritems():
+			size += estimateSize(k, _depth+1) + estimateSize(v, _depth+1)
+	elif isinstance(value, (list, tuple, set, frozenset)):
+		for v in value:
+			size += estimateSize(v, _depth+1)
+	return size
+
+class _Load:
+	"""
+	A running call of the cached function for one key. Concurrent callers for
+	the same key wait for it instead of calling the function themselves.
+	"""
+	def __init__(self):
+		self._done = threading.Event()
+		self.value = None
+		self.error = None
+
+	def finish(self, value=None, error=None):
+		self.value = value
+		self.error = error
+		self._done.set()
+
+	def wait(self):
+		self._done.wait()
+		if self.error is not None:
+			raise self.error
+		return self.value
+
+
 class Cache:
-	def __init__(self, fn=None, maxSize=100, timeout=None, autoupdate=False):
-		self._values={} #{key:{value, timeout, auto_timeout, args, kwargs}}
-		self._order=[]  #[key]
+	def __init__(self, fn=None, maxSize=100, timeout=None, autoupdate=False, staleWhileRevalidate=None, maxBytes=None, name=None):
+		"""
+		:param staleWhileRevalidate: number of seconds after the timeout during which the old value
+		                             is still returned while a background call refreshes it
+		:param maxBytes: if set, least recently used entries are evicted when the estimated size of all values exceeds this
+		:param name: name under which this cache is listed in info()
+		"""
+		self._values=OrderedDict() #{key:{value, timeout, auto_timeout, args, kwargs, size}}, least recently used first
+		self._loading={} #{key:_Load}
+		self._generation = 0 #incremented on removals, so running loads do not store outdated values
 		self._maxSize=maxSize
+		self._maxBytes=maxBytes
+		self._bytes = 0
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
 		self._timeout=timeout
+		self._staleWhileRevalidate = staleWhileRevalidate
 		self._fn = fn
 		self._lock = threading.RLock()
 		self._autoupdate = autoupdate
 		self._autoupdate_registered = not self._autoupdate # registration for auto-updates will be checked when a value is set.
 															# this is false iff this cache needs to be added to the auto updater.
+		if name:
+			_caches[name] = self
 	@staticmethod
 	def getKey(args, kwargs):
 		return (tuple(args), tuple(kwargs.items()))
 	def get(self, args, kwargs):
 		key = Cache.getKey(args, kwargs)
 		with self._lock:
-			if (not key in self._values) or (self._values[key]['timeout'] <= time.time()):
-				self.update(args, kwargs)
-			return self._values[Cache.getKey(args, kwargs)]['value']
-	def update(self, args, kwargs):
+			entry = self._values.get(key)
+			if entry:
+				now = time.time()
+				if entry['timeout'] > now:
+					self._hits += 1
+					self._values[key] = self._values.pop(key) #mark as most recently used
+					return entry['value']
+				if self._staleWhileRevalidate and entry['timeout'] + self._staleWhileRevalidate > now:
+					self._hits += 1
+					self._values[key] = self._values.pop(key)
+					if key not in self._loading:
+						load = self._loading[key] = _Load()
+						thread = threading.Thread(target=self._load, args=(key, load, args, kwargs, True))
+						thread.daemon = True
+						thread.start()
+					return entry['value']
+			self._misses += 1
+			load = self._loading.get(key)
+			owner = load is None
+			if owner:
+				load = self._loading[key] = _Load()
+		# the lock must not be held while loading, so that other keys are not blocked
+		if owner:
+			return self._load(key, load, args, kwargs)
+		return load.wait()
+	def _load(self, key, load, args, kwargs, background=False):
+		with self._lock:
+			generation = self._generation
 		calltime = time.time()
-		value = self._fn(*args, **kwargs) #there may be concurrent method calls here. set() will resolve this.
-		self.set(args, kwargs, value, calltime=calltime)
+		value, error = None, None
+		try:
+			value = self._fn(*args, **kwargs)
+			with self._lock:
+				if generation == self._generation:
+					self.set(args, kwargs, value, calltime=calltime)
+			return value
+		except BaseException, exc:
+			# also SystemExit and the like, waiting callers must never be left blocked
+			error = exc
+			if background and isinstance(exc, Exception):
+				return
+			raise
+		finally:
+			with self._lock:
+				del self._loading[key]
+			load.finish(value=value, error=error)
+	def update(self, args, kwargs):
+		key = Cache.getKey(args, kwargs)
+		with self._lock:
+			if key in self._loading:
+				# someone else is already loading this key
+				return
+			load = self._loading[key] = _Load()
+		self._load(key, load, args, kwargs)
 	def set(self, args, kwargs, value, calltime=None):
 		key = Cache.getKey(args, kwargs)
 		if calltime is None:
@@ -69,23 +174,31 @@ class Cache:
 				if self._values[key]['timeout'] > timeout:
 					return
 			
-			#clear oldest entry if cache is full
-			if len(self._order) >= self._maxSize:
-				delkey = self._order.pop(0)
-				del self._values[delkey]
-				
-			#make sure that this key is not in _order (it may only be once in there)
+			size = estimateSize(value) if self._maxBytes else 0
+			if self._maxBytes and size > self._maxBytes:
+				# too large to be cached, but the old value must not be served anymore either
+				if key in self._values:
+					self._bytes -= self._values.pop(key)['size']
+				return
+
+			#make sure that this key is not in _values (it may only be once in there)
 			if key in self._values:
-				self._order.remove(key)
-				
+				self._bytes -= self._values.pop(key)['size']
+
+			#evict least recently used entries if cache is full
+			while self._values and (len(self._values) >= self._maxSize or (self._maxBytes and self._bytes + size > self._maxBytes)):
+				self._bytes -= self._values.popitem(last=False)[1]['size']
+				self._evictions += 1
+
 			#save
-			self._order.append(key)
+			self._bytes += size
 			self._values[key] = {'value':value,
 								 'timeout':timeout,
 								 'auto_timeout':auto_timeout,
 								 'args':args,
-								 'kwargs':kwargs}
-			
+								 'kwargs':kwargs,
+								 'size':size}
+
 			#finally, register this cache for auto-update if needed.
 			if not self._autoupdate_registered:
 				if cache_updater is not None:
@@ -93,29 +206,55 @@ class Cache:
 					self._autoupdate_registered = True
 	def remove(self, args, kwargs):
 		with self._lock:
+			self._generation += 1
 			key = Cache.getKey(args, kwargs)
-			del self._values[key]
-			self._order.remove(key)
+			self._bytes -= self._values.pop(key)['size']
+	def peek(self, args, kwargs):
+		"""
+		:return: the cached value, even if it has timed out, or None if there is none. Never calls the function.
+		"""
+		with self._lock:
+			entry = self._values.get(Cache.getKey(args, kwargs))
+			return entry['value'] if entry else None
+	def setTimeout(self, timeout):
+		"""
+		change the timeout of values that are set from now on.
+		"""
+		with self._lock:
+			self._timeout = timeout
 	def contains(self, args, kwargs):
 		with self._lock:
 			return Cache.getKey(args, kwargs) in self._values
 	def clear(self):
 		with self._lock:
-			self._values = {}
-			self._order = []
+			self._generation += 1
+			self._values = OrderedDict()
+			self._bytes = 0
+	def info(self):
+		with self._lock:
+			return {
+				"entries": len(self._values),
+				"bytes": self._bytes,
+				"max_size": self._maxSize,
+				"max_bytes": self._maxBytes,
+				"hits": self._hits,
+				"misses": self._misses,
+				"evictions": self._evictions,
+				"loading": len(self._loading)
+			}
 	def update_all(self):
 		if self._autoupdate:
-			for key in list(self._order): #since maxsize is bounded, this is not a scaling problem.
+			for key in list(self._values): #since maxsize is bounded, this is not a scaling problem.
 				with self._lock: #release the lock between all cycles to allow other threads to step in between two iterations.
 								#    This function can only change the order of entries, but does not delete any.
 								# Concurrent calls may remove the first entries of the list. In this case, this function should ignore these entries.
 								#    However, there is only a really slight chance that this happens, and it doesn't lead to inconsistency.
 								#	 This only means there is no guarantee that the key is still in the list when entering the lock.
 								#        Conclusion: only do something if the key is still cached.
-					if key in self._values:
-						res = self._values[key]
-						if res['auto_timeout'] <= time.time():
-							self.update(res['args'], res['kwargs'])
+					res = self._values.get(key)
+				# update() must be called without the lock, it only blocks callers of this key
+				if res and res['auto_timeout'] <= time.time():
+					self.update(res['args'], res['kwargs'])
 		
 		
 	
@@ -126,6 +265,12 @@ class CachedMethod:
 		return self._cache.get(args, kwargs)
 	def invalidate(self):
 		self._cache.clear()
+	def peek(self, *args, **kwargs):
+		return self._cache.peek(args, kwargs)
+	def setTimeout(self, timeout):
+		self._cache.setTimeout(timeout)
+	def info(self):
+		return self._cache.info()
 
 
 def invalidates(cachedFn):
@@ -143,11 +288,12 @@ def invalidates(cachedFn):
 	return wrap
 
 	
-def cached(timeout=None, maxSize=100, autoupdate=False):
+def cached(timeout=None, maxSize=100, autoupdate=False, staleWhileRevalidate=None, maxBytes=None):
 	if maxSize is None:
 		maxSize = 10000
 	def wrap(fn):
-		_cache = Cache(fn=fn, timeout=timeout, maxSize=maxSize, autoupdate=autoupdate)
+		_cache = Cache(fn=fn, timeout=timeout, maxSize=maxSize, autoupdate=autoupdate, staleWhileRevalidate=staleWhileRevalidate,
+		               maxBytes=maxBytes, name="%s.%s" % (fn.__module__, fn.__name__))
 		call = CachedMethod(_cache)
 		call.__name__ = fn.__name__
 		call.__doc__ = fn.__doc__
@@ -159,4 +305,10 @@ def init():
 	global cache_updater
 	cache_updater = CacheUpdater()
 	cache_updater.start_updating(5*60) #refresh every five minutes. For most caches, this usually means iterating through a list without doing anything.
-	
\ No newline at end of file
+	
+
+def info():
+	"""
+	:return: statistics of all named caches, i.e. all caches created by cached()
+	"""
+	return {name: c.info() for name, c in _caches.items()}
@@ -0,0 +1,139 @@
+"""
+Change events between ToMaTo services.
+
+Services that own data (backend_core, backend_users) publish an event whenever
+an object is saved or removed. Other services subscribe to these events and
+invalidate their cached info about exactly these objects, instead of relying
+on short cache timeouts.
+
+Events are fetched by long polling over the normal sslrpc2 connection:
+the subscriber calls change_events(since, epoch, timeout), which returns as
+soon as there are events newer than since. An event is a tuple
+(type, id, version), the version being the sequence number of the event.
+"""
+
+import threading, time, uuid
+from collections import deque
+
+class ChangeLog:
+	"""
+	Holds the most recent change events of this service.
+	"""
+	def __init__(self, size=10000):
+		self._events = deque(maxlen=size) #[(version, type, id)]
+		self._version = 0
+		self._epoch = uuid.uuid4().hex # changes when the service is restarted, subscribers then know they missed events
+		self._condition = threading.Condition()
+
+	def publish(self, type_, id_):
+		"""
+		record a change of an object.
+		:param str type_: type of the object as used by remote_info (e.g. "element", "host", "user")
+		:param str id_: id of the object as used by remote_info (e.g. element id, host name, user name)
+		:return: version of this change
+		"""
+		with self._condition:
+			self._version += 1
+			self._events.append((self._version, type_, id_))
+			self._condition.notify_all()
+			return self._version
+
+	def poll(self, since=0, epoch=None, timeout=0):
+		"""
+		get all events after a given version. waits for new events if there are none yet.
+		:param int since: last version the caller has seen
+		:param str epoch: epoch returned by the previous call
+		:param timeout: maximum number of seconds to wait for new events
+		:return: dict with epoch, version (pass as since in the next call), events (list of (type, id, version)),
+		         and complete. If complete is false, events may have been missed and the caller must invalidate everything.
+		:rtype: dict
+		"""
+		with self._condition:
+			complete = epoch == self._epoch and (not self._events or since >= self._events[0][0] - 1)
+			if complete and since >= self._version and timeout:
+				self._condition.wait(timeout)
+			if complete:
+				events = [(type_, id_, version) for version, type_, id_ in self._events if version > since]
+			else:
+				events = []
+			return {
+				"epoch": self._epoch,
+				"version": self._version,
+				"events": events,
+				"complete": complete
+			}
+
+
+class ChangeSubscriber:
+	"""
+	Fetches change events from another service in a thread and hands them to a callback.
+	"""
+	def __init__(self, fetch, onChange, onReset, pollTimeout=20, retryInterval=5):
+		"""
+		:param fetch: function (since, epoch, timeout) returning the result of ChangeLog.poll of the other service
+		:param onChange: function (type, id) called for every event
+		:param onReset: function () called when events may have been missed, i.e. on the first call,
+		                after the other service has been restarted, and while it is not reachable
+		"""
+		self.fetch = fetch
+		self.onChange = onChange
+		self.onReset = onReset
+		self.pollTimeout = pollTimeout
+		self.retryInterval = retryInterval
+		self.epoch = None
+		self.version = 0
+		self.running = False
+
+	def poll(self):
+		res = self.fetch(self.version, self.epoch, self.pollTimeout)
+		if not res['complete']:
+			self.onReset()
+		for type_, id_, _ in res['events']:
+			self.onChange(type_, id_)
+		self.epoch = res['epoch']
+		self.version = res['version']
+
+	def run(self):
+		while self.running:
+			try:
+				self.poll()
+				if self.epoch is None:
+					# the other service does not record events
+					time.sleep(self.retryInterval)
+			except Exception:
+				# cached info can not be trusted while the other service is not reachable
+				self.epoch = None
+				self.onReset()
+				time.sleep(self.retryInterval)
+
+	def start(self):
+		self.running = True
+		thread = threading.Thread(target=self.run)
+		thread.daemon = True
+		thread.start()
+
+	def stop(self):
+		self.running = False
+
+
+_changeLog = None
+
+def publish(type_, id_):
+	"""
+	publish a change event of this service. Does nothing if change events are disabled.
+	"""
+	if _changeLog is not None:
+		_changeLog.publish(type_, id_)
+
+def poll(since=0, epoch=None, timeout=0):
+	if _changeLog is None:
+		# no events are recorded, so subscribers can never be sure to be up to date
+		return {"epoch": None, "version": 0, "events": [], "complete": False}
+	return _changeLog.poll(since, epoch, timeout)
+
+def init(size=10000):
+	"""
+	start recording change events of this service.
+	"""
+	global _changeLog
+	_changeLog = ChangeLog(size)
@@ -380,6 +380,13 @@ def createScreenshot(vmid, filename):
 
 Statistics = proc.Statistics
 
+@_public
+def getPid(vmid):
+	"""
+	:return: process id of a running VM, without waiting for the VM lock
+	"""
+	return _getPid(vmid)
+
 @_public
 def getStatistics(vmid):
 	with locks[vmid]:
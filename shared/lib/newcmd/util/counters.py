@@ -0,0 +1,142 @@
+"""
+Reads process and network interface counters of many elements in one sweep.
+
+The files in /proc and /sys are kept open between sweeps and re-read from the
+beginning (lseek + read, Python 2 has no pread), which returns current values
+for both procfs and sysfs. So a sweep costs two syscalls per counter file
+instead of open, read and close plus the path lookups.
+"""
+
+import os, errno
+
+from . import proc
+
+
+class CounterFiles(object):
+	"""
+	Open counter files, shared by all sweeps.
+	"""
+	def __init__(self, maxFiles=500):
+		"""
+		:param maxFiles: files that are kept open at most, more files are read the usual way
+		"""
+		self.maxFiles = maxFiles
+		self.files = {} #{path: fd}
+		self.used = set()
+
+	def _close(self, path):
+		fd = self.files.pop(path, None)
+		if fd is not None:
+			os.close(fd)
+
+	def _readFd(self, fd):
+		os.lseek(fd, 0, os.SEEK_SET)
+		return os.read(fd, 4096)
+
+	def read(self, path):
+		"""
+		:return: content of the file or None if it does not exist (anymore)
+		"""
+		self.used.add(path)
+		fd = self.files.get(path)
+		if fd is not None:
+			try:
+				return self._readFd(fd)
+			except OSError:
+				# the process ended or the interface has been removed, the path might exist again
+				self._close(path)
+		try:
+			fd = os.open(path, os.O_RDONLY)
+		except OSError, err:
+			if err.errno in (errno.ENOENT, errno.ESRCH, errno.ENODEV):
+				return None
+			raise
+		try:
+			data = self._readFd(fd)
+		except OSError:
+			os.close(fd)
+			return None
+		if len(self.files) < self.maxFiles:
+			self.files[path] = fd
+		else:
+			os.close(fd)
+		return data
+
+	def expire(self):
+		"""
+		closes all files that have not been read since the last call
+		"""
+		for path in self.files.keys():
+			if not path in self.used:
+				self._close(path)
+		self.used = set()
+
+	def close(self):
+		for path in self.files.keys():
+			self._close(path)
+
+
+class Sample(object):
+	"""
+	Counters read in one sweep. Counters that have not been collected are read when they are requested.
+	"""
+	def __init__(self, files):
+		self.files = files
+		self.processes = {} #{pid: proc.Statistics or None}
+		self.traffic = {} #{ifname: (rx, tx)}
+
+	def _readProcess(self, pid):
+		data = self.files.read("/proc/%d/stat" % pid)
+		if not data:
+			return None
+		# the name of the process may contain spaces
+		stats = data[data.rfind(")")+2:].split()
+		cputime = sum(map(int, stats[11:15]))/proc.jiffiesPerSecond()
+		memory = int(stats[21]) * 4096
+		return proc.Statistics(cputime_total=cputime, memory_used=memory)
+
+	def _readTraffic(self, ifname):
+		rx = self.files.read("/sys/class/net/%s/statistics/rx_bytes" % ifname)
+		tx = self.files.read("/sys/class/net/%s/statistics/tx_bytes" % ifname)
+		if rx is None or tx is None:
+			return (None, None)
+		return (int(rx), int(tx))
+
+	def collect(self, pids=(), ifnames=()):
+		"""
+		reads the counters of the given processes and interfaces
+		"""
+		for pid in pids:
+			if pid and not pid in self.processes:
+				self.processes[pid] = self._readProcess(pid)
+		for ifname in ifnames:
+			if ifname and not ifname in self.traffic:
+				self.traffic[ifname] = self._readTraffic(ifname)
+
+	def processStatistics(self, pid):
+		"""
+		:return: cpu time and memory of a process, None if the process does not exist
+		:rtype: proc.Statistics
+		"""
+		if not pid:
+			return None
+		if not pid in self.processes:
+			self.collect(pids=[pid])
+		return self.processes[pid]
+
+	def trafficInfo(self, ifname):
+		"""
+		:return: received and sent bytes of an interface, (None, None) if the interface does not exist
+		"""
+		if not ifname:
+			return (None, None)
+		if not ifname in self.traffic:
+			self.collect(ifnames=[ifname])
+		return self.traffic[ifname]
+
+	def trafficTotal(self, ifname):
+		"""
+		:return: received plus sent bytes of an interface, None if the interface does not exist
+		"""
+		rx, tx = self.trafficInfo(ifname)
+		return None if rx is None else rx + tx
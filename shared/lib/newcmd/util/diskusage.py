@@ -0,0 +1,146 @@
+"""
+Disk usage of directory trees for the accounting, without walking them on every call.
+
+getSize() returns the last known size immediately and refreshes it in a background thread, also the first walk of
+a tree is done there, so the size is unknown (None) until it has finished. Trees are refreshed
+after minInterval at the earliest and, if walking them is expensive, only after costFactor times the duration of
+the last walk, so walking large trees (e.g. containers with millions of files) takes a bounded share of the time.
+Sizes are the allocated blocks (st_blocks) of all files, hard-linked files are counted once, like du does.
+Trees that have not been requested for a while are forgotten.
+"""
+
+import os, stat, threading, time
+
+
+class _Tree(object):
+	__slots__ = ("size", "updated", "duration", "requested", "queued")
+
+	def __init__(self):
+		self.size = None
+		self.updated = 0.0
+		self.duration = 0.0
+		self.requested = time.time()
+		self.queued = False
+
+
+def walk(path):
+	"""
+	:return: allocated bytes of all files and directories below path
+	"""
+	total = 0
+	seen = set()
+	try:
+		st = os.lstat(path)
+	except OSError:
+		return 0
+	stack = [(path, st)]
+	while stack:
+		path, st = stack.pop()
+		total += st.st_blocks * 512
+		if not stat.S_ISDIR(st.st_mode):
+			continue
+		try:
+			names = os.listdir(path)
+		except OSError:
+			continue
+		for name in names:
+			child = os.path.join(path, name)
+			try:
+				st = os.lstat(child)
+			except OSError:
+				# removed in the meantime
+				continue
+			if stat.S_ISDIR(st.st_mode):
+				stack.append((child, st))
+				continue
+			if st.st_nlink > 1:
+				if (st.st_dev, st.st_ino) in seen:
+					continue
+				seen.add((st.st_dev, st.st_ino))
+			total += st.st_blocks * 512
+	return total
+
+
+class DiskUsage(object):
+	def __init__(self, minInterval=60.0, costFactor=20.0, forgetAfter=3600.0):
+		self.minInterval = minInterval
+		self.costFactor = costFactor
+		self.forgetAfter = forgetAfter
+		self.trees = {} #{path: _Tree}
+		self.queue = []
+		self.lock = threading.Condition()
+		self.thread = None
+
+	def get(self, path):
+		"""
+		:return: the last known size of a tree in bytes, 0 if it does not exist. None until the first walk of the tree
+				 has finished, it is queued by the first call for the tree.
+		"""
+		now = time.time()
+		with self.lock:
+			tree = self.trees.get(path)
+			if tree is None:
+				tree = self.trees[path] = _Tree()
+			tree.requested = now
+			if not tree.queued and now - tree.updated >= max(self.minInterval, self.costFactor * tree.duration):
+				tree.queued = True
+				self.queue.append(path)
+				self._startThread()
+			return tree.size
+
+	def forget(self, path):
+		with self.lock:
+			self.trees.pop(path, None)
+
+	def _refresh(self, path, tree):
+		start = time.time()
+		size = walk(path)
+		with self.lock:
+			tree.size = size
+			tree.updated = time.time()
+			tree.duration = tree.updated - start
+			tree.queued = False
+
+	def _startThread(self):
+		if self.thread:
+			self.lock.notify()
+			return
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _run(self):
+		# one walk at a time, so that refreshes do not compete for the disks
+		while True:
+			with self.lock:
+				while not self.queue:
+					self.lock.wait(60.0)
+					self._expire()
+				path = self.queue.pop(0)
+				tree = self.trees.get(path)
+			if tree:
+				self._refresh(path, tree)
+
+	def _expire(self):
+		now = time.time()
+		for path, tree in self.trees.items():
+			if now - tree.requested > self.forgetAfter and not tree.queued:
+				del self.trees[path]
+
+	def info(self):
+		with self.lock:
+			return {
+				"trees": len(self.trees),
+				"queued": len(self.queue),
+				"walk_time": sum(tree.duration for tree in self.trees.itervalues()),
+			}
+
+
+_diskUsage = DiskUsage()
+
+def getSize(path):
+	"""
+	:return: disk usage of a directory tree in bytes, possibly up to a few minutes old for large trees, None if it is
+			 not known yet
+	"""
+	return _diskUsage.get(path)
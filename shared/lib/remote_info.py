@@ -1,5 +1,7 @@
 from error import InternalError, UserError
-from service import get_backend_users_proxy, get_backend_core_proxy, get_backend_accounting_proxy
+from service import get_backend_users_proxy, get_backend_core_proxy, get_backend_accounting_proxy, get_tomato_inner_proxy
+from settings import settings, Config
+from changes import ChangeSubscriber
 from cache import cached
 from hierarchy import ClassName
 import topology_role
@@ -71,11 +73,12 @@ class InfoObj(ExistenceCheck):
 	When creating a subclass, override _fetch_info, _modify, _remove
 	You should override invalidate_list() to invalidate the cached list funciton, if there is one.
 	"""
-	__slots__ = ("_info",)
+	__slots__ = ("_info", "_generation")
 
 	def __init__(self):
 		super(InfoObj, self).__init__()
 		self._info = None
+		self._generation = 0 #incremented on invalidation, so running fetches do not store outdated info
 
 	def invalidate_info(self):
 		"""
@@ -84,6 +87,7 @@ class InfoObj(ExistenceCheck):
 		:return:
 		"""
 		self._info = None
+		self._generation += 1
 		self.invalidate_exists()
 		self.invalidate_list()
 
@@ -138,15 +142,42 @@ class InfoObj(ExistenceCheck):
 		:rtype: dict
 		"""
 		if fetch or update or (self._info is None):
-			info = self._fetch_info(fetch)
+			generation = self._generation
 			# otherwise, fetch_data would have thrown an error
-			# use super function to avoid invalidating the list here.
-			super(InfoObj, self).set_exists(True)
-			if fetch:
-				self.invalidate_list()
-			self._info = info
+			info = self._fetch_info(fetch)
+			if not self._set_fetched_info(info, fetch, generation):
+				# the info has been invalidated while fetching, it is not cached but still the best there is
+				return info
 		return self._info
 
+	def _set_fetched_info(self, info, fetch=False, generation=None):
+		"""
+		store info that has been fetched from the server.
+		:param dict info: server info
+		:param bool fetch: whether the server was told to update remote info.
+		:param int generation: value of _generation before fetching, the info is dropped if it has been invalidated since
+		:return: whether the info has been stored
+		:rtype: bool
+		"""
+		if generation is not None and generation != self._generation:
+			return False
+		# use super function to avoid invalidating the list here.
+		super(InfoObj, self).set_exists(True)
+		if fetch:
+			self.invalidate_list()
+		self._info = info
+		return True
+
+	def _batch_fetch_info(self, batch, fetch=False):
+		"""
+		add the call that fetches info from the server to a batch. Do not modify any fields here!
+		Override this to support prefetch_info.
+		:param batch: batch of the proxy that is used by _fetch_info
+		:param fetch: if true, force the server to update remote info.
+		:return: the batch call
+		"""
+		raise InternalError(code=InternalError.UNKNOWN, message="this function should have been overridden", data={'function': '%s._batch_fetch_info' % repr(self.__class__)})
+
 	def modify(self, attrs):
 		"""
 		call corresponding modify function. update info.
@@ -612,6 +643,9 @@ class ElementInfo(ActionObj):
 	def _fetch_info(self, fetch=False):
 		return get_backend_core_proxy().element_info(self.eid, fetch=fetch)
 
+	def _batch_fetch_info(self, batch, fetch=False):
+		return batch.element_info(self.eid, fetch=fetch)
+
 	def _modify(self, attrs):
 		return get_backend_core_proxy().element_modify(self.eid, attrs)
 
@@ -665,6 +699,9 @@ class ConnectionInfo(ActionObj):
 	def _fetch_info(self, fetch=False):
 		return get_backend_core_proxy().connection_info(self.cid, fetch=fetch)
 
+	def _batch_fetch_info(self, batch, fetch=False):
+		return batch.connection_info(self.cid, fetch=fetch)
+
 	def _modify(self, attrs):
 		return get_backend_core_proxy().connection_modify(self.cid, attrs)
 
@@ -924,6 +961,52 @@ def get_connection_info(connection_id):
 	"""
 	return ConnectionInfo(connection_id)
 
+def prefetch_info(info_objs, proxy, fetch=False):
+	"""
+	fetch the info of many InfoObj objects in a single round trip.
+	objects which already hold info are skipped unless fetch is set.
+	errors are ignored here, they will come up again when calling info() on the respective object.
+	:param list(InfoObj) info_objs: objects whose info is fetched by the given proxy
+	:param proxy: proxy used by the objects' _fetch_info
+	:param bool fetch: force the server to update remote info.
+	:return: None
+	"""
+	missing = [obj for obj in info_objs if fetch or obj._info is None]
+	if not missing:
+		return
+	generations = [obj._generation for obj in missing]
+	with proxy.batch() as batch:
+		calls = [(obj, obj._batch_fetch_info(batch, fetch)) for obj in missing]
+	for (obj, call), generation in zip(calls, generations):
+		try:
+			obj._set_fetched_info(call.get(), fetch, generation)
+		except Exception:
+			pass
+
+def get_element_info_list(element_ids, fetch=False):
+	"""
+	return ElementInfo objects for many elements, with their info fetched in a single round trip.
+	:param list(str) element_ids: ids of the target elements
+	:param bool fetch: force the server to update remote info.
+	:return: ElementInfo objects in the order of element_ids
+	:rtype: list(ElementInfo)
+	"""
+	infos = [get_element_info(element_id) for element_id in element_ids]
+	prefetch_info(infos, get_backend_core_proxy(), fetch)
+	return infos
+
+def get_connection_info_list(connection_ids, fetch=False):
+	"""
+	return ConnectionInfo objects for many connections, with their info fetched in a single round trip.
+	:param list(str) connection_ids: ids of the target connections
+	:param bool fetch: force the server to update remote info.
+	:return: ConnectionInfo objects in the order of connection_ids
+	:rtype: list(ConnectionInfo)
+	"""
+	infos = [get_connection_info(connection_id) for connection_id in connection_ids]
+	prefetch_info(infos, get_backend_core_proxy(), fetch)
+	return infos
+
 @cached(1800)
 def get_template_info(template_id):
 	"""
@@ -1044,3 +1127,91 @@ def get_network_instance_list(network=None, host=None):
 	:rtype: list(dict)
 	"""
 	return get_backend_core_proxy().network_instance_list(network, host)
+
+
+# change events of other services
+
+# change type: (service, info function, list functions to invalidate)
+_CHANGE_TYPES = {
+	"user": (Config.TOMATO_MODULE_BACKEND_USERS, get_user_info, [get_user_list]),
+	"organization": (Config.TOMATO_MODULE_BACKEND_USERS, get_organization_info, [get_organization_list]),
+	"topology": (Config.TOMATO_MODULE_BACKEND_CORE, get_topology_info, [get_topology_list]),
+	"element": (Config.TOMATO_MODULE_BACKEND_CORE, get_element_info, [get_topology_list]),
+	"connection": (Config.TOMATO_MODULE_BACKEND_CORE, get_connection_info, [get_topology_list]),
+	"site": (Config.TOMATO_MODULE_BACKEND_CORE, get_site_info, [get_site_list]),
+	"host": (Config.TOMATO_MODULE_BACKEND_CORE, get_host_info, [get_host_list]),
+	"template": (Config.TOMATO_MODULE_BACKEND_CORE, get_template_info, [get_template_list, _template_id]),
+	"profile": (Config.TOMATO_MODULE_BACKEND_CORE, get_profile_info, [get_profile_list, _profile_id]),
+	"network": (Config.TOMATO_MODULE_BACKEND_CORE, get_network_info, [get_network_list]),
+	"network_instance": (Config.TOMATO_MODULE_BACKEND_CORE, get_network_instance_info, [get_network_instance_list]),
+}
+
+# timeouts used while change events are received. They only limit the damage of missed events.
+_SUBSCRIBED_TIMEOUTS = {
+	get_user_info: 600,
+	get_user_list: 600,
+	get_topology_info: 300,
+	get_topology_list: 60,
+	get_host_info: 300,
+	get_host_list: 60,
+	get_template_list: 600,
+	get_profile_list: 600,
+}
+
+def invalidate_changed(type_, id_):
+	"""
+	invalidate cached info about an object that has been changed by another service.
+	Unlike InfoObj.invalidate_info(), this never fetches info from the server.
+	:param str type_: object type as published by the other service
+	:param str id_: object id as used by the respective get_*_info function
+	:return: None
+	"""
+	if not type_ in _CHANGE_TYPES:
+		return
+	_, get_info, lists = _CHANGE_TYPES[type_]
+	obj = get_info.peek(id_)
+	if obj is not None:
+		if obj._info is None:
+			# invalidate_info() of some objects needs info to find related objects. there is nothing cached here anyway,
+			# but a running fetch must not store what it has read before the change.
+			obj._exists = None
+			obj._generation += 1
+		else:
+			obj.invalidate_info()
+	for list_fn in lists:
+		list_fn.invalidate()
+
+def invalidate_all(tomato_module=None):
+	"""
+	invalidate all cached info about objects of a service, e.g. when change events may have been missed.
+	:param str tomato_module: service, None for all services
+	:return: None
+	"""
+	for module, get_info, lists in _CHANGE_TYPES.values():
+		if tomato_module in (None, module):
+			get_info.invalidate()
+			for list_fn in lists:
+				list_fn.invalidate()
+
+def subscribe_changes(tomato_module):
+	"""
+	receive change events of another service and invalidate cached info accordingly.
+	While subscribed, cached info is kept longer.
+	:param str tomato_module: service to subscribe to
+	:return: subscriber or None if change events are disabled
+	:rtype: ChangeSubscriber
+	"""
+	conf = settings.get_change_events_settings()
+	if not conf[Config.CHANGE_EVENTS_ENABLED]:
+		return None
+	def fetch(since, epoch, timeout):
+		return get_tomato_inner_proxy(tomato_module).change_events(since, epoch, timeout)
+	subscriber = ChangeSubscriber(fetch, invalidate_changed, lambda: invalidate_all(tomato_module),
+	                              pollTimeout=conf[Config.CHANGE_EVENTS_POLL_TIMEOUT])
+	subscriber.start()
+	for module, get_info, lists in _CHANGE_TYPES.values():
+		if module == tomato_module:
+			for fn in [get_info] + lists:
+				if fn in _SUBSCRIBED_TIMEOUTS:
+					fn.setTimeout(_SUBSCRIBED_TIMEOUTS[fn])
+	return subscriber
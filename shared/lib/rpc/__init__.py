@@ -4,6 +4,7 @@ from xmlrpclib import Fault
 from ..error import TransportError, Error, InternalError, UserError
 from .. import util
 from . import xmlrpc, sslrpc
+from .xmlrpc import ConnectionPool
 
 def unwrapXmlRpcError(err):
 	if not isinstance(err, Fault):
@@ -27,19 +28,29 @@ def unwrapXmlRpcError(err):
 	else:
 		return InternalError(code=InternalError.UNKNOWN, message=err.faultString, module="hostmanager")
 
+def isUnknownMethodError(err):
+	"""
+	:return: whether err is the error of a call to a method that the server does not have, e.g. an older hostmanager
+	"""
+	if isinstance(err, TransportError):
+		return err.code == "%s.unknown_method" % sslrpc.RPCError.Category.METHOD
+	return isinstance(err, InternalError) and err.module == "hostmanager" and err.message == "No such method!"
+
 def isReusable(proxy):
 	if isinstance(proxy, xmlrpc.ServerProxy):
-		return False
+		return proxy._reusable
 	if isinstance(proxy, sslrpc.RPCProxy):
 		return True
 	return True
 
-def createXmlRpcProxy(url, sslcert, sslkey, timeout):
+def createXmlRpcProxy(url, sslcert, sslkey, timeout, sslca=None, pool=None):
 	schema, address = url.split(":", 1)
 	schema, _ = schema.split("+")
 	if address.startswith("//"):
 		address = address[2:]
-	if schema == "https":
+	if schema == "https" and pool:
+		transport = xmlrpc.PooledTransport(pool, sslkey, sslcert, sslca, timeout=timeout)
+	elif schema == "https":
 		transport = xmlrpc.SafeTransportWithCerts(sslkey, sslcert, timeout=timeout)
 	else:
 		transport = None
@@ -62,12 +73,15 @@ def createJsonRpcProxy(address, sslcert, sslkey, sslca, timeout):
 	port = int(port)
 	return sslrpc.RPCProxy((address, port), timeout=timeout, certfile=sslcert, keyfile=sslkey, ca_certs=sslca, onError=unwrapJsonRpcError)
 
-def createProxy(url, sslcert, sslkey, sslca, timeout=60):
+def createProxy(url, sslcert, sslkey, sslca, timeout=60, pool=None):
+	"""
+	:param pool: ConnectionPool to take https+xmlrpc connections from, the proxy is reusable then
+	"""
 	if not ":" in url:
 		raise TransportError(code=TransportError.INVALID_URL, message="invalid url: %s" % url)
 	schema, address = url.split(":", 1)
 	if schema == "http+xmlrpc" or schema == "https+xmlrpc":
-		return createXmlRpcProxy(url, sslcert, sslkey, timeout)
+		return createXmlRpcProxy(url, sslcert, sslkey, timeout, sslca, pool)
 	elif schema == "ssl+jsonrpc":
 		return createJsonRpcProxy(address, sslcert, sslkey, sslca, timeout)
 	else:
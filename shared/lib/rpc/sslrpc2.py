@@ -1,4 +1,14 @@
-import ssl, socket, SocketServer, inspect, threading, thread, sys, msgpack, snappy
+import ssl, socket, SocketServer, inspect, threading, thread, sys, os, time, select, errno, fcntl, heapq, weakref, collections, Queue, struct, zlib, msgpack, snappy
+
+try:
+	import zstd
+except ImportError:
+	zstd = None
+
+try:
+	import lz4.block as lz4
+except ImportError:
+	lz4 = None
 
 if msgpack.version < (0, 4, 0):
 	print >>sys.stderr, "Warning: Older msgpack-python versions are broken"
@@ -52,33 +62,122 @@ class SSLServer(SocketServer.TCPServer):
 			raise exc
 
 
-class SSLConnection:
-	def __init__(self, server_address, timeout=60, **sslargs):
-		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.socket = ssl.wrap_socket(self.socket, **sslargs)
-		self.socket.connect(server_address)
-		self.socket.settimeout(timeout)
-		self.rfile = self.socket.makefile('rb', -1)
-		self.wfile = self.socket.makefile('wb', 0)
+class FramedStream:
+	"""
+	Mixin for connections that read and write frames directly on self.socket.
+
+	Reads are done with recv_into into buffers that are reused for all frames of
+	the connection, so payloads are not copied into intermediate strings.
+	Only one thread may read from a connection at a time.
+	"""
+	# Payloads up to this size are received into the reusable buffer, larger ones get their own buffer
+	MAX_REUSED_BUFFER = 1 << 20
+	# Payloads up to this size are sent together with the header in a single write
+	MAX_JOINED_WRITE = 1 << 16
+
+	def _initFraming(self, compression=None):
+		self._header = bytearray(4)
+		self._buffer = bytearray(4096)
+		self.compression = compression or CompressionPolicy()
+		# Codecs the peer is known to understand, extended by negotiateCodecs()
+		self.codecs = set(Message.DEFAULT_CODECS)
+
+	def readInto(self, view):
+		size = len(view)
+		pos = 0
+		try:
+			while pos < size:
+				count = self.socket.recv_into(view[pos:], size - pos)
+				if not count:
+					raise ConnectionEnded()
+				pos += count
+		except:
+			raise NetworkError(NetworkError.ReadError)
 
-	def read(self, size):
+	def getBuffer(self, size):
+		if size > self.MAX_REUSED_BUFFER:
+			return bytearray(size)
+		if len(self._buffer) < size:
+			self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+		return self._buffer
+
+	def readPayload(self, size):
+		"""
+		Receives size bytes and returns them as a read-only buffer object that is only valid until the next read.
+		"""
+		buf = self.getBuffer(size)
+		self.readInto(memoryview(buf)[:size])
+		return buffer(buf, 0, size)
+
+	def readHeader(self):
+		self.readInto(memoryview(self._header))
+		return self._header
+
+	def readIdle(self):
+		"""
+		Like readHeader() but returns None if the socket timeout expires before any data arrived.
+		This is safe for the frame header since the peer sends it together with the body, so
+		it can not be received partially.
+		"""
 		try:
-			data = self.rfile.read(size)
-			if len(data) < size:
-				raise ConnectionEnded()
-			return data
+			count = self.socket.recv_into(self._header, 4)
+		except socket.timeout:
+			return None
+		except ssl.SSLError as err:
+			if "timed out" in str(err):
+				return None
+			raise NetworkError(NetworkError.ReadError)
 		except:
 			raise NetworkError(NetworkError.ReadError)
+		if not count:
+			raise NetworkError(NetworkError.ReadError)
+		if count < 4:
+			self.readInto(memoryview(self._header)[count:])
+		return self._header
+
+	def read(self, size):
+		data = bytearray(size)
+		self.readInto(memoryview(data))
+		return str(data)
 
 	def write(self, data):
 		try:
-			self.wfile.write(data)
+			self.socket.sendall(data)
 		except:
 			raise NetworkError(NetworkError.WriteError)
 
+	def writeFrame(self, header, payload):
+		# TLS sockets do not support vectored writes, so small frames are joined and
+		# large payloads are written directly after the header to avoid copying them
+		if len(payload) <= self.MAX_JOINED_WRITE:
+			self.write(header + payload)
+		else:
+			self.write(header)
+			self.write(payload)
+
+
+class SSLConnection(FramedStream):
+	def __init__(self, server_address, timeout=60, compression=None, **sslargs):
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		# frames are written in one piece, waiting for more data only delays them
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.socket = ssl.wrap_socket(self.socket, **sslargs)
+		self.socket.connect(server_address)
+		self.socket.settimeout(timeout)
+		self._initFraming(compression)
+
+	def negotiateCodecs(self):
+		"""
+		Tells the server which codecs are available here and uses the ones it supports as well.
+		Must be called before any other message is sent on this connection.
+		Servers without codec negotiation answer with NoSuchMethod, the default codecs are kept then.
+		"""
+		Request(0, "$codecs$", [sorted(AVAILABLE_CODECS)], {}).writeTo(self)
+		reply = Reply.readFrom(self)
+		if reply.result == Reply.Result.Success and isinstance(reply.value, (list, tuple)):
+			self.codecs = (set(reply.value) & AVAILABLE_CODECS) | set(Message.DEFAULT_CODECS)
+
 	def close(self):
-		self.rfile.close()
-		self.wfile.close()
 		self.socket.close()
 
 
@@ -145,6 +244,9 @@ class TimedOut(Exception):
 	def __init__(self):
 		pass
 
+	def __str__(self):
+		return "Call timed out"
+
 
 class Failure(Exception):
 	def __init__(self, data):
@@ -158,46 +260,245 @@ class Message:
 	def encode(self):
 		raise NotImplementedError()
 
+	def compressionKey(self):
+		return None
+
 	class Encoding:
 		Raw = 0
 		Snappy = 1
-
-	def writeTo(self, con):
-		bytes = msgpack.packb(self.encode())
-		method = Message.Encoding.Raw
-		if len(bytes) > 100:
-			compressed = snappy.compress(bytes)
-			if len(compressed) < len(bytes):
-				bytes = compressed
-				method = Message.Encoding.Snappy
+		Zlib = 2
+		Zstd = 3
+		Lz4 = 4
+
+	# Every peer understands these, all others have to be negotiated
+	DEFAULT_CODECS = (Encoding.Raw, Encoding.Snappy)
+
+	# Raw payloads are decoded in chunks of this size
+	STREAM_CHUNK_SIZE = 1 << 16
+
+	def encodeFrame(self, compression, codecs, key=None):
+		"""
+		:return: a tuple of the frame header and the payload
+		"""
+		if key is None:
+			key = self.compressionKey()
+		method, bytes = compression.compress(msgpack.packb(self.encode()), key, codecs)
 		size = len(bytes)
-		con.write(chr(method) + chr(size>>16) + chr((size>>8) & 0xff) + chr(size & 0xff) + bytes)
+		if size >= 1<<24:
+			raise FramingError(FramingError.MessageTooLarge)
+		return struct.pack(">I", (method << 24) | size), bytes
+
+	def writeTo(self, con, key=None):
+		con.writeFrame(*self.encodeFrame(con.compression, con.codecs, key))
+
+	@staticmethod
+	def _unpackStream(con, size):
+		# Feeding the unpacker chunk by chunk lets it parse while receiving, so the
+		# payload never has to be held as a whole
+		unpacker = msgpack.Unpacker()
+		chunk = memoryview(con.getBuffer(min(size, Message.STREAM_CHUNK_SIZE)))
+		data = None
+		complete = False
+		left = size
+		try:
+			while left:
+				count = min(left, len(chunk))
+				con.readInto(chunk[:count])
+				left -= count
+				unpacker.feed(chunk[:count])
+				if not complete:
+					try:
+						data = unpacker.unpack()
+						complete = True
+					except msgpack.OutOfData:
+						pass
+			if not complete:
+				raise FramingError(FramingError.InvalidFormatedData)
+			unpacker.skip()
+		except msgpack.OutOfData:
+			# no extra data after the message
+			return data
+		except (msgpack.UnpackException, ValueError):
+			raise FramingError(FramingError.InvalidFormatedData)
+		raise FramingError(FramingError.InvalidFormatedData)
 
 	@classmethod
-	def readFrom(cls, con):
-		header = con.read(4)
-		method = ord(header[0])
-		size = (ord(header[1]) << 16) + (ord(header[2]) << 8) + (ord(header[3]))
-		bytes = con.read(size)
+	def readFrom(cls, con, header=None):
+		if header is None:
+			header = con.readHeader()
+		method = header[0]
+		size = (header[1] << 16) + (header[2] << 8) + header[3]
 		if method == Message.Encoding.Raw:
-			pass
-		elif method == Message.Encoding.Snappy:
-			try:
-				bytes = snappy.uncompress(bytes)
-			except snappy.UncompressError:
-				raise FramingError(FramingError.InvalidCompressedData)
-			size = len(bytes)
-			if size >= 1<<24:
-				raise FramingError(FramingError.MessageTooLarge)
+			data = cls._unpackStream(con, size)
+			con.compression.received(size, size)
+			return cls.decode(data)
+		return cls.decodeFrame(method, con.readPayload(size), con.compression)
+
+	@classmethod
+	def decodeFrame(cls, method, payload, compression):
+		"""
+		Decodes a message from a completely received frame payload.
+		"""
+		if method == Message.Encoding.Raw:
+			bytes = payload
+			compression.received(len(payload), len(payload))
 		else:
-			raise FramingError(FramingError.UnknownEncoding)
+			bytes = compression.decompress(method, payload)
 		try:
 			data = msgpack.unpackb(bytes)
-		except msgpack.UnpackException:
+		except (msgpack.UnpackException, ValueError):
 			raise FramingError(FramingError.InvalidFormatedData)
 		return cls.decode(data)
 
 
+def _zlibDecompress(data):
+	decompressor = zlib.decompressobj()
+	bytes = decompressor.decompress(data, 1<<24)
+	if decompressor.unconsumed_tail:
+		raise FramingError(FramingError.MessageTooLarge)
+	return bytes
+
+
+# encoding: (name, compress, decompress)
+CODECS = {
+	Message.Encoding.Snappy: ("snappy", snappy.compress, snappy.uncompress),
+	Message.Encoding.Zlib: ("zlib", lambda data: zlib.compress(data, 3), _zlibDecompress),
+}
+if zstd:
+	CODECS[Message.Encoding.Zstd] = ("zstd", lambda data: zstd.compress(data, 3), zstd.decompress)
+if lz4:
+	CODECS[Message.Encoding.Lz4] = ("lz4", lz4.compress, lz4.decompress)
+
+AVAILABLE_CODECS = set(CODECS.keys() + [Message.Encoding.Raw])
+
+
+class _MethodCompression(object):
+	__slots__ = ("messages", "rawBytes", "wireBytes", "ratio", "skip")
+
+	def __init__(self):
+		self.messages = 0
+		self.rawBytes = 0
+		self.wireBytes = 0
+		self.ratio = None
+		self.skip = 0
+
+	def info(self):
+		return {
+			"messages": self.messages,
+			"raw_bytes": self.rawBytes,
+			"wire_bytes": self.wireBytes,
+			"ratio": self.ratio,
+			"skipping": self.skip > 0
+		}
+
+
+class CompressionPolicy:
+	"""
+	Chooses the codec for outgoing messages and counts raw and wire bytes.
+
+	Small messages are sent uncompressed, medium ones with the fastest codec and
+	large ones with the strongest codec the peer supports. The compression ratio
+	is tracked per key (the method name); when it gets poor, the next SKIP_MESSAGES
+	messages of that key are sent uncompressed before compression is tried again.
+	"""
+	MIN_SIZE = 100
+	LARGE_SIZE = 1 << 16
+	POOR_RATIO = 0.9
+	SKIP_MESSAGES = 32
+	# weight of the latest message in the moving average of the ratio
+	RATIO_WEIGHT = 0.25
+	FAST_CODECS = (Message.Encoding.Lz4, Message.Encoding.Snappy)
+	STRONG_CODECS = (Message.Encoding.Zstd, Message.Encoding.Zlib, Message.Encoding.Snappy)
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._methods = {}
+		self._sent = [0, 0, 0]
+		self._received = [0, 0, 0]
+		self._encodings = {}
+
+	def choose(self, key, size, codecs):
+		if size <= self.MIN_SIZE:
+			return Message.Encoding.Raw
+		with self._lock:
+			stats = self._methods.get(key)
+			if stats and stats.skip > 0:
+				stats.skip -= 1
+				return Message.Encoding.Raw
+		for method in (self.STRONG_CODECS if size >= self.LARGE_SIZE else self.FAST_CODECS):
+			if method in codecs and method in CODECS:
+				return method
+		return Message.Encoding.Raw
+
+	def compress(self, bytes, key, codecs):
+		"""
+		:return: a tuple of the encoding and the data to send
+		"""
+		rawSize = len(bytes)
+		method = self.choose(key, rawSize, codecs)
+		ratio = None
+		if method != Message.Encoding.Raw:
+			compressed = CODECS[method][1](bytes)
+			ratio = float(len(compressed)) / rawSize
+			if len(compressed) < rawSize:
+				bytes = compressed
+			else:
+				method = Message.Encoding.Raw
+		self._record(key, method, rawSize, len(bytes), ratio)
+		return method, bytes
+
+	def decompress(self, method, data):
+		if method not in CODECS:
+			raise FramingError(FramingError.UnknownEncoding)
+		try:
+			bytes = CODECS[method][2](data)
+		except FramingError:
+			raise
+		except Exception:
+			raise FramingError(FramingError.InvalidCompressedData)
+		if len(bytes) >= 1<<24:
+			raise FramingError(FramingError.MessageTooLarge)
+		self.received(len(bytes), len(data))
+		return bytes
+
+	def _record(self, key, method, rawSize, wireSize, ratio):
+		with self._lock:
+			self._sent[0] += 1
+			self._sent[1] += rawSize
+			self._sent[2] += wireSize
+			self._encodings[method] = self._encodings.get(method, 0) + 1
+			stats = self._methods.get(key)
+			if not stats:
+				stats = self._methods[key] = _MethodCompression()
+			stats.messages += 1
+			stats.rawBytes += rawSize
+			stats.wireBytes += wireSize
+			if ratio is not None:
+				if stats.ratio is None:
+					stats.ratio = ratio
+				else:
+					stats.ratio += (ratio - stats.ratio) * self.RATIO_WEIGHT
+				if stats.ratio >= self.POOR_RATIO:
+					stats.skip = self.SKIP_MESSAGES
+
+	def received(self, rawSize, wireSize):
+		with self._lock:
+			self._received[0] += 1
+			self._received[1] += rawSize
+			self._received[2] += wireSize
+
+	def info(self):
+		names = dict([(method, codec[0]) for (method, codec) in CODECS.iteritems()])
+		names[Message.Encoding.Raw] = "raw"
+		with self._lock:
+			return {
+				"sent": dict(zip(("messages", "raw_bytes", "wire_bytes"), self._sent)),
+				"received": dict(zip(("messages", "raw_bytes", "wire_bytes"), self._received)),
+				"encodings": dict([(names.get(method, method), count) for (method, count) in self._encodings.iteritems()]),
+				"methods": dict([(str(key), stats.info()) for (key, stats) in self._methods.iteritems()])
+			}
+
+
 class Request(Message, object):
 	__slots__ = ("id", "method", "args", "kwargs")
 
@@ -210,6 +511,9 @@ class Request(Message, object):
 	def encode(self):
 		return (self.id, self.method, self.args, self.kwargs)
 
+	def compressionKey(self):
+		return self.method
+
 	@classmethod
 	def decode(cls, val):
 		if not isinstance(val, (tuple, list)):
@@ -301,9 +605,116 @@ class DummyWrapper:
 		pass
 
 
-class Server(SocketServer.ThreadingMixIn, SSLServer):
-	def __init__(self, server_address, certCheck=None, wrapper=DummyWrapper(), beforeExecute=None, afterExecute=None, onError=None, **sslargs):
-		SSLServer.__init__(self, server_address, Handler, **sslargs)
+class WorkerPool:
+	"""
+	Bounded pool of threads executing queued jobs.
+
+	Threads are started on demand up to maxWorkers and are kept afterwards.
+	submit() blocks while maxQueue jobs are waiting, this can be used to apply
+	backpressure to the submitting side.
+	"""
+	def __init__(self, maxWorkers=50, maxQueue=1000):
+		self.maxWorkers = maxWorkers
+		self.maxQueue = maxQueue
+		self.workers = 0
+		self.busy = 0
+		self._queue = Queue.Queue(maxQueue)
+		self._lock = threading.Lock()
+
+	def submit(self, fn, *args):
+		"""
+		Queues fn to be called as fn(queuedTime, *args) by a worker thread.
+		"""
+		self._queue.put((fn, time.time(), args))
+		self._startWorker()
+
+	def _startWorker(self):
+		with self._lock:
+			if self.workers < self.maxWorkers and self.busy + self._queue.qsize() > self.workers:
+				self.workers += 1
+				startWorker = True
+			else:
+				startWorker = False
+		if startWorker:
+			worker = threading.Thread(target=self._workerLoop, name="sslrpc2-worker")
+			worker.daemon = True
+			worker.start()
+
+	def trySubmit(self, fn, *args):
+		"""
+		Like submit() but returns False instead of blocking when the queue is full.
+		"""
+		try:
+			self._queue.put_nowait((fn, time.time(), args))
+		except Queue.Full:
+			return False
+		self._startWorker()
+		return True
+
+	def _workerLoop(self):
+		while True:
+			fn, queued, args = self._queue.get()
+			with self._lock:
+				self.busy += 1
+			try:
+				fn(queued, *args)
+			except:
+				import traceback
+				traceback.print_exc()
+			finally:
+				with self._lock:
+					self.busy -= 1
+
+	def info(self):
+		return {
+			"workers": self.workers,
+			"busy": self.busy,
+			"queued": self._queue.qsize(),
+			"max_workers": self.maxWorkers,
+			"max_queue": self.maxQueue
+		}
+
+
+class MethodStats(object):
+	__slots__ = ("calls", "errors", "waitTotal", "waitMax", "execTotal", "execMax")
+
+	def __init__(self):
+		self.calls = 0
+		self.errors = 0
+		self.waitTotal = 0.0
+		self.waitMax = 0.0
+		self.execTotal = 0.0
+		self.execMax = 0.0
+
+	def add(self, wait, duration, success):
+		self.calls += 1
+		if not success:
+			self.errors += 1
+		self.waitTotal += wait
+		self.waitMax = max(self.waitMax, wait)
+		self.execTotal += duration
+		self.execMax = max(self.execMax, duration)
+
+	def info(self):
+		return {
+			"calls": self.calls,
+			"errors": self.errors,
+			"queue_wait_avg": self.waitTotal / self.calls if self.calls else None,
+			"queue_wait_max": self.waitMax,
+			"execution_avg": self.execTotal / self.calls if self.calls else None,
+			"execution_max": self.execMax
+		}
+
+
+class Dispatcher:
+	"""
+	Method registry and request execution shared by Server and EventServer.
+	"""
+	def __init__(self, certCheck=None, wrapper=DummyWrapper(), beforeExecute=None, afterExecute=None, onError=None, maxWorkers=50, maxQueue=1000):
+		self.pool = WorkerPool(maxWorkers=maxWorkers, maxQueue=maxQueue)
+		self.compression = CompressionPolicy()
+		self.stats = {}
+		self._statsLock = threading.Lock()
 		self.beforeExecute = beforeExecute
 		self.afterExecute = afterExecute
 		self.wrapper = wrapper
@@ -314,6 +725,8 @@ class Server(SocketServer.ThreadingMixIn, SSLServer):
 		self.register(self._list, "$list$")
 		self.register(self._info, "$info$")
 		self.register(self._infoall, "$infoall$")
+		self.register(self._stats, "$stats$")
+		self.register(self._batch, "$batch$")
 
 	def register(self, func, name=None):
 		if not callable(func):
@@ -363,6 +776,36 @@ class Server(SocketServer.ThreadingMixIn, SSLServer):
 					exc = res
 			raise exc
 
+	def execute(self, request, wait=0.0):
+		"""
+		Executes a request and records its statistics.
+		:return: a tuple of the Reply.Result code and the reply value
+		"""
+		start = time.time()
+		try:
+			res = (Reply.Result.Success, self.handleRequest(request))
+		except NoSuchMethodError as err:
+			return (Reply.Result.NoSuchMethod, err.method)
+		except Failure as err:
+			res = (Reply.Result.Failure, err.data)
+		except Exception as err:
+			res = (Reply.Result.Failure, {"type": str(type(err)), "message": str(err)})
+		self.recordCall(request.method, wait, time.time() - start, res[0] == Reply.Result.Success)
+		return res
+
+	def _batch(self, calls):
+		results = []
+		for call in calls:
+			try:
+				if not isinstance(call, (list, tuple)):
+					raise MessageError(MessageError.InvalidBaseType)
+				request = Request.decode([0] + list(call))
+			except MessageError as err:
+				results.append((Reply.Result.RequestError, err.code))
+				continue
+			results.append(self.execute(request))
+		return results
+
 	def _list(self):
 		return self.funcs.keys()
 
@@ -375,12 +818,47 @@ class Server(SocketServer.ThreadingMixIn, SSLServer):
 	def _infoall(self):
 		return dict([(key, method_info(func)) for (key, func) in self.funcs.iteritems()])
 
+	def recordCall(self, name, wait, duration, success):
+		with self._statsLock:
+			stats = self.stats.get(name)
+			if not stats:
+				stats = self.stats[name] = MethodStats()
+			stats.add(wait, duration, success)
+
+	def _stats(self):
+		with self._statsLock:
+			methods = dict([(key, stats.info()) for (key, stats) in self.stats.iteritems()])
+		return {"pool": self.pool.info(), "methods": methods, "compression": self.compression.info()}
+
+
+def negotiatedCodecs(request):
+	"""
+	Returns the codecs to use for a connection after receiving the $codecs$ request.
+	"""
+	try:
+		offered = set(request.args[0])
+	except:
+		offered = set()
+	return (offered & AVAILABLE_CODECS) | set(Message.DEFAULT_CODECS)
+
+
+class Server(SocketServer.ThreadingMixIn, SSLServer, Dispatcher):
+	def __init__(self, server_address, certCheck=None, wrapper=DummyWrapper(), beforeExecute=None, afterExecute=None, onError=None, maxWorkers=50, maxQueue=1000, **sslargs):
+		SSLServer.__init__(self, server_address, Handler, **sslargs)
+		Dispatcher.__init__(self, certCheck=certCheck, wrapper=wrapper, beforeExecute=beforeExecute, afterExecute=afterExecute,
+							onError=onError, maxWorkers=maxWorkers, maxQueue=maxQueue)
+
 
-class Handler(SocketServer.StreamRequestHandler):
+class Handler(SocketServer.BaseRequestHandler, FramedStream):
 	def __init__(self, *args, **kwargs):
 		self._wlock = threading.RLock()
 		self.failed = False
-		SocketServer.StreamRequestHandler.__init__(self, *args, **kwargs)
+		SocketServer.BaseRequestHandler.__init__(self, *args, **kwargs)
+
+	def setup(self):
+		self.connection = self.socket = self.request
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self._initFraming(self.server.compression)
 
 	def handle(self):
 		if callable(self.server.certCheck):
@@ -409,46 +887,45 @@ class Handler(SocketServer.StreamRequestHandler):
 				import traceback
 				traceback.print_exc()
 				break
-			thread.start_new_thread(self.handleRequest, (request, self.server.session))
+			if request.method == "$codecs$":
+				self.negotiateCodecs(request)
+				continue
+			# blocks while the request queue is full, so no more requests are read from this connection
+			self.server.pool.submit(self.handleRequest, request, self.server.session)
 		self.server.delSession()
 
-	def handleRequest(self, request, session):
+	def handleRequest(self, queued, request, session):
+		start = time.time()
 		with self.server.wrapper:
 			self.server.session = session
-			try:
-				result = self.server.handleRequest(request)
-				reply = Reply(request.id, Reply.Result.Success, result)
-			except NoSuchMethodError as err:
-				reply = Reply(request.id, Reply.Result.NoSuchMethod, err.method)
-			except Failure as err:
-				reply = Reply(request.id, Reply.Result.Failure, err.data)
-			except Exception as err:
-				reply = Reply(request.id, Reply.Result.Failure, {"type": str(type(err)), "message": str(err)})
+			result, value = self.server.execute(request, start - queued)
+		reply = Reply(request.id, result, value)
 		try:
-			reply.writeTo(self)
+			reply.writeTo(self, request.method)
 		except Exception as err:
 			reply = Reply(request.id, Reply.Result.Failure, {"type": str(type(err)), "message": str(err)})
 			try:
-				reply.writeTo(self)
+				reply.writeTo(self, request.method)
 			except:
 				self.failed = True
 
-	def read(self, size):
+	def negotiateCodecs(self, request):
+		# Handled on the connection itself since it changes how replies are encoded.
+		# The client can decode all codecs it offers, so replies that are already
+		# being sent by workers do not need to be synchronized with this.
+		self.codecs = negotiatedCodecs(request)
 		try:
-			data = self.rfile.read(size)
-			if len(data) < size:
-				raise ConnectionEnded()
-			return data
-		except:
-			raise NetworkError(NetworkError.ReadError)
+			Reply(request.id, Reply.Result.Success, sorted(self.codecs)).writeTo(self, request.method)
+		except NetworkError:
+			self.failed = True
 
 	def write(self, data):
-		try:
-			with self._wlock:
-				self.wfile.write(data)
-				self.wfile.flush()
-		except:
-			raise NetworkError(NetworkError.WriteError)
+		with self._wlock:
+			FramedStream.write(self, data)
+
+	def writeFrame(self, header, payload):
+		with self._wlock:
+			FramedStream.writeFrame(self, header, payload)
 
 
 class Proxy:
@@ -458,6 +935,7 @@ class Proxy:
 		self._address = address
 		self._sslargs = sslargs
 		self._timeout = timeout
+		self.compression = CompressionPolicy()
 		self._reconnect()
 		self._id = 0
 		self._rlock = threading.RLock()
@@ -467,19 +945,37 @@ class Proxy:
 		self._results = {}
 		self._errors = {}
 		self._waiting = set()
+		self._batchSupported = True
 
 	def _reconnect(self):
 		try:
-			self._con = SSLConnection(self._address, timeout=self._timeout, **self._sslargs)
+			con = SSLConnection(self._address, timeout=self._timeout, compression=self.compression, **self._sslargs)
 		except socket.error, err:
 			raise self._onError(NetworkError(NetworkError.ReadError))
+		try:
+			con.negotiateCodecs()
+		except (NetworkError, FramingError, MessageError):
+			con.close()
+			raise self._onError(NetworkError(NetworkError.ReadError))
+		self._con = con
 
 	def _nextId(self):
 		with self._wlock:
 			self._id += 1
 			return self._id
 
-	def _callInternal(self, name, args=None, kwargs=None):
+	@staticmethod
+	def _replyError(reply):
+		if reply.result == Reply.Result.Failure:
+			return reply.value
+		elif reply.result == Reply.Result.RequestError:
+			return MessageError(reply.value)
+		elif reply.result == Reply.Result.NoSuchMethod:
+			return NoSuchMethodError(reply.value)
+		return MessageError(MessageError.UnknownReplyType, reply.id)
+
+	def _callInternal(self, name, args=None, kwargs=None, timeout=None):
+		# timeout is ignored here, calls are only limited by the socket timeout
 		if not kwargs: kwargs = {}
 		if not args: args = []
 		with self._wlock:
@@ -509,12 +1005,8 @@ class Proxy:
 						# Save response
 						if response.result == Reply.Result.Success:
 							self._results[response.id] = response.value
-						elif response.result == Reply.Result.Failure:
-							self._errors[response.id] = response.value
-						elif response.result == Reply.Result.RequestError:
-							self._errors[response.id] = MessageError(response.value)
-						elif response.result == Reply.Result.NoSuchMethod:
-							self._errors[response.id] = NoSuchMethodError(response.value)
+						else:
+							self._errors[response.id] = self._replyError(response)
 						# Notify everyone who is waiting for responses
 						self._resCond.notifyAll()
 				except:
@@ -524,19 +1016,28 @@ class Proxy:
 						self._resCond.notifyAll()
 				finally:
 					self._rlock.release()
+					with self._resCond:
+						# Wake up someone to take over reading
+						self._resCond.notifyAll()
 			else:
 				# Someone else is waiting for a message
 				with self._resCond:
+					if request_id in self._results or request_id in self._errors:
+						continue
+					if self._rlock.acquire(blocking=False):
+						# The reader has finished in the meantime
+						self._rlock.release()
+						continue
 					# Wait for a message to come in
 					self._resCond.wait()
 
-	def _call(self, name, args=None, kwargs=None):
+	def _call(self, name, args=None, kwargs=None, timeout=None):
 		if not kwargs: kwargs = {}
 		if not args: args = []
 		tries = 3
 		while True:
 			try:
-				return self._callInternal(name, args, kwargs)
+				return self._callInternal(name, args, kwargs, timeout)
 			except NetworkError:
 				tries -= 1
 				if tries == 0:
@@ -545,9 +1046,37 @@ class Proxy:
 			except Exception, err:
 				raise self._onError(err), None, sys.exc_info()[2]
 
+	def _batch(self, calls):
+		if not calls:
+			return
+		if self._batchSupported:
+			try:
+				results = self._call("$batch$", [[[call.name, call.args, call.kwargs] for call in calls]])
+			except NoSuchMethodError:
+				self._batchSupported = False
+		if not self._batchSupported:
+			# Server does not support batches, fall back to single calls
+			for call in calls:
+				try:
+					call._finish(result=self._call(call.name, call.args, call.kwargs))
+				except Exception, err:
+					call._finish(error=err)
+			return
+		for call, (result, value) in zip(calls, results):
+			if result == Reply.Result.Success:
+				call._finish(result=value)
+			else:
+				call._finish(error=self._onError(self._replyError(Reply(None, result, value))))
+
+	def batch(self):
+		return Batch(self)
+
 	def _listMethods(self):
 		return self._call("$list$")
 
+	def _compressionStats(self):
+		return self.compression.info()
+
 	def __getattr__(self, name):
 		return MethodProxy(self, name, {})
 
@@ -561,16 +1090,272 @@ class Proxy:
 			pass
 
 
+class _PendingCall(object):
+	__slots__ = ("id", "deadline", "con", "result", "error", "_lock")
+
+	def __init__(self, deadline, con):
+		self.id = None
+		self.deadline = deadline
+		self.con = con
+		self.result = None
+		self.error = None
+		self._lock = thread.allocate_lock()
+		self._lock.acquire()
+
+	def finish(self, result=None, error=None):
+		self.result = result
+		self.error = error
+		self._lock.release()
+
+	def wait(self):
+		self._lock.acquire()
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+
+class PipelinedProxy(Proxy):
+	"""
+	Proxy that multiplexes concurrent calls over a single connection.
+
+	A dedicated reader thread receives all replies and hands each one directly to the
+	caller waiting for its request id, so callers never compete for the socket and
+	are only woken up once. Every call has a deadline (the proxy timeout unless a
+	per-call timeout is given) which is enforced by a watcher thread with a
+	granularity of TIMEOUT_GRANULARITY seconds.
+	"""
+	TIMEOUT_GRANULARITY = 1.0
+
+	def __init__(self, address, onError=(lambda x: x), timeout=60, **sslargs):
+		self._conLock = threading.RLock()
+		self._pendingLock = threading.Lock()
+		self._pending = {}
+		self._deadlines = []
+		self._broken = True
+		self._closed = False
+		self._watcher = None
+		Proxy.__init__(self, address, onError=onError, timeout=timeout, **sslargs)
+
+	def _reconnect(self):
+		with self._conLock:
+			if not self._broken:
+				# another caller has already replaced the broken connection
+				return
+			Proxy._reconnect(self)
+			self._broken = False
+			reader = threading.Thread(target=self._readLoop, args=(weakref.ref(self), self._con), name="sslrpc2-reader %s:%s" % self._address)
+			reader.daemon = True
+			reader.start()
+			if not self._watcher:
+				self._watcher = threading.Thread(target=self._watchLoop, args=(weakref.ref(self),), name="sslrpc2-timeouts %s:%s" % self._address)
+				self._watcher.daemon = True
+				self._watcher.start()
+
+	def _markBroken(self, con):
+		with self._conLock:
+			if con is self._con:
+				self._broken = True
+		try:
+			con.socket.shutdown(socket.SHUT_RDWR)
+		except:
+			pass
+
+	def _expireCalls(self):
+		now = time.time()
+		expired = []
+		with self._pendingLock:
+			while self._deadlines and self._deadlines[0][0] <= now:
+				_, id = heapq.heappop(self._deadlines)
+				call = self._pending.pop(id, None)
+				if call:
+					expired.append(call)
+			wait = self._deadlines[0][0] - now if self._deadlines else self.TIMEOUT_GRANULARITY
+		for call in expired:
+			call.finish(error=TimedOut())
+		return min(wait, self.TIMEOUT_GRANULARITY)
+
+	def _dispatch(self, reply):
+		with self._pendingLock:
+			call = self._pending.pop(reply.id, None)
+		if not call:
+			# the call has timed out already
+			return
+		if reply.result == Reply.Result.Success:
+			call.finish(result=reply.value)
+		else:
+			call.finish(error=self._replyError(reply))
+
+	def _failPending(self, con):
+		self._markBroken(con)
+		with self._pendingLock:
+			# calls on a newer connection are not affected
+			calls = [call for call in self._pending.itervalues() if call.con is con]
+			for call in calls:
+				del self._pending[call.id]
+			self._deadlines = [entry for entry in self._deadlines if entry[1] in self._pending]
+			heapq.heapify(self._deadlines)
+		for call in calls:
+			call.finish(error=NetworkError(NetworkError.ReadError))
+
+	# The helper threads only hold weak references so that unused proxies can still be collected
+
+	@staticmethod
+	def _readLoop(proxyRef, con):
+		try:
+			while True:
+				header = con.readIdle()
+				proxy = proxyRef()
+				if proxy is None or proxy._closed:
+					break
+				if header is not None:
+					proxy._dispatch(Reply.readFrom(con, header))
+				del proxy
+		except:
+			pass
+		proxy = proxyRef()
+		if proxy is not None:
+			proxy._failPending(con)
+		del proxy
+		try:
+			con.close()
+		except:
+			pass
+
+	@staticmethod
+	def _watchLoop(proxyRef):
+		while True:
+			proxy = proxyRef()
+			if proxy is None or proxy._closed:
+				break
+			wait = proxy._expireCalls()
+			del proxy
+			time.sleep(wait)
+
+	def _callInternal(self, name, args=None, kwargs=None, timeout=None):
+		if not kwargs: kwargs = {}
+		if not args: args = []
+		if timeout is None:
+			timeout = self._timeout
+		with self._conLock:
+			if self._broken:
+				raise NetworkError(NetworkError.ReadError)
+			con = self._con
+		call = _PendingCall(time.time() + timeout if timeout else None, con)
+		with self._wlock:
+			call.id = self._nextId()
+			with self._pendingLock:
+				self._pending[call.id] = call
+				if call.deadline:
+					heapq.heappush(self._deadlines, (call.deadline, call.id))
+			try:
+				Request(call.id, name, args, kwargs).writeTo(con)
+			except NetworkError:
+				with self._pendingLock:
+					self._pending.pop(call.id, None)
+				self._markBroken(con)
+				raise
+		try:
+			return call.wait()
+		except Exception, err:
+			raise self._onError(err)
+
+	def close(self):
+		self._closed = True
+		with self._conLock:
+			if self._con:
+				self._markBroken(self._con)
+
+	def __del__(self):
+		self.close()
+
+
+class BatchCall(object):
+	__slots__ = ("name", "args", "kwargs", "_result", "_error", "_done")
+
+	def __init__(self, name, args, kwargs):
+		self.name = name
+		self.args = args
+		self.kwargs = kwargs
+		self._result = None
+		self._error = None
+		self._done = False
+
+	def _finish(self, result=None, error=None):
+		self._result = result
+		self._error = error
+		self._done = True
+
+	def get(self):
+		"""
+		Returns the result of this call or raises its error.
+		"""
+		if not self._done:
+			raise Exception("Batch has not been executed")
+		if self._error is not None:
+			raise self._error
+		return self._result
+
+
+class Batch(object):
+	"""
+	Collects calls that are sent to the server in a single request.
+
+	Every call returns a BatchCall whose result is available after the batch has been executed.
+	A failing call does not affect the other calls of the batch.
+
+		with proxy.batch() as batch:
+			el1 = batch.element_info(id1)
+			el2 = batch.element_info(id2)
+		info1, info2 = el1.get(), el2.get()
+	"""
+	def __init__(self, proxy):
+		self._proxy = proxy
+		self._calls = []
+
+	def add(self, name, args=None, kwargs=None):
+		call = BatchCall(name, list(args or []), kwargs or {})
+		self._calls.append(call)
+		return call
+
+	def execute(self):
+		calls, self._calls = self._calls, []
+		self._proxy._batch(calls)
+		return calls
+
+	def __getattr__(self, name):
+		if name.startswith("__"):
+			raise AttributeError(name)
+		def call(*args, **kwargs):
+			return self.add(name, args, kwargs)
+		call.__name__ = name
+		return call
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		if exc_type is None:
+			self.execute()
+
+
 class MethodProxy:
-	def __init__(self, proxy, name, info):
+	def __init__(self, proxy, name, info, timeout=None):
 		self.proxy = proxy
 		self.name = name
 		self.info = info
+		self.timeout = timeout
 		self.__name__ = name
 		self.__doc__ = info.get("desc")
 
 	def __call__(self, *args, **kwargs):
-		return self.proxy._call(self.name, args, kwargs)
+		return self.proxy._call(self.name, args, kwargs, self.timeout)
+
+	def withTimeout(self, timeout):
+		"""
+		Returns a copy of this method proxy whose calls use the given timeout (in seconds).
+		Only PipelinedProxy enforces per-call timeouts.
+		"""
+		return MethodProxy(self.proxy, self.name, self.info, timeout)
 
 	def _asyncCall(self, callback, error, args, kwargs):
 		try:
@@ -588,3 +1373,550 @@ class MethodProxy:
 		if error and not callable(error):
 			raise TypeError("Error callback not callable")
 		thread.start_new_thread(self._asyncCall, (callback, error, args, kwargs))
+
+
+def _wouldBlock(err):
+	if isinstance(err, ssl.SSLError):
+		return err.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE)
+	return err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class EventLoop:
+	"""
+	Runs many non-blocking connections in a single thread using epoll (or poll).
+
+	Handlers are objects with handleEvent(events) and close() methods. They
+	must only be used from the loop thread, other threads hand work to the loop
+	with callSoon() which wakes it up through a pipe.
+	"""
+	READ = select.POLLIN
+	WRITE = select.POLLOUT
+	ERROR = select.POLLERR | select.POLLHUP
+
+	def __init__(self):
+		if hasattr(select, "epoll"):
+			self._poller = select.epoll()
+			self._timeScale = 1.0
+		else:
+			self._poller = select.poll()
+			self._timeScale = 1000.0
+		self._handlers = {}
+		self._calls = collections.deque()
+		self._timers = []
+		self._timerSeq = 0
+		self._wakeRead, self._wakeWrite = os.pipe()
+		for fd in (self._wakeRead, self._wakeWrite):
+			fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+		self._poller.register(self._wakeRead, self.READ)
+		self._woken = False
+		self._threadId = None
+		self._stopped = threading.Event()
+		self.running = False
+
+	def register(self, fd, handler, events):
+		self._handlers[fd] = handler
+		self._poller.register(fd, events)
+
+	def modify(self, fd, events):
+		self._poller.modify(fd, events)
+
+	def unregister(self, fd):
+		self._handlers.pop(fd, None)
+		try:
+			self._poller.unregister(fd)
+		except (IOError, OSError, KeyError, ValueError):
+			pass
+
+	def inLoop(self):
+		return thread.get_ident() == self._threadId
+
+	def callSoon(self, fn, *args):
+		"""
+		Lets the loop thread call fn(*args), can be used from any thread.
+		"""
+		self._calls.append((fn, args))
+		if not self._woken and not self.inLoop():
+			self._woken = True
+			try:
+				os.write(self._wakeWrite, "x")
+			except OSError:
+				pass
+
+	def callLater(self, delay, fn, *args):
+		if not self.inLoop():
+			return self.callSoon(self.callLater, delay, fn, *args)
+		self._timerSeq += 1
+		heapq.heappush(self._timers, (time.time() + delay, self._timerSeq, fn, args))
+
+	def _runCalls(self):
+		for _ in xrange(len(self._calls)):
+			fn, args = self._calls.popleft()
+			try:
+				fn(*args)
+			except:
+				import traceback
+				traceback.print_exc()
+
+	def _runTimers(self):
+		now = time.time()
+		while self._timers and self._timers[0][0] <= now:
+			_, _, fn, args = heapq.heappop(self._timers)
+			try:
+				fn(*args)
+			except:
+				import traceback
+				traceback.print_exc()
+
+	def run(self):
+		self._threadId = thread.get_ident()
+		self.running = True
+		self._stopped.clear()
+		try:
+			while self.running:
+				if self._calls:
+					timeout = 0
+				elif self._timers:
+					timeout = max(self._timers[0][0] - time.time(), 0) * self._timeScale
+				else:
+					timeout = -1
+				try:
+					events = self._poller.poll(timeout)
+				except (IOError, OSError, select.error), err:
+					if err.args[0] == errno.EINTR:
+						continue
+					raise
+				for fd, mask in events:
+					if fd == self._wakeRead:
+						try:
+							while os.read(self._wakeRead, 4096):
+								pass
+						except OSError:
+							pass
+						self._woken = False
+						continue
+					handler = self._handlers.get(fd)
+					if not handler:
+						continue
+					try:
+						handler.handleEvent(mask)
+					except:
+						import traceback
+						traceback.print_exc()
+						handler.close()
+				self._runCalls()
+				self._runTimers()
+		finally:
+			self.running = False
+			self._stopped.set()
+
+	def start(self, name="sslrpc2-eventloop"):
+		loopThread = threading.Thread(target=self.run, name=name)
+		loopThread.daemon = True
+		loopThread.start()
+
+	def stop(self, wait=True):
+		def _stop():
+			self.running = False
+		self.callSoon(_stop)
+		if wait and not self.inLoop():
+			self._stopped.wait()
+
+
+_sharedLoop = None
+_sharedLoopLock = threading.Lock()
+
+def sharedEventLoop():
+	"""
+	Returns the event loop used by all EventProxy instances, starting it when needed.
+	"""
+	global _sharedLoop
+	with _sharedLoopLock:
+		if not _sharedLoop:
+			_sharedLoop = EventLoop()
+			_sharedLoop.start("sslrpc2-client-eventloop")
+		return _sharedLoop
+
+
+class EventConnection:
+	"""
+	Non-blocking SSL connection driven by an EventLoop.
+
+	Incoming frames are passed to frameReceived() as soon as they are complete.
+	All methods have to be called from the loop thread.
+	"""
+	READ_SIZE = 1 << 16
+
+	def __init__(self, loop, sock, compression=None, handshake=True):
+		self.loop = loop
+		self.socket = sock
+		self.fd = sock.fileno()
+		self.compression = compression or CompressionPolicy()
+		self.codecs = set(Message.DEFAULT_CODECS)
+		self.closed = False
+		self._handshaking = handshake
+		self._paused = False
+		self._inbuf = bytearray()
+		self._outbuf = collections.deque()
+		self._events = EventLoop.READ
+		loop.callSoon(loop.register, self.fd, self, self._events)
+
+	def connected(self):
+		pass
+
+	def frameReceived(self, method, payload):
+		raise NotImplementedError()
+
+	def connectionLost(self):
+		pass
+
+	def _updateEvents(self):
+		events = 0 if self._paused else EventLoop.READ
+		if self._outbuf:
+			events |= EventLoop.WRITE
+		if events != self._events and not self.closed:
+			self._events = events
+			self.loop.modify(self.fd, events)
+
+	def handleEvent(self, events):
+		try:
+			if self._handshaking:
+				self._handshake()
+				return
+			if events & EventLoop.ERROR or (events & EventLoop.READ and not self._paused):
+				self._read()
+			if events & EventLoop.WRITE and not self.closed:
+				self._flush()
+		except (socket.error, ssl.SSLError):
+			self.close()
+
+	def _handshake(self):
+		try:
+			self.socket.do_handshake()
+		except ssl.SSLError, err:
+			if not _wouldBlock(err):
+				raise
+			events = EventLoop.WRITE if err.args[0] == ssl.SSL_ERROR_WANT_WRITE else EventLoop.READ
+			if events != self._events:
+				self._events = events
+				self.loop.modify(self.fd, events)
+			return
+		self._handshaking = False
+		self._updateEvents()
+		self.connected()
+
+	def _read(self):
+		while True:
+			try:
+				data = self.socket.recv(self.READ_SIZE)
+			except (socket.error, ssl.SSLError), err:
+				if _wouldBlock(err):
+					break
+				raise
+			if not data:
+				self.close()
+				return
+			self._inbuf += data
+			if len(data) < self.READ_SIZE and not self.socket.pending():
+				break
+		self._processFrames()
+
+	def _processFrames(self):
+		buf = self._inbuf
+		pos = 0
+		while not self._paused and not self.closed and len(buf) - pos >= 4:
+			size = (buf[pos+1] << 16) + (buf[pos+2] << 8) + buf[pos+3]
+			if len(buf) - pos - 4 < size:
+				break
+			method = buf[pos]
+			pos += 4 + size
+			# the payload is only valid until the buffer is changed, so it has to be decoded right away
+			self.frameReceived(method, buffer(buf, pos - size, size))
+		if pos:
+			del buf[:pos]
+
+	def pause(self):
+		"""
+		Stops reading from the connection until resume() is called.
+		"""
+		if not self._paused:
+			self._paused = True
+			self._updateEvents()
+
+	def resume(self):
+		if self._paused:
+			self._paused = False
+			self._updateEvents()
+			self._processFrames()
+
+	def sendFrame(self, header, payload):
+		if self.closed:
+			return
+		if len(payload) <= FramedStream.MAX_JOINED_WRITE:
+			self._outbuf.append(header + payload)
+		else:
+			self._outbuf.append(header)
+			self._outbuf.append(payload)
+		try:
+			self._flush()
+		except (socket.error, ssl.SSLError):
+			self.close()
+
+	def sendMessage(self, msg, key=None):
+		self.sendFrame(*msg.encodeFrame(self.compression, self.codecs, key))
+
+	def _flush(self):
+		while self._outbuf:
+			data = self._outbuf[0]
+			try:
+				sent = self.socket.send(data)
+			except (socket.error, ssl.SSLError), err:
+				if _wouldBlock(err):
+					break
+				raise
+			if sent < len(data):
+				self._outbuf[0] = buffer(data, sent)
+				break
+			self._outbuf.popleft()
+		self._updateEvents()
+
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+		self.loop.unregister(self.fd)
+		try:
+			self.socket.shutdown(socket.SHUT_RDWR)
+		except:
+			pass
+		try:
+			self.socket.close()
+		except:
+			pass
+		self._outbuf.clear()
+		self.connectionLost()
+
+
+class _EventServerConnection(EventConnection):
+	def __init__(self, server, sock):
+		EventConnection.__init__(self, server.loop, sock, server.compression)
+		self.server = server
+		self.session = None
+		self._backlog = collections.deque()
+
+	def connected(self):
+		if callable(self.server.certCheck):
+			if not self.server.certCheck(self.socket.getpeercert()):
+				self.close()
+
+	def frameReceived(self, method, payload):
+		try:
+			request = Request.decodeFrame(method, payload, self.compression)
+		except FramingError:
+			self.close()
+			return
+		except MessageError as err:
+			self.sendMessage(Reply(err.id, Reply.Result.RequestError, err.code))
+			return
+		if request.method == "$codecs$":
+			self.codecs = negotiatedCodecs(request)
+			self.sendMessage(Reply(request.id, Reply.Result.Success, sorted(self.codecs)), request.method)
+			return
+		self._backlog.append(request)
+		if not self._paused and not self.submitBacklog():
+			self.server._blocked.append(self)
+
+	def submitBacklog(self):
+		"""
+		Hands waiting requests to the worker pool.
+		:return: False if the pool queue is full, reading from the connection is paused then
+		"""
+		while self._backlog:
+			if not self.server.pool.trySubmit(self._execute, self._backlog[0], self.session):
+				self.pause()
+				return False
+			self._backlog.popleft()
+		self.resume()
+		return True
+
+	def _execute(self, queued, request, session):
+		# runs in a worker thread
+		start = time.time()
+		with self.server.wrapper:
+			self.server.session = session
+			result, value = self.server.execute(request, start - queued)
+		try:
+			frame = Reply(request.id, result, value).encodeFrame(self.compression, self.codecs, request.method)
+		except Exception as err:
+			frame = Reply(request.id, Reply.Result.Failure, {"type": str(type(err)), "message": str(err)}).encodeFrame(self.compression, self.codecs, request.method)
+		self.loop.callSoon(self._finished, frame)
+
+	def _finished(self, frame):
+		self.sendFrame(*frame)
+		self.server._requestDone()
+
+	def connectionLost(self):
+		self._backlog.clear()
+		self.server.connections.discard(self)
+
+
+class EventServer(Dispatcher):
+	"""
+	Server that handles all connections in a single event loop thread instead
+	of one thread per connection.
+
+	Requests are still executed by the worker pool, so idle connections and
+	queued requests do not occupy threads. When the request queue is full, the
+	connections with waiting requests stop being read until the queue drains.
+	serve_forever() runs the loop in the calling thread.
+	"""
+	def __init__(self, server_address, certCheck=None, wrapper=DummyWrapper(), beforeExecute=None, afterExecute=None, onError=None, maxWorkers=50, maxQueue=1000, backlog=1024, **sslargs):
+		Dispatcher.__init__(self, certCheck=certCheck, wrapper=wrapper, beforeExecute=beforeExecute, afterExecute=afterExecute,
+							onError=onError, maxWorkers=maxWorkers, maxQueue=maxQueue)
+		self.sslargs = sslargs
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.socket.bind(server_address)
+		self.socket.listen(backlog)
+		self.socket.setblocking(False)
+		self.server_address = self.socket.getsockname()
+		self.loop = EventLoop()
+		self.loop.register(self.socket.fileno(), self, EventLoop.READ)
+		self.connections = set()
+		self._blocked = collections.deque()
+		self.running = True
+
+	def handleEvent(self, events):
+		while True:
+			try:
+				sock, _ = self.socket.accept()
+			except socket.error, err:
+				if not _wouldBlock(err):
+					self.on_ssl_error(err)
+				return
+			try:
+				sock.setblocking(False)
+				sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+				sock = ssl.wrap_socket(sock, server_side=True, do_handshake_on_connect=False, **self.sslargs)
+			except Exception, err:
+				sock.close()
+				self.on_ssl_error(err)
+				continue
+			self.connections.add(_EventServerConnection(self, sock))
+
+	def on_ssl_error(self, error):
+		import traceback
+		traceback.print_exc(error)
+
+	def _requestDone(self):
+		while self._blocked:
+			con = self._blocked[0]
+			if not con.closed and not con.submitBacklog():
+				return
+			self._blocked.popleft()
+
+	def serve_forever(self):
+		self.loop.run()
+
+	def close(self):
+		# called by the loop if accepting fails unexpectedly
+		pass
+
+	def _shutdown(self):
+		for con in list(self.connections):
+			con.close()
+		self.loop.unregister(self.socket.fileno())
+		self.socket.close()
+		self.loop.running = False
+
+	def shutdown(self):
+		self.running = False
+		self.loop.callSoon(self._shutdown)
+		if self.loop.running and not self.loop.inLoop():
+			self.loop._stopped.wait()
+
+
+class _EventClientConnection(EventConnection):
+	def __init__(self, loop, con, proxyRef):
+		con.socket.setblocking(False)
+		EventConnection.__init__(self, loop, con.socket, con.compression, handshake=False)
+		self.codecs = con.codecs
+		self.con = con
+		self.proxyRef = proxyRef
+
+	def frameReceived(self, method, payload):
+		reply = Reply.decodeFrame(method, payload, self.compression)
+		proxy = self.proxyRef()
+		if proxy is None or proxy._closed:
+			self.close()
+			return
+		proxy._dispatch(reply)
+
+	def connectionLost(self):
+		proxy = self.proxyRef()
+		if proxy is not None:
+			proxy._failPending(self.con)
+
+
+class EventProxy(PipelinedProxy):
+	"""
+	PipelinedProxy whose connection is served by a shared EventLoop instead of
+	a reader and a timeout thread per proxy, so that many proxies with many
+	calls in flight do not need any threads of their own.
+	"""
+	def __init__(self, address, onError=(lambda x: x), timeout=60, loop=None, **sslargs):
+		self._loop = loop or sharedEventLoop()
+		self._eventCon = None
+		self._watching = False
+		PipelinedProxy.__init__(self, address, onError=onError, timeout=timeout, **sslargs)
+
+	def _reconnect(self):
+		with self._conLock:
+			if not self._broken:
+				# another caller has already replaced the broken connection
+				return
+			Proxy._reconnect(self)
+			self._broken = False
+			self._eventCon = _EventClientConnection(self._loop, self._con, weakref.ref(self))
+			if not self._watching:
+				self._watching = True
+				self._loop.callLater(self.TIMEOUT_GRANULARITY, self._watch, weakref.ref(self), self._loop)
+
+	@staticmethod
+	def _watch(proxyRef, loop):
+		proxy = proxyRef()
+		if proxy is None or proxy._closed:
+			return
+		loop.callLater(proxy._expireCalls(), EventProxy._watch, proxyRef, loop)
+
+	def _send(self, eventCon, call, frame):
+		# runs in the loop, the connection may have been lost after the call was registered and would not fail it anymore
+		if eventCon.closed:
+			with self._pendingLock:
+				pending = self._pending.pop(call.id, None)
+			self._markBroken(eventCon.con)
+			if pending:
+				pending.finish(error=NetworkError(NetworkError.ReadError))
+			return
+		eventCon.sendFrame(*frame)
+
+	def _callInternal(self, name, args=None, kwargs=None, timeout=None):
+		if not kwargs: kwargs = {}
+		if not args: args = []
+		if timeout is None:
+			timeout = self._timeout
+		with self._conLock:
+			if self._broken:
+				raise NetworkError(NetworkError.ReadError)
+			eventCon = self._eventCon
+		call = _PendingCall(time.time() + timeout if timeout else None, eventCon.con)
+		call.id = self._nextId()
+		frame = Request(call.id, name, args, kwargs).encodeFrame(eventCon.compression, eventCon.codecs)
+		with self._pendingLock:
+			self._pending[call.id] = call
+			if call.deadline:
+				heapq.heappush(self._deadlines, (call.deadline, call.id))
+		self._loop.callSoon(self._send, eventCon, call, frame)
+		try:
+			return call.wait()
+		except Exception, err:
+			raise self._onError(err)
@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.	If not, see <http://www.gnu.org/licenses/>
 
-import xmlrpclib, socket, SocketServer, BaseHTTPServer, gzip, sys
+import xmlrpclib, httplib, socket, select, SocketServer, BaseHTTPServer, gzip, sys, threading, time
 from OpenSSL import SSL
 
 """
@@ -90,6 +90,14 @@ class WrappedSSLConnection:
 			return self._con.recv(*args, **kwargs)
 		except SSL.WantReadError, err:
 			raise socket.error(socket.EINTR)
+		except SSL.ZeroReturnError:
+			# the client has closed a keep-alive connection
+			return ""
+		except SSL.SysCallError, err:
+			if err.args[0] == -1:
+				# unexpected EOF
+				return ""
+			raise
 
 	def fileno(self, *args, **kwargs):
 		return self._con.fileno(*args, **kwargs)
@@ -122,6 +130,8 @@ class SecureServer():
 			ctx = SSL.Context(SSL.SSLv23_METHOD)
 			ctx.use_privatekey_file(sslOpts.private_key)
 			ctx.use_certificate_file(sslOpts.certificate)
+			# needed to let clients resume their sessions when client certificates are verified
+			ctx.set_session_id("tomato-xmlrpc")
 			if sslOpts.client_certs:
 				ctx.set_verify(SSL.VERIFY_PEER | SSL.VERIFY_FAIL_IF_NO_PEER_CERT | SSL.VERIFY_CLIENT_ONCE,
 							   self._verifyClientCert)
@@ -147,6 +157,11 @@ class SecureServer():
 
 
 class XMLRPCHandler(SecureRequestHandler, BaseHTTPServer.BaseHTTPRequestHandler):
+	# keep connections open for further requests unless the client asks otherwise
+	protocol_version = "HTTP/1.1"
+	# responses are flushed explicitly, so they are sent in one piece
+	wbufsize = -1
+
 	def do_POST(self):
 		with self.server.wrapper:
 			credentials = self.getCredentials()
@@ -190,7 +205,7 @@ class XMLRPCHandler(SecureRequestHandler, BaseHTTPServer.BaseHTTPRequestHandler)
 		self.send_header("Content-Type", "text/xml")
 		self.end_headers()
 		self.wfile.write(res)
-		self.finish()
+		self.wfile.flush()
 
 	def getRpcRequest(self):
 		length = int(self.headers.get("Content-Length", None))
@@ -327,6 +342,8 @@ class XMLRPCServerIntrospection(XMLRPCServer):
 class ServerProxy(object):
 	def __init__(self, url, onError=(lambda x: x), **kwargs):
 		self._onError = onError
+		# only pooled transports can be shared between threads
+		self._reusable = isinstance(kwargs.get("transport"), PooledTransport)
 		self._xmlrpc_server_proxy = xmlrpclib.ServerProxy(url, **kwargs)
 
 	def __getattr__(self, name):
@@ -362,3 +379,269 @@ class SafeTransportWithCerts(TimeoutTransport):
 	def make_connection(self, host):
 		host_with_cert = (host, {'key_file': self.keyFile, 'cert_file': self.certFile})
 		return TimeoutTransport.make_connection(self, host_with_cert)
+
+
+class ConnectionPool:
+	"""
+	Keeps idle connections per key (host) for reuse and limits the number of
+	connections that exist for each key at the same time.
+
+	Idle connections are closed after idleTimeout seconds. Callers that find
+	all maxConnections connections of a key in use wait for one to be released.
+	The TLS session of the last connection to each key is kept in sessions so
+	that new connections can resume it instead of doing a full handshake.
+	"""
+	def __init__(self, maxConnections=4, idleTimeout=120.0):
+		self.maxConnections = maxConnections
+		self.idleTimeout = idleTimeout
+		self.sessions = {}
+		self._cond = threading.Condition(threading.Lock())
+		self._idle = {}
+		self._count = {}
+		self._lastCleanup = time.time()
+		self.created = 0
+		self.reused = 0
+		self.discarded = 0
+		self.waited = 0
+
+	def acquire(self, key, create, healthy=None, timeout=None):
+		"""
+		Returns an idle connection for key or a new one created by create().
+		:param healthy: function to check an idle connection before reusing it
+		:param timeout: maximum time to wait for a free connection, raises socket.timeout afterwards
+		"""
+		deadline = time.time() + timeout if timeout else None
+		discard = self._expired()
+		try:
+			with self._cond:
+				while True:
+					idle = self._idle.get(key)
+					while idle:
+						lastUsed, con = idle.pop()
+						if time.time() - lastUsed > self.idleTimeout or (healthy and not healthy(con)):
+							self._count[key] -= 1
+							discard.append(con)
+							continue
+						self.reused += 1
+						return con
+					if self._count.get(key, 0) < self.maxConnections:
+						self._count[key] = self._count.get(key, 0) + 1
+						break
+					self.waited += 1
+					if deadline:
+						if time.time() >= deadline:
+							raise socket.timeout("no free connection to %s" % key)
+						self._cond.wait(deadline - time.time())
+					else:
+						self._cond.wait()
+		finally:
+			self._close(discard)
+		try:
+			con = create()
+		except:
+			self.release(key, None, reuse=False)
+			raise
+		with self._cond:
+			self.created += 1
+		return con
+
+	def release(self, key, con, reuse=True):
+		with self._cond:
+			if reuse:
+				self._idle.setdefault(key, []).append((time.time(), con))
+			else:
+				self._count[key] -= 1
+			self._cond.notify()
+		if not reuse and con:
+			self._close([con])
+
+	def _expired(self):
+		now = time.time()
+		expired = []
+		with self._cond:
+			if now - self._lastCleanup < self.idleTimeout / 2:
+				return expired
+			self._lastCleanup = now
+			for key, idle in self._idle.iteritems():
+				keep = [(lastUsed, con) for (lastUsed, con) in idle if now - lastUsed <= self.idleTimeout]
+				expired += [con for (lastUsed, con) in idle if now - lastUsed > self.idleTimeout]
+				self._count[key] -= len(idle) - len(keep)
+				idle[:] = keep
+		return expired
+
+	def _close(self, cons):
+		for con in cons:
+			with self._cond:
+				self.discarded += 1
+			try:
+				con.close()
+			except:
+				pass
+
+	def info(self):
+		with self._cond:
+			return {
+				"connections": dict(self._count),
+				"idle": dict([(key, len(idle)) for (key, idle) in self._idle.iteritems()]),
+				"created": self.created,
+				"reused": self.reused,
+				"discarded": self.discarded,
+				"waited": self.waited
+			}
+
+
+class _SSLSocket:
+	"""
+	Socket-like wrapper around a client side pyOpenSSL connection on a non-blocking socket,
+	waiting with select() to honor the timeout.
+	"""
+	def __init__(self, con, sock, timeout):
+		self._con = con
+		self._sock = sock
+		self._timeout = timeout
+
+	def _retry(self, func, *args):
+		while True:
+			try:
+				return func(*args)
+			except SSL.WantReadError:
+				if not select.select([self._con], [], [], self._timeout)[0]:
+					raise socket.timeout("timed out")
+			except SSL.WantWriteError:
+				if not select.select([], [self._con], [], self._timeout)[1]:
+					raise socket.timeout("timed out")
+
+	def do_handshake(self):
+		self._retry(self._con.do_handshake)
+
+	def recv(self, size):
+		try:
+			return self._retry(self._con.recv, size)
+		except SSL.ZeroReturnError:
+			return ""
+		except SSL.SysCallError, err:
+			if err.args[0] == -1:
+				return ""
+			raise socket.error(*err.args)
+
+	def sendall(self, data):
+		data = buffer(data)
+		while data:
+			try:
+				sent = self._retry(self._con.send, data)
+			except SSL.SysCallError, err:
+				raise socket.error(*err.args)
+			data = buffer(data, sent)
+
+	def makefile(self, mode="r", bufsize=-1):
+		return socket._fileobject(self, mode, bufsize)
+
+	def getSession(self):
+		return self._con.get_session()
+
+	def readable(self):
+		return bool(self._con.pending() or select.select([self._con], [], [], 0)[0])
+
+	def fileno(self):
+		return self._con.fileno()
+
+	def close(self):
+		try:
+			self._con.shutdown()
+		except:
+			pass
+		self._sock.close()
+
+
+class PooledHTTPSConnection(httplib.HTTPConnection):
+	"""
+	HTTPS connection based on pyOpenSSL since the ssl module can not resume TLS sessions.
+	"""
+	default_port = httplib.HTTPS_PORT
+
+	def __init__(self, host, context, session=None, timeout=None):
+		httplib.HTTPConnection.__init__(self, host, timeout=timeout)
+		self.context = context
+		self.session = session
+
+	def connect(self):
+		sock = socket.create_connection((self.host, self.port), self.timeout)
+		sock.setblocking(False)
+		con = SSL.Connection(self.context, sock)
+		con.set_tlsext_host_name(self.host)
+		if self.session:
+			con.set_session(self.session)
+		con.set_connect_state()
+		self.sock = _SSLSocket(con, sock, self.timeout)
+		try:
+			self.sock.do_handshake()
+		except SSL.Error, err:
+			self.close()
+			raise socket.error(str(err))
+
+	def currentSession(self):
+		# TLS 1.3 sends session tickets after the handshake, so the session is taken after a request
+		if self.sock:
+			self.session = self.sock.getSession()
+		return self.session
+
+	def close(self):
+		self.currentSession()
+		httplib.HTTPConnection.close(self)
+
+	def healthy(self):
+		# an idle keep-alive connection has nothing to read unless the server has closed it
+		return self.sock is not None and not self.sock.readable()
+
+
+class PooledTransport(xmlrpclib.Transport):
+	"""
+	HTTPS transport that can be shared between threads. Requests use keep-alive
+	connections from a ConnectionPool and new connections resume the last TLS
+	session to the same host.
+	"""
+	def __init__(self, pool, keyFile, certFile, caFile=None, timeout=None):
+		xmlrpclib.Transport.__init__(self)
+		self.pool = pool
+		self.timeout = timeout
+		self.context = SSL.Context(SSL.SSLv23_METHOD)
+		self.context.set_options(SSL.OP_NO_SSLv2 | SSL.OP_NO_SSLv3)
+		self.context.set_session_cache_mode(SSL.SESS_CACHE_CLIENT)
+		self.context.use_privatekey_file(keyFile)
+		self.context.use_certificate_file(certFile)
+		if caFile:
+			self.context.load_verify_locations(caFile)
+			self.context.set_verify(SSL.VERIFY_PEER, lambda con, x509, errnum, errdepth, ok: ok)
+
+	def _connect(self, host):
+		chost, _, _ = self.get_host_info(host)
+		con = PooledHTTPSConnection(chost, self.context, session=self.pool.sessions.get(host), timeout=self.timeout)
+		con.connect()
+		return con
+
+	def single_request(self, host, handler, request_body, verbose=0):
+		con = self.pool.acquire(host, lambda: self._connect(host), PooledHTTPSConnection.healthy, timeout=self.timeout)
+		reuse = False
+		try:
+			self.send_request(con, handler, request_body)
+			self.send_host(con, host)
+			self.send_user_agent(con)
+			self.send_content(con, request_body)
+			response = con.getresponse(buffering=True)
+			if response.status == 200:
+				self.verbose = verbose
+				result = self.parse_response(response)
+				reuse = not response.will_close
+				return result
+			response.read()
+			reuse = not response.will_close
+			raise xmlrpclib.ProtocolError(host + handler, response.status, response.reason, response.msg)
+		finally:
+			session = con.currentSession()
+			if session:
+				self.pool.sessions[host] = session
+			self.pool.release(host, con, reuse)
+
+	def close(self):
+		# connections belong to the pool
+		pass
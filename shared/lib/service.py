@@ -1,4 +1,4 @@
-from .sslrpc2 import Proxy, NetworkError as OriginalNetworkError
+from .sslrpc2 import PipelinedProxy, EventProxy, NetworkError as OriginalNetworkError, TimedOut
 from .error import Error, TransportError, NetworkError
 from .settings import settings, Config
 from .cache import cached
@@ -17,6 +17,9 @@ def _convertError(tomato_module=None):
 				code = NetworkError.NOT_REACHABLE
 			return NetworkError.wrap(error, code=code, message=message, todump=todump,
 			                         data={'tomato_module': tomato_module} if tomato_module else {})
+		if isinstance(error, TimedOut):
+			return NetworkError.wrap(error, code=NetworkError.NOT_REACHABLE, message="Service call timed out", todump=False,
+			                         data={'tomato_module': tomato_module} if tomato_module else {})
 		if isinstance(error, Error):
 			return error
 		if isinstance(error, dict):
@@ -32,7 +35,11 @@ def createProxy(address, sslcert, sslkey, sslca, tomato_module=None):
 		raise TransportError(code=TransportError.INVALID_URL, message="address must contain port: %s" % address)
 	address, port = address.split(":")
 	port = int(port)
-	return Proxy((address, port), certfile=sslcert, keyfile=sslkey, ca_certs=sslca, cert_reqs=ssl.CERT_REQUIRED, onError=_convertError(tomato_module), timeout=settings.get_rpc_timeout())
+	if settings.get_rpc_client_settings()[Config.RPC_TRANSPORT] == Config.RPC_TRANSPORT_EVENTS:
+		proxy_class = EventProxy
+	else:
+		proxy_class = PipelinedProxy
+	return proxy_class((address, port), certfile=sslcert, keyfile=sslkey, ca_certs=sslca, cert_reqs=ssl.CERT_REQUIRED, onError=_convertError(tomato_module), timeout=settings.get_rpc_timeout())
 
 @cached(3600)
 def get_tomato_inner_proxy(tomato_module):
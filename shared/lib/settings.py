@@ -102,6 +102,12 @@ backend_core:
     resource-sync-interval: 600
     component-timeout: 31104000  # 12 months
     availability-factor: 0.9999946516564278  # (1/2) ^ (update_interval / availability_halftime)
+    max-connections: 4  # concurrent https+xmlrpc connections to each host
+    connection-idle-timeout: 150  # keep-alive connections are closed after being idle for this time
+    sync-concurrency: 20  # maximum number of accounting and component synchronizations running at the same time
+    sync-concurrency-per-host: 2  # maximum number of synchronizations with one host running at the same time
+    sync-threads: 20  # threads that fetch host info, networks and capabilities from the hosts in parallel
+    sync-deadline: 30  # seconds a host may take to answer these calls before the synchronization is aborted
   tasks:
     max-workers: 25
 
@@ -183,6 +189,19 @@ web:
 
 rpc-timeout: 300
 
+rpc-server:
+  max-workers: 50  # maximum number of threads executing incoming sslrpc2 requests
+  max-queue: 1000  # requests waiting for a worker. When this is full, no more requests are read from the connections.
+  transport: threads  # "threads": a thread per connection, "events": all connections in one event loop thread
+
+rpc-client:
+  transport: threads  # "threads": a reader thread per connection, "events": all connections in one shared event loop thread
+
+change-events:
+  enabled: true  # backend_core and backend_users publish changes of their objects, the other services invalidate their caches accordingly
+  buffer-size: 10000  # number of recent changes kept for subscribers
+  poll-timeout: 20  # seconds a subscriber waits for new changes in one call, must be lower than rpc-timeout
+
 email:
   smtp-server: localhost
   from: ToMaTo backend <tomato@localhost>
@@ -225,6 +244,8 @@ topologies:
   timeout-destroy: 1209600  # 14 days - topology destructed n seconds after timeout
   timeout-remove: 7776000  # 90 days - topology removed n seconds after timeout
   timeout-options: [86400, 259200, 1209600, 2592000]  # 1, 3, 14, 30 days
+  action-threads: 20  # threads that execute the element actions of topology actions (e.g. start) concurrently
+  action-concurrency-per-host: 4  # element actions of one topology action that may run on the same host at once
 
 user-quota:
   default:
@@ -334,12 +355,20 @@ class Config:
 	TOPOLOGY_TIMEOUT_DESTROY = 'timeout-destroy'
 	TOPOLOGY_TIMEOUT_REMOVE = 'timeout-remove'
 	TOPOLOGY_TIMEOUT_OPTIONS = 'timeout-options'
+	TOPOLOGY_ACTION_THREADS = 'action-threads'
+	TOPOLOGY_ACTION_CONCURRENCY_PER_HOST = 'action-concurrency-per-host'
 
 	HOST_UPDATE_INTERVAL = 'update-interval'
 	HOST_AVAILABILITY_HALFTIME = 'availability-halftime'
 	HOST_RESOURCE_SYNC_INTERVAL = 'resource-sync-interval'
 	HOST_COMPONENT_TIMEOUT = 'component-timeout'
 	HOST_AVAILABILITY_FACTOR = 'availability-factor'
+	HOST_MAX_CONNECTIONS = 'max-connections'
+	HOST_CONNECTION_IDLE_TIMEOUT = 'connection-idle-timeout'
+	HOST_SYNC_CONCURRENCY = 'sync-concurrency'
+	HOST_SYNC_CONCURRENCY_PER_HOST = 'sync-concurrency-per-host'
+	HOST_SYNC_THREADS = 'sync-threads'
+	HOST_SYNC_DEADLINE = 'sync-deadline'
 
 	DUMPMANAGER_COLLECTION_INTERVAL = "collection-interval"
 	DUMPS_ENABLED = "enabled"
@@ -349,6 +378,16 @@ class Config:
 
 	TASKS_MAX_WORKERS = 'max-workers'
 
+	RPC_SERVER_MAX_WORKERS = 'max-workers'
+	RPC_SERVER_MAX_QUEUE = 'max-queue'
+	RPC_TRANSPORT = 'transport'
+	RPC_TRANSPORT_THREADS = 'threads'
+	RPC_TRANSPORT_EVENTS = 'events'
+
+	CHANGE_EVENTS_ENABLED = 'enabled'
+	CHANGE_EVENTS_BUFFER_SIZE = 'buffer-size'
+	CHANGE_EVENTS_POLL_TIMEOUT = 'poll-timeout'
+
 	GITHUB_ACCESS_TOKEN = "access-token"
 	GITHUB_REPOSITORY_OWNER = "repository-owner"
 	GITHUB_REPOSITORY_NAME = "repository-name"
@@ -462,11 +501,15 @@ class SettingsProvider:
 	def get_host_connections_settings(self):
 		"""
 		get host connections settings
-		:return: dict containing 'update-interval', 'availability-halftime', 'resource-sync-interval', 'component-timeout'
+		:return: dict containing 'update-interval', 'availability-halftime', 'resource-sync-interval', 'component-timeout',
+		         'max-connections', 'connection-idle-timeout', 'sync-concurrency', 'sync-concurrency-per-host',
+		         'sync-threads', 'sync-deadline'
 		:rtype: dict
 		"""
 		InternalError.check('host-connections' in self.original_settings[self.tomato_module], code=InternalError.CONFIGURATION_ERROR, message="host connection configuration missing")
-		return {k: v for k, v in self.original_settings[self.tomato_module]['host-connections'].iteritems()}
+		res = dict(default_settings.get(self.tomato_module, {}).get('host-connections') or {})
+		res.update(self.original_settings[self.tomato_module]['host-connections'])
+		return res
 
 	def get_db_settings(self):
 		"""
@@ -538,6 +581,36 @@ class SettingsProvider:
 		"""
 		return self.original_settings['rpc-timeout']
 
+	def get_rpc_server_settings(self):
+		"""
+		get the settings for the request dispatch of the own rpc server
+		:return: dict containing Config.RPC_SERVER_MAX_WORKERS, Config.RPC_SERVER_MAX_QUEUE and Config.RPC_TRANSPORT
+		:rtype: dict
+		"""
+		res = dict(default_settings['rpc-server'])
+		res.update(self.original_settings.get('rpc-server') or {})
+		return res
+
+	def get_rpc_client_settings(self):
+		"""
+		get the settings for the sslrpc2 proxies to other tomato modules
+		:return: dict containing Config.RPC_TRANSPORT
+		:rtype: dict
+		"""
+		res = dict(default_settings['rpc-client'])
+		res.update(self.original_settings.get('rpc-client') or {})
+		return res
+
+	def get_change_events_settings(self):
+		"""
+		get the settings for publishing and subscribing to change events
+		:return: dict containing Config.CHANGE_EVENTS_ENABLED, Config.CHANGE_EVENTS_BUFFER_SIZE and Config.CHANGE_EVENTS_POLL_TIMEOUT
+		:rtype: dict
+		"""
+		res = dict(default_settings['change-events'])
+		res.update(self.original_settings.get('change-events') or {})
+		return res
+
 	def get_user_quota(self, config_name):
 		"""
 		get quota parameters for the configuration configured in settings under this name
@@ -4,13 +4,21 @@ Created on Jan 24, 2014
 @author: dswd
 '''
 
-import threading, time, random
+import threading, time, random, heapq, multiprocessing, cPickle, traceback, bisect, resource
+from collections import deque
 
 MAX_WAIT = 3600.0
 
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", 1) # only defined in Python 3, the value is the one of Linux
+
+PRIORITY_HIGH = 0 # user-triggered work
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2 # background maintenance
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
 class Task(object):
-	__slots__ = ("timeout", "repeated", "fn", "args", "kwargs", "next_timeout", "busy", "next", "last", "duration", "success")
-	def __init__(self, fn, args=None, kwargs=None, timeout=0, repeated=False, immediate=False, random_offset=True):
+	__slots__ = ("timeout", "repeated", "fn", "args", "kwargs", "next_timeout", "busy", "next", "last", "duration", "success", "priority", "gate", "cpu_bound")
+	def __init__(self, fn, args=None, kwargs=None, timeout=0, repeated=False, immediate=False, random_offset=True, priority=PRIORITY_NORMAL, gate=None, cpu_bound=False):
 		if not kwargs:
 			kwargs = {}
 		if not args:
@@ -36,19 +44,27 @@ class Task(object):
 
 		self.next = time.time() + next_time
 
+		self.priority = priority
+		self.gate = gate # MaintenanceGate which decides when this may run
+		self.cpu_bound = cpu_bound # run in a ProcessPool
+
 		self.busy = False
 		self.last = None
 		self.duration = None
 		self.success = None
-	def execute(self):
+	def execute(self, pool=None):
 		self.last = time.time()
 		try:
-			self.fn(*self.args, **self.kwargs)
+			if pool:
+				pool.run(self.fn, *self.args, **self.kwargs)
+			else:
+				self.fn(*self.args, **self.kwargs)
 			self.success = True
-		except Exception:
+		except Exception, exc:
 			self.success = False
-			import traceback
 			traceback.print_exc()
+			if hasattr(exc, "remote_traceback"):
+				print exc.remote_traceback
 		self.duration = time.time()-self.last
 		self.last = self.next
 		if self.repeated:
@@ -56,13 +72,18 @@ class Task(object):
 			self.next_timeout = self.timeout
 		else:
 			self.next = 0
+	@property
+	def name(self):
+		return (self.fn.__module__+"." if self.fn.__module__ else "")+self.fn.__name__
 	def info(self):
 		return {
-			"method": (self.fn.__module__+"." if self.fn.__module__ else "")+self.fn.__name__,
+			"method": self.name,
 			"busy": self.busy,
 			"args": [str(arg) for arg in self.args],
 			"kwargs": {name: str(value) for name, value in self.kwargs.items()},
 			"repeated": self.repeated,
+			"priority": self.priority,
+			"cpu_bound": self.cpu_bound,
 			"timeout": self.timeout,
 			"next": self.next,
 			"last": self.last,
@@ -70,11 +91,479 @@ class Task(object):
 			"success": self.success
 		}
 
+def _threadCpuTime():
+	usage = resource.getrusage(RUSAGE_THREAD)
+	return usage.ru_utime + usage.ru_stime
+
+class Histogram(object):
+	"""
+	Counts values (in seconds) in logarithmic buckets.
+	"""
+	BOUNDS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 600.0) # upper bounds of the buckets, the last bucket has no upper bound
+	def __init__(self):
+		self.counts = [0] * (len(self.BOUNDS) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+	def add(self, value):
+		self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+		self.count += 1
+		self.sum += value
+		self.max = max(self.max, value)
+	def info(self):
+		return {
+			"bounds": list(self.BOUNDS),
+			"counts": list(self.counts),
+			"count": self.count,
+			"sum": self.sum,
+			"max": self.max,
+			"avg": self.sum / self.count if self.count else 0.0
+		}
+
+class TaskStatistics(object):
+	"""
+	Statistics about executed tasks: per task function histograms of the start lateness (start time - scheduled time),
+	run duration and CPU time of the worker thread, and the saturation of the workers per minute.
+	"""
+	SATURATION_MINUTES = 60
+	def __init__(self):
+		self.functions = {} #{name: {lateness, duration, cpu, runs, failures}}
+		self.minutes = deque(maxlen=self.SATURATION_MINUTES) #[{minute, busy_time, max_busy, workers}]
+		self.busy = 0
+		self.lock = threading.Lock()
+	def _minute(self, now, workers):
+		minute = int(now // 60) * 60
+		if not self.minutes or self.minutes[-1]["minute"] != minute:
+			self.minutes.append({"minute": minute, "busy_time": 0.0, "max_busy": self.busy, "workers": workers, "tasks": 0})
+		current = self.minutes[-1]
+		current["workers"] = max(current["workers"], workers)
+		return current
+	def started(self, workers):
+		with self.lock:
+			self.busy += 1
+			current = self._minute(time.time(), workers)
+			current["max_busy"] = max(current["max_busy"], self.busy)
+	def finished(self, task, lateness, duration, cpu, workers):
+		with self.lock:
+			self.busy -= 1
+			current = self._minute(time.time(), workers)
+			current["busy_time"] += duration
+			current["tasks"] += 1
+			stats = self.functions.get(task.name)
+			if not stats:
+				stats = self.functions[task.name] = {"lateness": Histogram(), "duration": Histogram(), "cpu": Histogram(), "runs": 0, "failures": 0}
+			stats["lateness"].add(max(lateness, 0.0))
+			stats["duration"].add(duration)
+			stats["cpu"].add(cpu)
+			stats["runs"] += 1
+			if not task.success:
+				stats["failures"] += 1
+	def info(self):
+		with self.lock:
+			return {
+				"functions": {name: {
+					"lateness": stats["lateness"].info(),
+					"duration": stats["duration"].info(),
+					"cpu": stats["cpu"].info(),
+					"runs": stats["runs"],
+					"failures": stats["failures"]
+				} for name, stats in self.functions.items()},
+				# saturation: share of the worker time spent in tasks. tasks are counted in the minute they end in.
+				"saturation": [dict(m, saturation=min(m["busy_time"] / 60.0 / m["workers"], 1.0) if m["workers"] else 0.0)
+				               for m in self.minutes],
+				"busy": self.busy
+			}
+
+def _processCpuTime():
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+def _runInProcess(fn, args, kwargs):
+	# the worker processes run one function at a time, so the cpu time of the process is that of the function
+	cpu = _processCpuTime()
+	try:
+		return True, fn(*args, **kwargs), _processCpuTime() - cpu
+	except Exception, exc:
+		return False, (exc, traceback.format_exc()), _processCpuTime() - cpu
+
+class ProcessPool(object):
+	"""
+	Runs cpu-bound functions in worker processes, so that they do not compete with the threads of this process for the GIL.
+	Functions must be defined at module level, and their arguments and results must be picklable.
+	The functions do not share any state with this process, i.e. they must not use locks, database connections, etc.
+	The worker processes are forked when the pool is used for the first time and are kept, since forking a
+	multithreaded process again and again is asking for trouble.
+	A worker process that dies (e.g. killed by the OOM killer) never returns its task, so every call has a timeout
+	after which the pool is replaced.
+	"""
+	def __init__(self, processes=None, maxTasksPerChild=None, timeout=600):
+		self.processes = processes or multiprocessing.cpu_count()
+		self.maxTasksPerChild = maxTasksPerChild
+		self.timeout = timeout
+		self._pool = None
+		self.started = None
+		self.busy = 0
+		self.busyTime = 0.0
+		self.completed = 0
+		self.failed = 0
+		self.cpuTime = 0.0
+		self.local = threading.local() # cpu time of the last call of each thread
+		self.lock = threading.Lock()
+	@staticmethod
+	def check(fn, args, kwargs):
+		"""
+		raises TypeError if fn, args or kwargs can not be passed to a worker process.
+		"""
+		try:
+			cPickle.dumps((fn, args, kwargs), cPickle.HIGHEST_PROTOCOL)
+		except (cPickle.PicklingError, TypeError), exc:
+			raise TypeError("cpu-bound task %r can not be passed to a process: %s" % (fn, exc))
+	def _getPool(self):
+		with self.lock:
+			if not self._pool:
+				self._pool = multiprocessing.Pool(self.processes, maxtasksperchild=self.maxTasksPerChild)
+				self.started = time.time()
+			return self._pool
+	def _replacePool(self, pool):
+		with self.lock:
+			if self._pool is not pool:
+				# another call has already replaced it
+				return
+			self._pool = None
+		# calls still running in this pool run into their timeout as well
+		pool.terminate()
+	def run(self, fn, *args, **kwargs):
+		"""
+		call fn(*args, **kwargs) in a worker process and wait for the result.
+		Exceptions are raised here again, the traceback of the worker process is in their remote_traceback attribute.
+		If there is no result after the timeout of the pool, the pool is replaced and multiprocessing.TimeoutError is
+		raised.
+		The cpu time the function used in the worker process is available with lastCpuTime() afterwards.
+		"""
+		self.check(fn, args, kwargs)
+		self.local.cpuTime = 0.0
+		pool = self._getPool()
+		with self.lock:
+			self.busy += 1
+		start = time.time()
+		try:
+			success, result, cpu = pool.apply_async(_runInProcess, (fn, args, kwargs)).get(self.timeout)
+		except multiprocessing.TimeoutError:
+			self._replacePool(pool)
+			with self.lock:
+				self.failed += 1
+			raise multiprocessing.TimeoutError("cpu-bound task %r did not finish within %s seconds" % (fn, self.timeout))
+		finally:
+			with self.lock:
+				self.busy -= 1
+				self.busyTime += time.time() - start
+		self.local.cpuTime = cpu
+		with self.lock:
+			self.cpuTime += cpu
+			if success:
+				self.completed += 1
+			else:
+				self.failed += 1
+		if success:
+			return result
+		exc, tb = result
+		try:
+			exc.remote_traceback = tb
+		except AttributeError:
+			pass
+		raise exc
+	def lastCpuTime(self):
+		"""
+		:return: cpu time in seconds that the last call of run() in this thread used in the worker process
+		"""
+		return getattr(self.local, "cpuTime", 0.0)
+	def stop(self):
+		with self.lock:
+			if self._pool:
+				self._pool.terminate()
+				self._pool = None
+	def info(self):
+		with self.lock:
+			running = time.time() - self.started if self.started else 0.0
+			return {
+				"processes": self.processes,
+				"started": self._pool is not None,
+				"busy": self.busy,
+				"completed": self.completed,
+				"failed": self.failed,
+				"busy_time": self.busyTime,
+				"cpu_time": self.cpuTime,
+				# share of the time all processes were busy since the pool was started, including waiting for a free process
+				"utilization": self.busyTime / running / self.processes if running else 0.0
+			}
+
+class PoolCall(object):
+	"""
+	A function call submitted to a ThreadPool.
+	"""
+	__slots__ = ("fn", "args", "kwargs", "key", "submitted", "started", "finished", "result", "error", "event")
+	def __init__(self, fn, args, kwargs, key=None):
+		self.fn = fn
+		self.args = args
+		self.kwargs = kwargs
+		self.key = key
+		self.submitted = time.time()
+		self.started = None
+		self.finished = None
+		self.result = None
+		self.error = None
+		self.event = threading.Event()
+	def run(self):
+		self.started = time.time()
+		try:
+			self.result = self.fn(*self.args, **self.kwargs)
+		except Exception, exc:
+			self.error = exc
+		finally:
+			self.finished = time.time()
+			self.event.set()
+	def wait(self, timeout=None):
+		"""
+		:return: whether the call has finished
+		"""
+		self.event.wait(timeout)
+		return self.event.isSet()
+	def get(self):
+		"""
+		wait for the call to finish and return its result, or raise its exception
+		"""
+		self.event.wait()
+		if self.error:
+			raise self.error
+		return self.result
+
+class ThreadPool(object):
+	"""
+	Runs blocking functions (e.g. RPC calls to hosts) in a bounded number of threads, so that many of them can wait
+	at the same time without tying up the workers of the TaskScheduler.
+	Threads are started when needed and end after being idle for a while.
+	Calls that run longer than the deadline are reported in info(). They can not be aborted here, the functions have to
+	enforce the deadline themselves, e.g. by using it as the timeout of their connections.
+	"""
+	def __init__(self, threads, deadline=None, idleTimeout=60.0):
+		self.threads = threads
+		self.deadline = deadline
+		self.idleTimeout = idleTimeout
+		self.queue = deque()
+		self.running = set()
+		self.workers = 0
+		self.idle = 0
+		self.completed = 0
+		self.failed = 0
+		self.late = 0 # calls that finished after their deadline
+		self.maxQueueTime = 0.0
+		self.condition = threading.Condition()
+	def submit(self, fn, *args, **kwargs):
+		"""
+		call fn(*args, **kwargs) in a thread of this pool.
+		:param key: (keyword argument) identifies the call in info(), e.g. a host name
+		:rtype: PoolCall
+		"""
+		call = PoolCall(fn, args, kwargs, kwargs.pop("key", None))
+		startThread = False
+		with self.condition:
+			self.queue.append(call)
+			if len(self.queue) > self.idle and self.workers < self.threads:
+				self.workers += 1
+				startThread = True
+			self.condition.notify()
+		if startThread:
+			thread = threading.Thread(target=self._workerLoop)
+			thread.daemon = True
+			thread.start()
+		return call
+	def _nextCall(self):
+		with self.condition:
+			idleSince = time.time()
+			while not self.queue:
+				if time.time() - idleSince >= self.idleTimeout:
+					self.workers -= 1
+					return None
+				self.idle += 1
+				self.condition.wait(self.idleTimeout)
+				self.idle -= 1
+			call = self.queue.popleft()
+			self.running.add(call)
+			self.maxQueueTime = max(self.maxQueueTime, time.time() - call.submitted)
+			return call
+	def _workerLoop(self):
+		while True:
+			call = self._nextCall()
+			if not call:
+				return
+			call.run()
+			with self.condition:
+				self.running.discard(call)
+				if call.error:
+					self.failed += 1
+				else:
+					self.completed += 1
+				if self.deadline and call.finished - call.started > self.deadline:
+					self.late += 1
+	def info(self):
+		now = time.time()
+		with self.condition:
+			return {
+				"threads": self.threads,
+				"workers": self.workers,
+				"idle": self.idle,
+				"queued": len(self.queue),
+				"running": len(self.running),
+				"completed": self.completed,
+				"failed": self.failed,
+				"deadline": self.deadline,
+				"late": self.late,
+				"overdue": [call.key for call in self.running if self.deadline and now - call.started > self.deadline],
+				"max_queue_time": self.maxQueueTime
+			}
+
+class ConcurrencyLimit(object):
+	"""
+	Limits how many tasks run at the same time, in total and per group (e.g. per host).
+	Can be shared by several maintenance schedules.
+	"""
+	def __init__(self, maxConcurrent=None, maxPerGroup=None):
+		self.maxConcurrent = maxConcurrent
+		self.maxPerGroup = maxPerGroup
+		self.running = 0
+		self.groups = {} #{group: running}
+		self.denied = 0
+		self.timeouts = 0 # calls of acquire() that got no slot in time
+		self.lock = threading.Condition()
+	def _isFull(self, group):
+		if self.maxConcurrent and self.running >= self.maxConcurrent:
+			return True
+		return group is not None and self.maxPerGroup and self.groups.get(group, 0) >= self.maxPerGroup
+	def _take(self, group):
+		self.running += 1
+		if group is not None:
+			self.groups[group] = self.groups.get(group, 0) + 1
+	def tryAcquire(self, group=None):
+		with self.lock:
+			if self._isFull(group):
+				self.denied += 1
+				return False
+			self._take(group)
+			return True
+	def acquire(self, group=None, timeout=None):
+		"""
+		waits until a slot is free, at most timeout seconds.
+		:return: whether a slot has been acquired
+		"""
+		end = time.time() + timeout if timeout is not None else None
+		with self.lock:
+			if self._isFull(group):
+				self.denied += 1
+			while self._isFull(group):
+				remaining = end - time.time() if end is not None else None
+				if remaining is not None and remaining <= 0:
+					self.timeouts += 1
+					return False
+				self.lock.wait(remaining)
+			self._take(group)
+			return True
+	def release(self, group=None):
+		with self.lock:
+			self.running -= 1
+			if group is not None:
+				self.groups[group] -= 1
+				if not self.groups[group]:
+					del self.groups[group]
+			self.lock.notify_all()
+	def info(self):
+		with self.lock:
+			return {
+				"max_concurrent": self.maxConcurrent,
+				"max_per_group": self.maxPerGroup,
+				"running": self.running,
+				"busiest_group": max(self.groups.values()) if self.groups else 0,
+				"denied": self.denied,
+				"timeouts": self.timeouts
+			}
+
+class MaintenanceGate(object):
+	"""
+	Decides when the tasks of one maintenance schedule may run.
+	Tasks are spread evenly over the interval: every task reserves the next free slot of a token bucket
+	with a rate of (number of objects / interval), plus some jitter. If a ConcurrencyLimit is given,
+	tasks that exceed it are moved to the next free slot as well.
+	"""
+	RATE_FACTOR = 1.25 # slack so that delays do not accumulate over several intervals
+	def __init__(self, interval, limit=None):
+		self.interval = interval
+		self.limit = limit
+		self.groups = {} #{key: group}
+		self.rate = 1.0
+		self.nextSlot = 0.0
+		self.reserved = {} #{key: time}
+		self.running = {} #{key: group}
+		self.lock = threading.Lock()
+	def setKeys(self, keys):
+		"""
+		:param keys: list of object identifiers, or dict {identifier: group} to limit concurrency per group
+		"""
+		with self.lock:
+			self.groups = dict(keys) if isinstance(keys, dict) else {}
+			self.rate = max(len(keys), 1) * self.RATE_FACTOR / self.interval
+	def _reserve(self, key, now):
+		self.nextSlot = max(self.nextSlot, now) + 1.0 / self.rate
+		slot = self.nextSlot + random.random() / self.rate
+		self.reserved[key] = slot
+		return slot - now
+	def acquire(self, key):
+		"""
+		:return: None if the task may run now, otherwise the number of seconds to wait
+		"""
+		now = time.time()
+		with self.lock:
+			slot = self.reserved.pop(key, None)
+			if slot is None and self.nextSlot > now:
+				return self._reserve(key, now)
+			if slot is None:
+				self.nextSlot = now + 1.0 / self.rate
+			elif slot > now:
+				self.reserved[key] = slot
+				return slot - now
+			group = self.groups.get(key)
+			if self.limit and not self.limit.tryAcquire(group):
+				return self._reserve(key, now)
+			self.running[key] = group
+			return None
+	def forget(self, key):
+		with self.lock:
+			self.reserved.pop(key, None)
+	def release(self, key):
+		with self.lock:
+			group = self.running.pop(key)
+		if self.limit:
+			self.limit.release(group)
+	def info(self):
+		with self.lock:
+			return {
+				"interval": self.interval,
+				"objects": int(round(self.rate * self.interval / self.RATE_FACTOR)),
+				"running": len(self.running),
+				"reserved": len(self.reserved),
+				"backlog": max(self.nextSlot - time.time(), 0.0),
+				"limit": self.limit.info() if self.limit else None
+			}
+
 class TaskScheduler(threading.Thread):
-	__slots__ = ("tasks", "tasksLock", "nextId", "workers", "workersLock", "stopped", "wakeup", "stopped_confirm", "maxLateTime", "maxWorkers", "minWorkers", "waitFrac")
+	__slots__ = ("tasks", "queues", "maintenance", "processPool", "statistics", "tasksLock", "nextId", "workers", "workersLock", "stopped", "wakeup", "stopped_confirm", "maxLateTime", "maxWorkers", "minWorkers", "waitFrac")
 	DAILY = 3600*24
-	def __init__(self, maxLateTime=2.0, maxWorkers=5, minWorkers=1):
+	def __init__(self, maxLateTime=2.0, maxWorkers=5, minWorkers=1, processes=None):
 		self.tasks = {}
+		# a heap of (next, taskId) per priority. Entries are not removed when tasks are cancelled, executed or rescheduled,
+		# instead entries that do not match a waiting task anymore are skipped (see _validEntry).
+		self.queues = {prio: [] for prio in PRIORITIES}
+		self.maintenance = {} #{name: MaintenanceGate}
+		self.processPool = ProcessPool(processes)
+		self.statistics = TaskStatistics()
 		self.tasksLock = threading.RLock()
 		self.nextId = 1
 		self.workers = 0
@@ -89,13 +578,37 @@ class TaskScheduler(threading.Thread):
 		self.waitFrac = 0.5
 		self.lastTask = 0
 		self.taskRate = 0
+	def _validEntry(self, entry):
+		task = self.tasks.get(entry[1])
+		return task is not None and not task.busy and task.next == entry[0]
+	def _enqueue(self, taskId, task):
+		queue = self.queues[task.priority]
+		heapq.heappush(queue, (task.next, taskId))
+		if len(queue) > 2 * len(self.tasks) + 1000:
+			# too many outdated entries, e.g. from cancelled tasks
+			queue[:] = [(t.next, tid) for tid, t in self.tasks.iteritems() if not t.busy and t.priority == task.priority]
+			heapq.heapify(queue)
 	def _nextTask(self):
-		try:
-			with self.tasksLock:
-				availableTasks = filter(lambda (tid, task): not task.busy, self.tasks.items())
-				return min(availableTasks, key=lambda (tid, task): task.next)
-		except ValueError:
-			return (None, None)
+		"""
+		:return: (taskId, task) of the due task with the highest priority, or the task that is due next
+		"""
+		now = time.time()
+		with self.tasksLock:
+			first = None
+			for prio in PRIORITIES:
+				queue = self.queues[prio]
+				while queue and not self._validEntry(queue[0]):
+					heapq.heappop(queue)
+				if not queue:
+					continue
+				if queue[0][0] <= now:
+					first = queue[0]
+					break
+				if first is None or queue[0] < first:
+					first = queue[0]
+			if first is None:
+				return (None, None)
+			return (first[1], self.tasks[first[1]])
 	def _waitTime(self):
 		with self.tasksLock:
 			_, nextTask = self._nextTask()
@@ -145,8 +658,25 @@ class TaskScheduler(threading.Thread):
 				return
 			if task.busy:
 				return
+			gated = task.gate and not force
+			if gated:
+				delay = task.gate.acquire(task.args[0])
+				if delay is not None:
+					task.next = time.time() + delay
+					self._enqueue(taskId, task)
+					return
 			task.busy = True
-		task.execute()
+		lateness = time.time() - task.next
+		self.statistics.started(self.workers)
+		cpu = _threadCpuTime()
+		try:
+			task.execute(self.processPool if task.cpu_bound else None)
+		finally:
+			if gated:
+				task.gate.release(task.args[0])
+		# cpu-bound tasks hardly use any cpu time in this thread, only in the worker process
+		cpu = self.processPool.lastCpuTime() if task.cpu_bound else _threadCpuTime() - cpu
+		self.statistics.finished(task, lateness, task.duration, cpu, self.workers)
 		now = time.time()
 		if int(now) % 60 != int(self.lastTask) % 60:
 			self.taskRate *= 0.5
@@ -155,7 +685,9 @@ class TaskScheduler(threading.Thread):
 		with self.tasksLock:
 			task.busy = False
 			if not task.repeated:
-				del self.tasks[taskId]
+				self.tasks.pop(taskId, None)
+			elif taskId in self.tasks:
+				self._enqueue(taskId, task)
 		return True
 	def run(self):
 		with self.workersLock:
@@ -168,46 +700,73 @@ class TaskScheduler(threading.Thread):
 		self.stopped = True
 		self.wakeup.set()
 		self.stopped_confirm.wait()
+		self.processPool.stop()
 	def _schedule(self, task):
-		taskid = self.nextId
-		self.tasks[taskid] = task
-		self.nextId += 1
+		with self.tasksLock:
+			taskid = self.nextId
+			self.tasks[taskid] = task
+			self._enqueue(taskid, task)
+			self.nextId += 1
 		self.wakeup.set()
 		self.wakeup.clear()
 		return taskid
+	def runInProcess(self, fn, *args, **kwargs):
+		"""
+		run a cpu-bound function in the process pool of this scheduler and return its result, see ProcessPool.run.
+		"""
+		return self.processPool.run(fn, *args, **kwargs)
 	def scheduleOnce(self, timeout, fn, *args, **kwargs):
-		return self._schedule(Task(fn, args, kwargs, timeout=timeout, repeated=False))
+		priority = kwargs.pop("priority", PRIORITY_NORMAL)
+		cpu_bound = kwargs.pop("cpu_bound", False)
+		if cpu_bound:
+			ProcessPool.check(fn, args, kwargs)
+		return self._schedule(Task(fn, args, kwargs, timeout=timeout, repeated=False, priority=priority, cpu_bound=cpu_bound))
 	def scheduleRepeated(self, timeout, fn, *args, **kwargs):
 		#print "Ignoring task %s" % fn
 		#return
 		immediate = kwargs.pop("immediate", True)
 		random_offset = kwargs.pop("random_offset", True)
-		return self._schedule(Task(fn, args, kwargs, timeout=timeout, repeated=True, immediate=immediate, random_offset=random_offset))
+		priority = kwargs.pop("priority", PRIORITY_NORMAL)
+		gate = kwargs.pop("gate", None)
+		cpu_bound = kwargs.pop("cpu_bound", False)
+		if cpu_bound:
+			ProcessPool.check(fn, args, kwargs)
+		return self._schedule(Task(fn, args, kwargs, timeout=timeout, repeated=True, immediate=immediate, random_offset=random_offset, priority=priority, gate=gate, cpu_bound=cpu_bound))
 
-	def scheduleMaintenance(self, timeout, keyfn, maintenancefn):
+	def scheduleMaintenance(self, timeout, keyfn, maintenancefn, limit=None, priority=PRIORITY_LOW):
 		"""
 		schedule maintenance for multiple objects.
 		Objects may be created or removed, without affecting maintenance (except for missing it once, maybe)
+		The maintenance of all objects is spread evenly over the interval, see MaintenanceGate.
 		:param timeout: interval in which to run maintenance (per object)
-		:param keyfn: function which returns a list of object identifiers to be used by maintenancefn
+		:param keyfn: function which returns a list of object identifiers to be used by maintenancefn,
+		              or a dict {identifier: group} if limit should also be applied per group (e.g. per host)
 		:param maintenancefn: function takes an object identifier as argument, and runs the maintenance.
+		:param ConcurrencyLimit limit: limit for concurrently running maintenance, may be shared by several maintenance schedules
+		:param priority: priority of the maintenance tasks, tasks with a higher priority are run first
 		:return: maintenance scheduler id
 		"""
+		name = keyfn.__module__+"."+keyfn.__name__
+		gate = MaintenanceGate(timeout, limit)
+		current_tasks = {} #{ident: taskId}
 		def maintenance_scheduler():
-			to_sync = set(keyfn())
-			current_tasks = {t.args[0]: tid for tid, t in self.tasks.items() if t.fn == maintenancefn}
+			keys = keyfn()
+			gate.setKeys(keys)
+			to_sync = set(keys)
 			syncing = set(current_tasks.keys())
 			for ident in to_sync - syncing:
-				self.scheduleRepeated(timeout, maintenancefn, ident, random_offset=True, immediate=True)
+				current_tasks[ident] = self.scheduleRepeated(timeout, maintenancefn, ident, random_offset=True, immediate=True, priority=priority, gate=gate)
 			for ident in syncing - to_sync:
-				self.cancelTask(current_tasks[ident])
-		maintenance_scheduler.__name__ = "maintenance_scheduler:" + keyfn.__module__+"."+keyfn.__name__
+				self.cancelTask(current_tasks.pop(ident))
+				gate.forget(ident)
+		maintenance_scheduler.__name__ = "maintenance_scheduler:" + name
 		maintenance_scheduler.__module__ = ""
-		self.scheduleRepeated(timeout, maintenance_scheduler, immediate=True)
+		self.maintenance["%s:%s" % (name, maintenancefn.__name__)] = gate
+		return self.scheduleRepeated(timeout, maintenance_scheduler, immediate=True)
 
 	def cancelTask(self, taskId):
 		with self.tasksLock:
-			del self.tasks[taskId]
+			del self.tasks[taskId] # its queue entry is skipped from now on
 	def info(self):
 		tasks = []
 		with self.tasksLock:
@@ -223,6 +782,15 @@ class TaskScheduler(threading.Thread):
 			"workers": self.workers,
 			"wait_frac": self.waitFrac,
 			"last_task": self.lastTask,
-			"task_rate": self.taskRate / 2.0
+			"task_rate": self.taskRate / 2.0,
+			"maintenance": {name: gate.info() for name, gate in self.maintenance.items()},
+			"process_pool": self.processPool.info()
 		}
 		return info
+	def stats(self):
+		"""
+		:return: execution statistics, see TaskStatistics
+		"""
+		info = self.statistics.info()
+		info.update(workers=self.workers, min_workers=self.minWorkers, max_workers=self.maxWorkers, tasks=len(self.tasks))
+		return info
@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-import thread, time, datetime, string, types
+import thread, time, datetime, string, types, hashlib, json
 from decorators import xmlRpcSafe
 
 def wrap_task(fn):
@@ -153,6 +153,13 @@ def xml_rpc_sanitize(s):
 		return dict([(str(k), xml_rpc_sanitize(v)) for k, v in s.iteritems()])
 	return str(s)
 
+def fingerprint(obj):
+	"""
+	Returns a hash of a json-compatible object (e.g. the capabilities of a host).
+	Equal objects have equal hashes, regardless of dict ordering and of str/unicode and tuple/list differences.
+	"""
+	return hashlib.sha1(json.dumps(obj, sort_keys=True)).hexdigest()
+
 def xml_rpc_safe(s):
 	if s == None:
 		return True
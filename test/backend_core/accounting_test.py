@@ -0,0 +1,122 @@
+import unittest, os, imp, random
+
+usage = imp.load_source("usage", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+	"backend_core", "tomato", "host", "usage.py"))
+
+HOST = "host1"
+
+
+def statisticsRecord(begin, memory=1.0, diskspace=2.0, traffic=3.0, cputime=4.0):
+	return {"type": "single", "begin": begin, "end": begin + 0.01, "measurements": 1,
+		"usage": {"memory": memory, "diskspace": diskspace, "traffic": traffic, "cputime": cputime}}
+
+
+def exportColumns(records):
+	return {
+		"begin": [rec[0] for rec in records],
+		"end": [rec[0] + 0.01 for rec in records],
+		"measurements": [1] * len(records),
+		"memory": [rec[1] for rec in records],
+		"diskspace": [rec[2] for rec in records],
+		"traffic": [rec[3] for rec in records],
+		"cputime": [rec[4] for rec in records],
+	}
+
+
+def randomRecords(rnd, count, start=1500000000):
+	return [(start + 60 * i, rnd.random() * 1e9, rnd.random() * 1e10, rnd.random() * 1e6, rnd.random()) for i in xrange(count)]
+
+
+def merge(chunks):
+	res = ({}, {})
+	for chunk in chunks:
+		for index in (0, 1):
+			for id_, records in chunk[index].iteritems():
+				res[index].setdefault(id_, []).extend(records)
+	return res
+
+
+class ConversionTestCase(unittest.TestCase):
+
+	def test_statistics_keeps_all_records(self):
+		data = {"1": [statisticsRecord(1000.5), statisticsRecord(1060.5, memory=5.0), statisticsRecord(1120.5)], "2": []}
+		res = usage.fromStatistics(data, HOST)
+		self.assertEqual(sorted(res.keys()), ["1@host1", "2@host1"])
+		self.assertEqual(res["1@host1"], [(1000, 1.0, 2.0, 3.0, 4.0), (1060, 5.0, 2.0, 3.0, 4.0), (1120, 1.0, 2.0, 3.0, 4.0)])
+		self.assertEqual(res["2@host1"], [])
+
+	def test_export_keeps_all_records(self):
+		rnd = random.Random(0)
+		records = dict((str(num), randomRecords(rnd, rnd.randint(0, 20))) for num in xrange(100))
+		res = usage.fromExport(dict((num, exportColumns(recs)) for num, recs in records.iteritems()), HOST)
+		self.assertEqual(res, dict(("%s@%s" % (num, HOST), recs) for num, recs in records.iteritems()))
+
+	def test_both_formats_agree(self):
+		records = randomRecords(random.Random(1), 15)
+		fromStatistics = usage.fromStatistics({"7": [statisticsRecord(*rec) for rec in records]}, HOST)
+		fromExport = usage.fromExport({"7": exportColumns(records)}, HOST)
+		self.assertEqual(fromStatistics, fromExport)
+
+	def test_last_begin(self):
+		self.assertEqual(usage.lastBegin({}, {"1@h": []}), None)
+		self.assertEqual(usage.lastBegin({"1@h": [(10, 0, 0, 0, 0), (30, 0, 0, 0, 0)]}, {"2@h": [(20, 0, 0, 0, 0)]}), 30)
+
+	def test_missing(self):
+		self.assertEqual(usage.missing([1, 2, 3], {"1": [], "3": []}), [2])
+
+
+class ChunkTestCase(unittest.TestCase):
+
+	def check(self, elements, connections, maxBytes):
+		chunks = list(usage.chunks(elements, connections, maxBytes))
+		previous = None
+		for els, cons, last in chunks:
+			begins = [rec[0] for objects in (els, cons) for recs in objects.itervalues() for rec in recs]
+			# all records up to the last begin of a chunk are in it or in the chunks before
+			self.assertEqual(max(begins), last)
+			self.assertTrue(previous is None or min(begins) > previous)
+			previous = last
+			# only the records of the last begin may exceed the limit, they are not split up
+			earlier = [(id_, [rec for rec in recs if rec[0] != last]) for objects in (els, cons) for id_, recs in objects.iteritems()]
+			size = sum(usage.OBJECT_BYTES + len(id_) + len(recs) * usage.RECORD_BYTES for id_, recs in earlier if recs)
+			self.assertTrue(size <= maxBytes or len(set(begins)) == 1)
+		self.assertEqual(merge(chunk[:2] for chunk in chunks), (dict((k, v) for k, v in elements.iteritems() if v),
+			dict((k, v) for k, v in connections.iteritems() if v)))
+		return chunks
+
+	def test_single_chunk(self):
+		rnd = random.Random(2)
+		elements = {"1@h": randomRecords(rnd, 3)}
+		connections = {"2@h": randomRecords(rnd, 2)}
+		self.assertEqual(len(self.check(elements, connections, usage.MAX_PUSH_BYTES)), 1)
+
+	def test_many_objects(self):
+		rnd = random.Random(3)
+		elements = dict(("%d@h" % num, randomRecords(rnd, rnd.randint(0, 30), rnd.randint(0, 1000))) for num in xrange(500))
+		connections = dict(("%d@h" % num, randomRecords(rnd, rnd.randint(0, 30), rnd.randint(0, 1000))) for num in xrange(500, 800))
+		self.assertTrue(len(self.check(elements, connections, 4096)) > 1)
+
+	def test_large_object_is_split(self):
+		elements = {"1@h": randomRecords(random.Random(4), 1000)}
+		chunks = self.check(elements, {}, 1024)
+		self.assertTrue(len(chunks) > 1)
+		self.assertEqual(sum(len(els["1@h"]) for els, _, _ in chunks), 1000)
+
+	def test_same_begin_is_not_split(self):
+		elements = {"1@h": randomRecords(random.Random(5), 10), "2@h": randomRecords(random.Random(6), 10)}
+		self.assertEqual(len(self.check(elements, {}, 1)), 10)
+
+	def test_export_page_fits_into_one_chunk(self):
+		records = randomRecords(random.Random(7), usage.EXPORT_LIMIT)
+		elements = dict(("%d@%s" % (num, "h" * 50), [rec]) for num, rec in enumerate(records))
+		self.assertEqual(len(self.check(elements, {}, usage.MAX_PUSH_BYTES)), 1)
+
+	def test_empty(self):
+		self.assertEqual(list(usage.chunks({}, {"1@h": []})), [])
+
+
+def suite():
+	return unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(ConversionTestCase),
+		unittest.TestLoader().loadTestsFromTestCase(ChunkTestCase),
+	])
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+"""
+Benchmark for the hostmanager usage record rollup.
+
+Fills an SQLite database with the usage records of many elements as they
+are after a few months of operation and measures one accounting update at
+the start of an hour, i.e. with new 5minutes and hour records. The previous
+implementation, a few ORM queries per element and record type, is emulated
+with the same statements it issued. The set-based version uses rollup.py.
+Both run in one transaction and are checked to produce the same records.
+
+Production hosts use PostgreSQL, so absolute numbers differ, but the number
+of statements per update is the same.
+
+usage: python accounting_rollup_bench.py [--elements 1000]
+"""
+
+import os, sys, time, argparse, imp, re, sqlite3, random
+
+rollup = imp.load_source("rollup", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+	"hostmanager", "tomato", "rollup.py"))
+
+TYPES = ["single", "5minutes", "hour", "day", "month", "year"]
+KEEP_RECORDS = {"single": 15, "5minutes": 12, "hour": 24, "day": 30, "month": 12, "year": 5}
+LENGTH = {"single": 60, "5minutes": 300, "hour": 3600, "day": 86400, "month": 30 * 86400, "year": 365 * 86400}
+COLUMNS = '"statistics_id", "type", "begin", "end", "measurements", "memory", "diskspace", "traffic", "cputime"'
+
+
+class Cursor(object):
+	"""
+	DB-API cursor with %s parameters like the Django cursors, also counts the statements
+	"""
+	def __init__(self, cursor):
+		self.cursor = cursor
+		self.statements = 0
+	def _sql(self, sql):
+		return re.sub(r"%\((\w+)\)s", r":\1", sql).replace("%s", "?")
+	def execute(self, sql, params=()):
+		self.statements += 1
+		return self.cursor.execute(self._sql(sql), params)
+	def executemany(self, sql, params):
+		self.statements += 1
+		return self.cursor.executemany(self._sql(sql), params)
+	def fetchall(self):
+		return self.cursor.fetchall()
+	@property
+	def rowcount(self):
+		return self.cursor.rowcount
+
+
+def setup(elements, now, rnd):
+	db = sqlite3.connect(":memory:")
+	db.execute('CREATE TABLE stats (id INTEGER PRIMARY KEY, "begin" REAL)')
+	db.execute('CREATE TABLE rec (id INTEGER PRIMARY KEY AUTOINCREMENT, statistics_id INTEGER, type TEXT, "begin" REAL, "end" REAL,'
+		' measurements INTEGER, memory REAL, diskspace REAL, traffic REAL, cputime REAL)')
+	db.execute('CREATE INDEX rec_stats ON rec (statistics_id)')
+	records = []
+	for id_ in xrange(1, elements + 1):
+		db.execute('INSERT INTO stats VALUES (?, ?)', (id_, now - 400 * 86400))
+		for type_ in TYPES:
+			for i in xrange(1, KEEP_RECORDS[type_] + 1):
+				end = now - 1 - (i - 1) * LENGTH[type_] if type_ == "single" else now - LENGTH["hour"] - (i - 1) * LENGTH[type_]
+				records.append((id_, type_, end - LENGTH[type_], end, 1, rnd.random() * 1e9, rnd.random() * 1e10, rnd.random() * 1e6, rnd.random()))
+	db.executemany('INSERT INTO rec (%s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)' % COLUMNS, records)
+	db.commit()
+	return db
+
+
+def ranges(now):
+	res = {}
+	for type_ in TYPES[1:]:
+		end = now - now % LENGTH[type_] if type_ in ("5minutes", "hour") else now - LENGTH["hour"]
+		res[type_] = (end - LENGTH[type_], end)
+	return res
+
+
+def legacy(cursor, singles, rng):
+	for record in singles:
+		id_ = record[0]
+		cursor.execute('INSERT INTO rec (' + COLUMNS + ') VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)', record)
+		cursor.execute('SELECT "begin" FROM stats WHERE id = %s', [id_])
+		statsBegin = cursor.fetchall()[0][0]
+		lastType = TYPES[0]
+		for type_ in TYPES[1:]:
+			begin, end = rng[type_]
+			begin = max(begin, statsBegin)
+			if statsBegin > end:
+				break
+			cursor.execute('SELECT 1 FROM rec WHERE statistics_id = %s AND type = %s AND "begin" = %s AND "end" = %s LIMIT 1', [id_, type_, begin, end])
+			if cursor.fetchall():
+				break
+			cursor.execute('SELECT measurements, memory, diskspace, traffic, cputime FROM rec WHERE statistics_id = %s AND type = %s'
+				' AND "begin" >= %s AND "end" <= %s', [id_, lastType, begin, end])
+			rows = cursor.fetchall()
+			measurements = sum(r[0] for r in rows)
+			if measurements:
+				combined = (measurements, sum(r[1] * r[0] for r in rows) / measurements, sum(r[2] * r[0] for r in rows) / measurements,
+					sum(r[3] for r in rows), sum(r[4] for r in rows))
+			else:
+				combined = (0, 0.0, 0.0, 0.0, 0.0)
+			cursor.execute('INSERT INTO rec (' + COLUMNS + ') VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)', (id_, type_, begin, end) + combined)
+			lastType = type_
+		for type_ in TYPES:
+			cursor.execute('SELECT id FROM rec WHERE statistics_id = %s AND type = %s ORDER BY "begin" DESC LIMIT -1 OFFSET %s', [id_, type_, KEEP_RECORDS[type_]])
+			for (recordId,) in cursor.fetchall():
+				cursor.execute('DELETE FROM rec WHERE id = %s', [recordId])
+
+
+def setBased(cursor, singles, rng):
+	rollup.insertRecords(cursor, "rec", singles)
+	rollup.combine(cursor, "rec", "stats", [r[0] for r in singles], TYPES, rng)
+	rollup.removeOld(cursor, "rec", KEEP_RECORDS)
+
+
+def snapshot(db):
+	return sorted(tuple(round(v, 3) if isinstance(v, float) else v for v in row)
+		for row in db.execute('SELECT ' + COLUMNS + ' FROM rec'))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="usage record rollup benchmark")
+	parser.add_argument("--elements", type=int, default=1000, help="number of elements on the host")
+	options = parser.parse_args()
+	now = 1500000000 - 1500000000 % 3600 + 2
+	rng = ranges(now)
+	print "%-10s %8s %10s %12s %10s" % ("rollup", "elements", "time ms", "statements", "records")
+	results = []
+	for name, fn in (("legacy", legacy), ("set-based", setBased)):
+		rnd = random.Random(0)
+		db = setup(options.elements, now, rnd)
+		singles = [(id_, "single", now - 1, now, 1, rnd.random() * 1e9, rnd.random() * 1e10, rnd.random() * 1e6, rnd.random())
+			for id_ in xrange(1, options.elements + 1)]
+		cursor = Cursor(db.cursor())
+		start = time.time()
+		fn(cursor, singles, rng)
+		db.commit()
+		duration = time.time() - start
+		results.append(snapshot(db))
+		print "%-10s %8d %10.1f %12d %10d" % (name, options.elements, duration * 1000, cursor.statements, len(results[-1]))
+	assert results[0] == results[1], "the rollups differ"
+
+
+if __name__ == "__main__":
+	main()
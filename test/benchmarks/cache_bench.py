@@ -0,0 +1,91 @@
+#!/usr/bin/python
+"""
+Contention benchmark for lib/cache.
+
+Lets a growing number of threads read a small set of keys from a cache whose
+function is slow, and compares the previous behaviour (the cache lock is
+held while the function runs) with the per-key in-flight de-duplication and
+the stale-while-revalidate mode.
+
+usage: python cache_bench.py [--threads 1,16,64] [--keys 8] [--duration SECONDS] [--load SECONDS] [--timeout SECONDS]
+"""
+
+import os, sys, time, threading, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared", "lib"))
+import cache
+
+
+class GlobalLockCache(cache.Cache):
+	"""
+	get() as it was before: the function runs while the cache lock is held,
+	so a slow call blocks the readers of all other keys.
+	"""
+	def get(self, args, kwargs):
+		with self._lock:
+			key = cache.Cache.getKey(args, kwargs)
+			if (not key in self._values) or (self._values[key]['timeout'] <= time.time()):
+				calltime = time.time()
+				self.set(args, kwargs, self._fn(*args, **kwargs), calltime=calltime)
+			return self._values[key]['value']
+
+
+def percentile(values, frac):
+	return values[min(int(len(values) * frac), len(values) - 1)]
+
+
+def run(factory, threads, keys, duration, load):
+	calls = [0]
+	counter = threading.Lock()
+	def fn(key):
+		with counter:
+			calls[0] += 1
+		time.sleep(load)
+		return key
+	c = factory(fn)
+	latencies = []
+	lock = threading.Lock()
+	end = time.time() + duration
+	def worker(offset):
+		own = []
+		i = offset
+		while time.time() < end:
+			start = time.time()
+			assert c.get((i % keys,), {}) == i % keys
+			own.append(time.time() - start)
+			i += 1
+		with lock:
+			latencies.extend(own)
+	workers = [threading.Thread(target=worker, args=(i,)) for i in xrange(threads)]
+	start = time.time()
+	for w in workers:
+		w.start()
+	for w in workers:
+		w.join()
+	total = time.time() - start
+	latencies.sort()
+	return len(latencies) / total, percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies), calls[0]
+
+
+def main():
+	parser = argparse.ArgumentParser(description="lib/cache contention benchmark")
+	parser.add_argument("--threads", default="1,16,64", help="comma-separated thread counts")
+	parser.add_argument("--keys", type=int, default=8, help="number of distinct keys")
+	parser.add_argument("--duration", type=float, default=3.0, help="seconds per run")
+	parser.add_argument("--load", type=float, default=0.02, help="seconds per function call")
+	parser.add_argument("--timeout", type=float, default=0.2, help="cache timeout in seconds")
+	options = parser.parse_args()
+	variants = [
+		("global-lock", lambda fn: GlobalLockCache(fn=fn, timeout=options.timeout)),
+		("single-flight", lambda fn: cache.Cache(fn=fn, timeout=options.timeout)),
+		("stale-revalidate", lambda fn: cache.Cache(fn=fn, timeout=options.timeout, staleWhileRevalidate=options.timeout)),
+	]
+	print "%-17s %8s %12s %10s %10s %10s %8s" % ("cache", "threads", "gets/s", "p50 ms", "p99 ms", "max ms", "loads")
+	for name, factory in variants:
+		for threads in map(int, options.threads.split(",")):
+			rate, p50, p99, worst, loads = run(factory, threads, options.keys, options.duration, options.load)
+			print "%-17s %8d %12.0f %10.3f %10.3f %10.1f %8d" % (name, threads, rate, p50 * 1000, p99 * 1000, worst * 1000, loads)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+"""
+Benchmark for the whole-topology placement planner.
+
+Builds synthetic topologies of VMs that are connected in switch groups and
+by direct links, and places them on a set of hosts spread over several
+sites. The previous behaviour, placing one VM after another with select()
+preferences that only see the neighbours placed before, is compared with
+PlacementPlanner. Reported are the time, the resulting affinity score (sum
+of the affinities of all connected pairs, as in Element.getLocationPrefs),
+the number of used sites and how unevenly the elements are spread.
+
+usage: python placement_bench.py [--vms 500] [--hosts 50] [--sites 5] [--seed 0]
+"""
+
+import os, sys, time, argparse, random, imp
+
+planner = imp.load_source("planner", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+	"backend_core", "tomato", "host", "planner.py"))
+
+IFACE_SHA = -20
+IFACE_SSA = 20
+
+
+class FakeHost(object):
+	def __init__(self, name, siteId, load, elements, connections):
+		self.name = name
+		self.siteId = siteId
+		self.componentErrors = 0
+		self.load = load
+		self.elements = elements
+		self.connections = connections
+
+
+def makeHosts(count, sites, rnd):
+	return [FakeHost("host%d" % i, "site%d" % (i % sites), rnd.random() * 0.5, rnd.randint(0, 100), rnd.randint(0, 100)) for i in xrange(count)]
+
+
+def makeTopology(vms, rnd):
+	"""
+	:return: list of groups, each a list of VM indices with one interface in the group
+	"""
+	groups = []
+	order = range(vms)
+	rnd.shuffle(order)
+	i = 0
+	while i < vms:
+		size = rnd.randint(2, 10)
+		groups.append(order[i:i+size])
+		i += size
+	for _ in xrange(vms / 2):
+		groups.append(rnd.sample(xrange(vms), 2))
+	return groups
+
+
+def sequential(hosts, vms, groups):
+	"""
+	one select() per VM in creation order, neighbours only count once they are placed
+	"""
+	neighbours = dict((vm, []) for vm in xrange(vms))
+	for group in groups:
+		for a in group:
+			neighbours[a].extend(b for b in group if b != a)
+	placed = {}
+	counts = dict((h.name, h.elements) for h in hosts)
+	byName = dict((h.name, h) for h in hosts)
+	for vm in xrange(vms):
+		avgEls = float(sum(counts.itervalues())) / len(hosts)
+		avgCons = float(sum(h.connections for h in hosts)) / len(hosts)
+		hostPrefs, sitePrefs = {}, {}
+		for other in neighbours[vm]:
+			if other in placed:
+				h = byName[placed[other]]
+				hostPrefs[h.name] = hostPrefs.get(h.name, 0.0) + 2 * IFACE_SHA
+				sitePrefs[h.siteId] = sitePrefs.get(h.siteId, 0.0) + 2 * IFACE_SSA
+		best, bestPref = None, None
+		for h in hosts:
+			pref = - h.componentErrors * 25 - h.load * 100
+			if avgEls:
+				pref -= max(-20.0, min(10.0 * (counts[h.name] - avgEls) / avgEls, 20.0))
+			if avgCons:
+				pref -= max(-10.0, min(10.0 * (h.connections - avgCons) / avgCons, 10.0))
+			pref += hostPrefs.get(h.name, 0.0) + sitePrefs.get(h.siteId, 0.0)
+			if bestPref is None or pref > bestPref:
+				best, bestPref = h, pref
+		placed[vm] = best.name
+		counts[best.name] += 1
+	return placed
+
+
+def batch(hosts, vms, groups):
+	p = planner.PlacementPlanner()
+	for vm in xrange(vms):
+		p.addElement(vm, hosts)
+	for group in groups:
+		p.addGroup([(vm, IFACE_SHA, IFACE_SSA) for vm in group])
+	return p.solve()
+
+
+def evaluate(hosts, groups, placed):
+	byName = dict((h.name, h) for h in hosts)
+	score = 0.0
+	for group in groups:
+		for i, a in enumerate(group):
+			for b in group[i+1:]:
+				if placed[a] == placed[b]:
+					score += 2 * IFACE_SHA
+				if byName[placed[a]].siteId == byName[placed[b]].siteId:
+					score += 2 * IFACE_SSA
+	counts = dict((h.name, h.elements) for h in hosts)
+	for name in placed.itervalues():
+		counts[name] += 1
+	sites = len(set(byName[name].siteId for name in placed.itervalues()))
+	return score, sites, max(counts.itervalues()) - min(counts.itervalues())
+
+
+def main():
+	parser = argparse.ArgumentParser(description="placement planner benchmark")
+	parser.add_argument("--vms", type=int, default=500, help="number of VMs in the topology")
+	parser.add_argument("--hosts", type=int, default=50, help="number of hosts")
+	parser.add_argument("--sites", type=int, default=5, help="number of sites")
+	parser.add_argument("--seed", type=int, default=0, help="random seed")
+	options = parser.parse_args()
+	rnd = random.Random(options.seed)
+	hosts = makeHosts(options.hosts, options.sites, rnd)
+	groups = makeTopology(options.vms, rnd)
+	print "%-12s %6s %6s %10s %12s %6s %8s" % ("placement", "vms", "hosts", "time ms", "affinity", "sites", "spread")
+	for name, fn in (("sequential", sequential), ("batch", batch)):
+		start = time.time()
+		placed = fn(hosts, options.vms, groups)
+		duration = time.time() - start
+		score, sites, spread = evaluate(hosts, groups, placed)
+		print "%-12s %6d %6d %10.1f %12.0f %6d %8d" % (name, options.vms, options.hosts, duration * 1000, score, sites, spread)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+"""
+Throughput/latency benchmark for the sslrpc2 proxies.
+
+Starts a local sslrpc2 server and lets a growing number of threads share one
+proxy, comparing the classic Proxy with the PipelinedProxy and the EventProxy.
+
+usage: python sslrpc2_bench.py [--calls N] [--threads 1,16,64,256] [--delay SECONDS] [--limit SECONDS] [--server threads|events]
+"""
+
+import os, sys, time, threading, tempfile, shutil, subprocess, argparse, ssl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared", "lib", "rpc"))
+import sslrpc2
+
+
+def create_cert(directory):
+	path = os.path.join(directory, "server.pem")
+	with open(os.devnull, "w") as devnull:
+		subprocess.check_call(["openssl", "req", "-x509", "-nodes", "-newkey", "rsa:2048", "-days", "1",
+			"-subj", "/CN=localhost", "-keyout", path, "-out", path], stdout=devnull, stderr=devnull)
+	return path
+
+
+def start_server(cert, delay, transport="threads"):
+	cls = sslrpc2.EventServer if transport == "events" else sslrpc2.Server
+	server = cls(("127.0.0.1", 0), keyfile=cert, certfile=cert, cert_reqs=ssl.CERT_NONE)
+	def echo(value):
+		if delay:
+			time.sleep(delay)
+		return value
+	server.register(echo)
+	server.daemon_threads = True
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+
+def percentile(values, frac):
+	return values[min(int(len(values) * frac), len(values) - 1)]
+
+
+def run(proxy, threads, calls, limit):
+	latencies = []
+	errors = []
+	lock = threading.Lock()
+	payload = {"id": 42, "name": "element", "attrs": range(20)}
+	def worker():
+		own = []
+		try:
+			for _ in xrange(calls):
+				start = time.time()
+				proxy.echo(payload)
+				own.append(time.time() - start)
+		except Exception, exc:
+			errors.append(exc)
+		with lock:
+			latencies.extend(own)
+	workers = [threading.Thread(target=worker) for _ in xrange(threads)]
+	start = time.time()
+	for w in workers:
+		w.daemon = True
+		w.start()
+	for w in workers:
+		w.join(max(start + limit - time.time(), 0.0))
+	duration = time.time() - start
+	stalled = len([w for w in workers if w.isAlive()])
+	with lock:
+		latencies.sort()
+		if not latencies:
+			return 0.0, 0.0, 0.0, len(errors), stalled
+		return len(latencies) / duration, percentile(latencies, 0.5), percentile(latencies, 0.99), len(errors), stalled
+
+
+def main():
+	parser = argparse.ArgumentParser(description="sslrpc2 proxy benchmark")
+	parser.add_argument("--calls", type=int, default=200, help="calls per thread")
+	parser.add_argument("--threads", default="1,16,64,256", help="comma-separated thread counts")
+	parser.add_argument("--delay", type=float, default=0.0, help="server-side delay per call in seconds")
+	parser.add_argument("--limit", type=float, default=60.0, help="give up on a run after this many seconds")
+	parser.add_argument("--server", choices=("threads", "events"), default="threads", help="server transport")
+	options = parser.parse_args()
+	tmp = tempfile.mkdtemp()
+	try:
+		server = start_server(create_cert(tmp), options.delay, options.server)
+		address = server.server_address
+		print "%-15s %8s %12s %10s %10s %8s %8s" % ("proxy", "threads", "calls/s", "p50 ms", "p99 ms", "errors", "stalled")
+		for cls in (sslrpc2.Proxy, sslrpc2.PipelinedProxy, sslrpc2.EventProxy):
+			for threads in map(int, options.threads.split(",")):
+				proxy = cls(address, timeout=120)
+				rate, p50, p99, errors, stalled = run(proxy, threads, options.calls, options.limit)
+				print "%-15s %8d %12.0f %10.2f %10.2f %8d %8d" % (cls.__name__, threads, rate, p50 * 1000, p99 * 1000, errors, stalled)
+	finally:
+		shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+"""
+Microbenchmark for the sslrpc2 message framing.
+
+Sends replies of growing size over a local socket pair and compares the
+current Message.writeTo/readFrom with the previous string based framing.
+Every case runs in its own process so the reported peak memory (max RSS
+growth during the case) is not influenced by earlier cases.
+
+usage: python sslrpc2_framing_bench.py [--sizes 1K,64K,1M,16M] [--rounds N] [--kind records|blob]
+"""
+
+import os, sys, time, socket, threading, subprocess, argparse, resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared", "lib", "rpc"))
+import sslrpc2, msgpack, snappy
+
+
+class LegacyConnection:
+	"""
+	The framing as it was before: file objects, string concatenation and a
+	full copy of every payload.
+	"""
+	def __init__(self, sock):
+		self.rfile = sock.makefile('rb', -1)
+		self.wfile = sock.makefile('wb', 0)
+
+	def read(self, size):
+		data = self.rfile.read(size)
+		if len(data) < size:
+			raise sslrpc2.ConnectionEnded()
+		return data
+
+	def write(self, data):
+		self.wfile.write(data)
+
+	def writeMessage(self, msg):
+		bytes = msgpack.packb(msg.encode())
+		method = sslrpc2.Message.Encoding.Raw
+		if len(bytes) > 100:
+			compressed = snappy.compress(bytes)
+			if len(compressed) < len(bytes):
+				bytes = compressed
+				method = sslrpc2.Message.Encoding.Snappy
+		size = len(bytes)
+		self.write(chr(method) + chr(size>>16) + chr((size>>8) & 0xff) + chr(size & 0xff) + bytes)
+
+	def readMessage(self, cls):
+		header = self.read(4)
+		method = ord(header[0])
+		size = (ord(header[1]) << 16) + (ord(header[2]) << 8) + (ord(header[3]))
+		bytes = self.read(size)
+		if method == sslrpc2.Message.Encoding.Snappy:
+			bytes = snappy.uncompress(bytes)
+		return cls.decode(msgpack.unpackb(bytes))
+
+
+class CurrentConnection(sslrpc2.FramedStream):
+	def __init__(self, sock):
+		self.socket = sock
+		self._initFraming()
+
+	def writeMessage(self, msg):
+		msg.writeTo(self)
+
+	def readMessage(self, cls):
+		return cls.readFrom(self)
+
+
+def parse_size(value):
+	units = {"K": 1 << 10, "M": 1 << 20}
+	if value[-1].upper() in units:
+		return int(value[:-1]) * units[value[-1].upper()]
+	return int(value)
+
+
+def make_value(size):
+	"""
+	Builds a list of element-info like dicts of roughly the given packed size.
+	Random ids keep snappy from compressing it to nothing.
+	"""
+	item = lambda i: {"id": "%024x" % (i * 2654435761 % (1 << 96)), "type": "kvmqm", "state": "started",
+		"attrs": {"cpus": i % 8, "ram": 512 + i % 4096, "name": "element-%d" % i, "usage": [i * 0.37, i * 1.91]}}
+	per_item = len(msgpack.packb(item(123456)))
+	return [item(i) for i in xrange(max(size // per_item, 1))]
+
+
+def run_case(impl, kind, size, rounds):
+	value = make_value(size) if kind == "records" else [os.urandom(size - 64)]
+	packed = len(msgpack.packb(value))
+	if packed >= 1 << 24:
+		# keep just below the frame limit
+		value = value[:int(len(value) * float((1 << 24) - 1024) / packed)]
+		packed = len(msgpack.packb(value))
+	a, b = socket.socketpair()
+	cls = {"legacy": LegacyConnection, "current": CurrentConnection}[impl]
+	writer, reader = cls(a), cls(b)
+	def send():
+		for i in xrange(rounds):
+			writer.writeMessage(sslrpc2.Reply(i, sslrpc2.Reply.Result.Success, value))
+	base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	thread = threading.Thread(target=send)
+	start = time.time()
+	thread.start()
+	for i in xrange(rounds):
+		reply = reader.readMessage(sslrpc2.Reply)
+		assert reply.id == i and len(reply.value) == len(value)
+	duration = time.time() - start
+	thread.join()
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+	print "%d %f %d" % (packed, duration, peak)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="sslrpc2 framing benchmark")
+	parser.add_argument("--sizes", default="1K,16K,256K,1M,4M,16M", help="comma-separated payload sizes")
+	parser.add_argument("--rounds", type=int, default=0, help="messages per case (default: scaled by size)")
+	parser.add_argument("--kind", choices=("records", "blob"), default="records", help="nested dicts or one incompressible string")
+	parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+	options = parser.parse_args()
+	if options.case:
+		run_case(options.case[0], options.kind, parse_size(options.case[1]), options.rounds)
+		return
+	print "%-8s %10s %8s %12s %12s %14s" % ("impl", "size", "rounds", "MB/s", "msgs/s", "peak RSS KB")
+	for size in options.sizes.split(","):
+		rounds = options.rounds or max(min((64 << 20) // parse_size(size), 2000), 4)
+		for impl in ("legacy", "current"):
+			output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--kind", options.kind, "--rounds", str(rounds), "--case", impl, size])
+			packed, duration, peak = output.split()
+			packed, duration = int(packed), float(duration)
+			print "%-8s %10s %8d %12.1f %12.0f %14s" % (impl, size, rounds, packed * rounds / duration / (1 << 20), rounds / duration, peak)
+
+
+if __name__ == "__main__":
+	main()
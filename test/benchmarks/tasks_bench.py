@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""
+Benchmark for the TaskScheduler task selection.
+
+Fills a scheduler (without starting it) with repeated tasks that are due in
+the future and measures what one worker wakeup costs, i.e. _waitTime() and
+_nextTask(), as well as scheduling, cancelling and executing tasks. The
+previous implementation that scanned all tasks on every wakeup is included
+for comparison.
+
+usage: python tasks_bench.py [--tasks 1000,10000,100000] [--wakeups N]
+"""
+
+import os, sys, time, argparse, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared", "lib"))
+import tasks
+
+
+class LegacyTaskScheduler(tasks.TaskScheduler):
+	"""
+	Task selection as it was before: filter and min over all tasks.
+	"""
+	def _nextTask(self):
+		try:
+			with self.tasksLock:
+				availableTasks = filter(lambda (tid, task): not task.busy, self.tasks.items())
+				return min(availableTasks, key=lambda (tid, task): task.next)
+		except ValueError:
+			return (None, None)
+	def _enqueue(self, taskId, task):
+		pass
+
+
+def noop(ident):
+	pass
+
+
+def run(cls, count, wakeups):
+	scheduler = cls()
+	random.seed(0)
+	start = time.time()
+	ids = [scheduler.scheduleRepeated(3600, noop, i, immediate=False) for i in xrange(count)]
+	schedule = (time.time() - start) / count
+
+	start = time.time()
+	for _ in xrange(wakeups):
+		scheduler._waitTime()
+		scheduler._nextTask()
+	wakeup = (time.time() - start) / wakeups
+
+	# make some tasks due and execute them like a worker does
+	due = ids[:wakeups]
+	for taskId in due:
+		scheduler.tasks[taskId].next = 0
+		scheduler._enqueue(taskId, scheduler.tasks[taskId])
+	start = time.time()
+	for _ in due:
+		taskId, _ = scheduler._nextTask()
+		scheduler.executeTask(taskId)
+	execute = (time.time() - start) / len(due)
+
+	start = time.time()
+	for taskId in ids[-wakeups:]:
+		scheduler.cancelTask(taskId)
+	scheduler._nextTask()
+	cancel = (time.time() - start) / wakeups
+	return schedule, wakeup, execute, cancel
+
+
+def main():
+	parser = argparse.ArgumentParser(description="TaskScheduler benchmark")
+	parser.add_argument("--tasks", default="1000,10000,100000", help="comma-separated task counts")
+	parser.add_argument("--wakeups", type=int, default=200, help="wakeups, executions and cancellations per run")
+	options = parser.parse_args()
+	print "%-10s %8s %14s %14s %14s %14s" % ("scheduler", "tasks", "schedule us", "wakeup us", "execute us", "cancel us")
+	for count in map(int, options.tasks.split(",")):
+		for name, cls in (("legacy", LegacyTaskScheduler), ("heap", tasks.TaskScheduler)):
+			schedule, wakeup, execute, cancel = run(cls, count, min(options.wakeups, count))
+			print "%-10s %8d %14.1f %14.1f %14.1f %14.1f" % (name, count, schedule * 1e6, wakeup * 1e6, execute * 1e6, cancel * 1e6)
+
+
+if __name__ == "__main__":
+	main()